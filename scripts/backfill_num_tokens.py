@@ -0,0 +1,68 @@
+import argparse
+import os
+
+import src.libs.logging as logging
+import src.libs.storage.weaviate_store as store
+
+from src.libs.config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+def init_config(local_env_file: str | None):
+    config.init(
+        metadata=[
+            config.ConfigVarMetadata(var_name="INFO_DATA_NAMESPACE"),
+            config.ConfigVarMetadata(var_name="INFO_DATA_MULTI_TENANT", is_json=True),
+            config.ConfigVarMetadata(var_name="WEAVIATE_URL"),
+            config.ConfigVarMetadata(var_name="WEAVIATE_API_KEY"),
+            config.ConfigVarMetadata(var_name="OPENAI_API_KEY"),
+            config.ConfigVarMetadata(var_name="COHERE_API_KEY"),
+        ],
+        local_env_file=local_env_file
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="Store the token count of TextContent objects ingested before token counts were stored at ingestion. "
+             "Must be run before deploying a search engine that reads numTokens against an existing index.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--env-file",
+        help="Local .env file containing config values",
+        default="/Users/jonahkatz/Dev/BU_Chatbot/src/services/chatbot/.env"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Number of objects fetched from Weaviate per cursor page",
+        default=500
+    )
+
+    script_args = parser.parse_args()
+
+    # Initialize config
+    env_file = script_args.env_file
+    if not env_file.startswith("/"):
+        current_directory = os.path.dirname(__file__)
+        env_file = os.path.join(current_directory, env_file)
+    init_config(local_env_file=env_file)
+
+    # Initialize weaviate store
+    weaviate_store = store.WeaviateStore(
+        instance_url=config.get("WEAVIATE_URL"),
+        api_key=config.get("WEAVIATE_API_KEY"),
+        openai_api_key=config.get("OPENAI_API_KEY"),
+        namespace=config.get("INFO_DATA_NAMESPACE"),
+        cohere_api_key=config.get("COHERE_API_KEY"),
+        multi_tenant=config.get("INFO_DATA_MULTI_TENANT", False)
+    )
+
+    weaviate_store.backfill_text_content_num_tokens(batch_size=script_args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import os
+
+import src.libs.logging as logging
+import src.libs.storage.weaviate_store as store
+
+from src.libs.config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+def init_config(local_env_file: str | None):
+    config.init(
+        metadata=[
+            config.ConfigVarMetadata(var_name="INFO_DATA_NAMESPACE"),
+            config.ConfigVarMetadata(var_name="INFO_DATA_MULTI_TENANT", is_json=True),
+            config.ConfigVarMetadata(var_name="WEAVIATE_URL"),
+            config.ConfigVarMetadata(var_name="WEAVIATE_API_KEY"),
+            config.ConfigVarMetadata(var_name="OPENAI_API_KEY"),
+            config.ConfigVarMetadata(var_name="COHERE_API_KEY"),
+        ],
+        local_env_file=local_env_file
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="Compute the ranking features (inbound links, last modified date and path depth) of every Webpage from "
+             "its stored HTML and copy them onto its TextContent objects. Must be run before deploying a search "
+             "engine that reads the features against an existing index, and re-run after ingesting new pages to "
+             "refresh the inbound link counts.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--env-file",
+        help="Local .env file containing config values",
+        default="/Users/jonahkatz/Dev/BU_Chatbot/src/services/chatbot/.env"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Number of objects fetched from Weaviate per cursor page",
+        default=100
+    )
+
+    script_args = parser.parse_args()
+
+    # Initialize config
+    env_file = script_args.env_file
+    if not env_file.startswith("/"):
+        current_directory = os.path.dirname(__file__)
+        env_file = os.path.join(current_directory, env_file)
+    init_config(local_env_file=env_file)
+
+    # Initialize weaviate store
+    weaviate_store = store.WeaviateStore(
+        instance_url=config.get("WEAVIATE_URL"),
+        api_key=config.get("WEAVIATE_API_KEY"),
+        openai_api_key=config.get("OPENAI_API_KEY"),
+        namespace=config.get("INFO_DATA_NAMESPACE"),
+        cohere_api_key=config.get("COHERE_API_KEY"),
+        multi_tenant=config.get("INFO_DATA_MULTI_TENANT", False)
+    )
+
+    weaviate_store.backfill_page_features(batch_size=script_args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
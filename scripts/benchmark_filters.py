@@ -0,0 +1,145 @@
+import argparse
+import os
+import statistics
+import time
+
+import src.libs.logging as logging
+import src.libs.storage.weaviate_store as store
+import src.libs.search.weaviate_search_engine as search_engine
+import src.libs.storage.storage_data_classes as storage_data_classes
+
+from src.libs.config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+def init_config(local_env_file: str | None):
+    config.init(
+        metadata=[
+            config.ConfigVarMetadata(var_name="INFO_DATA_NAMESPACE"),
+            config.ConfigVarMetadata(var_name="WEAVIATE_URL"),
+            config.ConfigVarMetadata(var_name="WEAVIATE_API_KEY"),
+            config.ConfigVarMetadata(var_name="OPENAI_API_KEY"),
+            config.ConfigVarMetadata(var_name="COHERE_API_KEY"),
+        ],
+        local_env_file=local_env_file
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="Compare filtering on the denormalized TextContent university vs the contentOf cross-reference",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "queries",
+        nargs="*",
+        default=["Where is Mugar library?", "How do I apply for financial aid?", "describe sm 132"]
+    )
+    parser.add_argument(
+        "--env-file",
+        help="Local .env file containing config values",
+        default="/Users/jonahkatz/Dev/BU_Chatbot/src/services/chatbot/.env"
+    )
+    parser.add_argument("--university", default="BU")
+    parser.add_argument(
+        "--mode",
+        choices=["semantic", "hybrid", "keyword"],
+        nargs="+",
+        help="Search modes to benchmark",
+        default=["semantic", "hybrid", "keyword"]
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        help="Number of most relevant results to return",
+        default=3
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        help="Number of times each query is run with each filter",
+        default=5
+    )
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="Copy the university, URL domain and mime type of each webpage onto its TextContent objects first"
+    )
+
+    script_args = parser.parse_args()
+
+    # Initialize config
+    env_file = script_args.env_file
+    if not env_file.startswith("/"):
+        current_directory = os.path.dirname(__file__)
+        env_file = os.path.join(current_directory, env_file)
+    init_config(local_env_file=env_file)
+
+    # Initialize weaviate store
+    namespace = config.get("INFO_DATA_NAMESPACE")
+    weaviate_store = store.WeaviateStore(
+        instance_url=config.get("WEAVIATE_URL"),
+        api_key=config.get("WEAVIATE_API_KEY"),
+        openai_api_key=config.get("OPENAI_API_KEY"),
+        namespace=namespace,
+        cohere_api_key=config.get("COHERE_API_KEY")
+    )
+    weaviate_engine = search_engine.WeaviateSearchEngine(weaviate_store=weaviate_store)
+    text_content_class_name = storage_data_classes.TextContent.weaviate_class_name(namespace=namespace)
+
+    if script_args.backfill:
+        weaviate_store.backfill_text_content_facets()
+
+    filters = {
+        "flat": {
+            "path": ["university"],
+            "operator": "Equal",
+            "valueText": script_args.university
+        },
+        "cross-reference": {
+            "path": ["contentOf", storage_data_classes.Webpage.weaviate_class_name(namespace=namespace), "university"],
+            "operator": "Equal",
+            "valueText": script_args.university
+        },
+    }
+
+    for mode in script_args.mode:
+        latencies = {filter_name: [] for filter_name in filters}
+        overlaps = []
+        for query in script_args.queries:
+            results = {}
+            for filter_name, where_filter in filters.items():
+                for _ in range(script_args.repeat):
+                    search_query = weaviate_engine._build_search_query(
+                        query_str=query,
+                        filters=None,
+                        mode=mode,
+                        top_k=script_args.top_k,
+                        alpha=0.75,
+                        beta=0.5,
+                        personalized_info_vector=None,
+                        re_rank=False
+                    ).with_where(where_filter)
+                    search_start_time = time.time()
+                    results[filter_name] = search_query.do()["data"]["Get"][text_content_class_name]
+                    latencies[filter_name].append((time.time() - search_start_time) * 1000)
+
+            flat_texts = {result["text"] for result in results["flat"]}
+            cross_reference_texts = {result["text"] for result in results["cross-reference"]}
+            overlaps.append(len(flat_texts & cross_reference_texts) / max(len(cross_reference_texts), 1))
+
+        for filter_name, filter_latencies in latencies.items():
+            filter_latencies = sorted(filter_latencies)
+            logger.info(
+                f"[{mode}] {filter_name} filter: "
+                f"p50={round(statistics.median(filter_latencies), 1)} ms, "
+                f"p95={round(filter_latencies[int(0.95 * (len(filter_latencies) - 1))], 1)} ms"
+            )
+        logger.info(f"[{mode}] flat filter results overlap with cross-reference filter results: "
+                    f"{round(statistics.mean(overlaps), 2)}")
+
+
+if __name__ == '__main__':
+    main()
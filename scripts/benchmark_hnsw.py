@@ -0,0 +1,399 @@
+import argparse
+import heapq
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+import tqdm
+
+import src.libs.logging as logging
+import src.libs.storage.storage_data_classes as storage_data_classes
+import src.libs.storage.weaviate_store as store
+
+from src.libs.config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+# Weaviate stores each HNSW neighbour id as a uint64
+BYTES_PER_EDGE = 8
+
+WEAVIATE_CLASSES = {
+    "TextContent": storage_data_classes.TextContent,
+    "Webpage": storage_data_classes.Webpage,
+}
+
+
+def init_config(local_env_file: str | None):
+    config.init(
+        metadata=[
+            config.ConfigVarMetadata(var_name="INFO_DATA_NAMESPACE"),
+            config.ConfigVarMetadata(var_name="INFO_DATA_MULTI_TENANT", is_json=True),
+            config.ConfigVarMetadata(var_name="WEAVIATE_URL"),
+            config.ConfigVarMetadata(var_name="WEAVIATE_API_KEY"),
+            config.ConfigVarMetadata(var_name="OPENAI_API_KEY"),
+            config.ConfigVarMetadata(var_name="COHERE_API_KEY"),
+        ],
+        local_env_file=local_env_file
+    )
+
+
+class HNSWIndex:
+    """Minimal HNSW graph over normalized vectors with cosine distance, following Weaviate's parameters:
+    maxConnections neighbours per node on the upper layers (twice as many on layer 0), efConstruction candidates
+    considered when inserting and ef candidates considered when searching. Neighbours are selected with the
+    heuristic from the HNSW paper, like Weaviate.
+
+    Only meant for offline benchmarks, it is far slower than Weaviate's implementation in absolute terms, so compare
+    configs by distance computations per query rather than by latency.
+    """
+
+    def __init__(self, vectors: np.ndarray, max_connections: int, ef_construction: int, seed: int = 0):
+        self._vectors = vectors
+        self._max_connections = max_connections
+        self._ef_construction = ef_construction
+        self._level_multiplier = 1 / np.log(max_connections)
+        self._rng = np.random.default_rng(seed)
+
+        self._layers: list[dict[int, list[int]]] = []
+        self._entry_point: int | None = None
+        self.num_distance_computations = 0
+
+    @property
+    def num_edges(self) -> int:
+        return sum(len(neighbours) for layer in self._layers for neighbours in layer.values())
+
+    def build(self):
+        for node in tqdm.tqdm(range(len(self._vectors)), desc="HNSW insert", leave=False):
+            self.insert(node)
+
+    def insert(self, node: int):
+        level = int(-np.log(self._rng.random()) * self._level_multiplier)
+        while len(self._layers) <= level:
+            self._layers.append({})
+        for layer in range(level + 1):
+            self._layers[layer][node] = []
+
+        if self._entry_point is None:
+            self._entry_point = node
+            return
+
+        query_vector = self._vectors[node]
+        entry_points = [(self._distance(query_vector, self._entry_point), self._entry_point)]
+        top_level = self._level(self._entry_point)
+        for layer in range(top_level, level, -1):
+            entry_points = self._search_layer(query_vector, entry_points, ef=1, layer=layer)
+
+        for layer in range(min(level, top_level), -1, -1):
+            candidates = self._search_layer(query_vector, entry_points, ef=self._ef_construction, layer=layer)
+            max_neighbours = self._max_neighbours(layer)
+            neighbours = self._select_neighbours(query_vector, candidates, max_neighbours)
+            self._layers[layer][node] = neighbours
+            for neighbour in neighbours:
+                neighbour_connections = self._layers[layer][neighbour]
+                neighbour_connections.append(node)
+                if len(neighbour_connections) > max_neighbours:
+                    neighbour_vector = self._vectors[neighbour]
+                    distances = 1 - self._vectors[neighbour_connections] @ neighbour_vector
+                    self._layers[layer][neighbour] = self._select_neighbours(
+                        neighbour_vector,
+                        sorted(zip(distances.tolist(), neighbour_connections)),
+                        max_neighbours
+                    )
+            entry_points = candidates
+
+        if level > top_level:
+            self._entry_point = node
+
+    def search(self, query_vector: np.ndarray, top_k: int, ef: int) -> np.ndarray:
+        entry_points = [(self._distance(query_vector, self._entry_point), self._entry_point)]
+        for layer in range(self._level(self._entry_point), 0, -1):
+            entry_points = self._search_layer(query_vector, entry_points, ef=1, layer=layer)
+        results = self._search_layer(query_vector, entry_points, ef=max(ef, top_k), layer=0)
+
+        return np.array([node for _, node in results[:top_k]], dtype=np.int64)
+
+    def _search_layer(
+        self,
+        query_vector: np.ndarray,
+        entry_points: list[tuple[float, int]],
+        ef: int,
+        layer: int
+    ) -> list[tuple[float, int]]:
+        """Greedy beam search of a layer, returns the ef closest (distance, node) pairs found, closest first"""
+        visited = {node for _, node in entry_points}
+        candidates = list(entry_points)
+        heapq.heapify(candidates)
+        # Max heap of the closest nodes found so far, by negated distance
+        results = [(-distance, node) for distance, node in entry_points]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        graph = self._layers[layer]
+        while candidates:
+            distance, node = heapq.heappop(candidates)
+            if distance > -results[0][0] and len(results) >= ef:
+                break
+
+            neighbours = [neighbour for neighbour in graph[node] if neighbour not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+            self.num_distance_computations += len(neighbours)
+            neighbour_distances = 1 - self._vectors[neighbours] @ query_vector
+
+            for neighbour_distance, neighbour in zip(neighbour_distances.tolist(), neighbours):
+                if len(results) < ef or neighbour_distance < -results[0][0]:
+                    heapq.heappush(candidates, (neighbour_distance, neighbour))
+                    heapq.heappush(results, (-neighbour_distance, neighbour))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted((-negated_distance, node) for negated_distance, node in results)
+
+    def _select_neighbours(
+        self,
+        query_vector: np.ndarray,
+        candidates: list[tuple[float, int]],
+        max_neighbours: int
+    ) -> list[int]:
+        """HNSW neighbour selection heuristic: keep a candidate only if it is closer to the query than to every
+        neighbour already kept, which spreads the connections out in different directions
+        """
+        selected = []
+        for distance, candidate in candidates:
+            if len(selected) >= max_neighbours:
+                break
+            if selected:
+                self.num_distance_computations += len(selected)
+                distances_to_selected = 1 - self._vectors[selected] @ self._vectors[candidate]
+                if np.any(distances_to_selected < distance):
+                    continue
+            selected.append(candidate)
+
+        return selected
+
+    def _distance(self, query_vector: np.ndarray, node: int) -> float:
+        self.num_distance_computations += 1
+        return float(1 - self._vectors[node] @ query_vector)
+
+    def _level(self, node: int) -> int:
+        return max(layer for layer in range(len(self._layers)) if node in self._layers[layer])
+
+    def _max_neighbours(self, layer: int) -> int:
+        return 2 * self._max_connections if layer == 0 else self._max_connections
+
+
+def export_vectors(
+    weaviate_store: store.WeaviateStore,
+    class_name: str,
+    sample_size: int,
+    batch_size: int = 500
+) -> np.ndarray:
+    """Export up to sample_size vectors of a class with a Weaviate cursor scan"""
+    weaviate_class_name = WEAVIATE_CLASSES[class_name].weaviate_class_name(namespace=weaviate_store.namespace)
+    tenants = weaviate_store.universities if weaviate_store.multi_tenant else [None]
+    vectors = []
+    for tenant in tenants:
+        cursor = None
+        while len(vectors) < sample_size:
+            query = (
+                weaviate_store.client.query
+                .get(weaviate_class_name)
+                .with_additional(properties=["id", "vector"])
+                .with_limit(batch_size)
+            )
+            if tenant:
+                query = query.with_tenant(tenant)
+            if cursor:
+                query = query.with_after(cursor)
+            raw_objects = query.do()["data"]["Get"][weaviate_class_name]
+            if not raw_objects:
+                break
+            vectors.extend(raw_object["_additional"]["vector"] for raw_object in raw_objects
+                           if raw_object["_additional"]["vector"])
+            cursor = raw_objects[-1]["_additional"]["id"]
+
+    return np.array(vectors[:sample_size], dtype=np.float32)
+
+
+def sweep(
+    vectors: np.ndarray,
+    max_connections_values: list[int],
+    ef_construction_values: list[int],
+    ef_values: list[int],
+    num_queries: int,
+    top_k: int
+) -> list[dict]:
+    """Build an HNSW index for each (maxConnections, efConstruction) and search it with each ef
+
+    Returns:
+        One result per (maxConnections, efConstruction, ef) with its recall@k, distance computations and latency
+        per query, build time and memory
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1, norms)
+
+    # Hold out queries from the indexed vectors, so a query never finds itself
+    permutation = np.random.default_rng(0).permutation(len(vectors))
+    query_vectors = vectors[permutation[:num_queries]]
+    corpus_vectors = np.ascontiguousarray(vectors[permutation[num_queries:]])
+    true_neighbours = [np.argsort(-(corpus_vectors @ query_vector))[:top_k] for query_vector in query_vectors]
+
+    vectors_mb = corpus_vectors.nbytes / 2 ** 20
+    results = []
+    for max_connections, ef_construction in itertools.product(max_connections_values, ef_construction_values):
+        index = HNSWIndex(vectors=corpus_vectors, max_connections=max_connections, ef_construction=ef_construction)
+        build_start_time = time.time()
+        index.build()
+        build_seconds = time.time() - build_start_time
+        graph_mb = index.num_edges * BYTES_PER_EDGE / 2 ** 20
+
+        for ef in ef_values:
+            index.num_distance_computations = 0
+            recalls = []
+            search_start_time = time.time()
+            for query_vector, true_ids in zip(query_vectors, true_neighbours):
+                found_ids = index.search(query_vector, top_k=top_k, ef=ef)
+                recalls.append(len(np.intersect1d(found_ids, true_ids)) / top_k)
+            search_ms = (time.time() - search_start_time) * 1000 / num_queries
+
+            result = {
+                "maxConnections": max_connections,
+                "efConstruction": ef_construction,
+                "ef": ef,
+                "recall": float(np.mean(recalls)),
+                "distance_computations": index.num_distance_computations / num_queries,
+                "latency_ms": search_ms,
+                "build_seconds": build_seconds,
+                "memory_mb": vectors_mb + graph_mb,
+            }
+            results.append(result)
+            logger.info(
+                f"maxConnections={max_connections} efConstruction={ef_construction} ef={ef}: "
+                f"recall@{top_k}={round(result['recall'], 3)}, "
+                f"{round(result['distance_computations'])} distance computations/query "
+                f"(brute force {len(corpus_vectors)}), {round(search_ms, 2)} ms/query, "
+                f"built in {round(build_seconds, 1)} s, {round(result['memory_mb'], 1)} MB"
+            )
+
+    return results
+
+
+def recommend(results: list[dict], target_recall: float) -> dict:
+    """Pick the cheapest config that reaches the target recall: fewest distance computations per query, then
+    least memory. Falls back to the config with the highest recall if none reach the target.
+    """
+    eligible_results = [result for result in results if result["recall"] >= target_recall]
+    if not eligible_results:
+        best_result = max(results, key=lambda result: result["recall"])
+    else:
+        best_result = min(eligible_results, key=lambda result: (result["distance_computations"], result["memory_mb"]))
+
+    return {
+        "vectorIndexConfig": {
+            "efConstruction": best_result["efConstruction"],
+            "maxConnections": best_result["maxConnections"],
+            "ef": best_result["ef"],
+        },
+        "recall": round(best_result["recall"], 3),
+        "distance_computations": round(best_result["distance_computations"]),
+        "memory_mb": round(best_result["memory_mb"], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="Sweep HNSW parameters offline and recommend a vectorIndexConfig for each class",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--env-file",
+        help="Local .env file containing config values",
+        default="/Users/jonahkatz/Dev/BU_Chatbot/src/services/chatbot/.env"
+    )
+    parser.add_argument(
+        "--sample-dir",
+        help="Directory the exported vector samples are stored in, one <class>.npy file per class",
+        default="hnsw_benchmark"
+    )
+    parser.add_argument(
+        "--classes",
+        choices=list(WEAVIATE_CLASSES),
+        nargs="+",
+        default=list(WEAVIATE_CLASSES)
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+
+    export_parser = subparsers.add_parser("export", help="Export a sample of each class's vectors from Weaviate")
+    export_parser.add_argument("--sample-size", type=int, default=10_000)
+
+    sweep_parser = subparsers.add_parser("sweep", help="Build HNSW indexes over a parameter grid and measure recall")
+    sweep_parser.add_argument("--max-connections", type=int, nargs="+", default=[16, 32, 64])
+    sweep_parser.add_argument("--ef-construction", type=int, nargs="+", default=[32, 64, 128])
+    sweep_parser.add_argument("--ef", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    sweep_parser.add_argument(
+        "--num-queries",
+        type=int,
+        help="Number of sampled vectors held out of the index and used as queries",
+        default=200
+    )
+    sweep_parser.add_argument("--top-k", type=int, help="Number of nearest neighbours recall is measured on", default=10)
+    sweep_parser.add_argument("--target-recall", type=float, default=0.95)
+
+    script_args = parser.parse_args()
+
+    # Initialize config
+    env_file = script_args.env_file
+    if not env_file.startswith("/"):
+        current_directory = os.path.dirname(__file__)
+        env_file = os.path.join(current_directory, env_file)
+    init_config(local_env_file=env_file)
+
+    if script_args.command == "export":
+        weaviate_store = store.WeaviateStore(
+            instance_url=config.get("WEAVIATE_URL"),
+            api_key=config.get("WEAVIATE_API_KEY"),
+            openai_api_key=config.get("OPENAI_API_KEY"),
+            namespace=config.get("INFO_DATA_NAMESPACE"),
+            cohere_api_key=config.get("COHERE_API_KEY"),
+            multi_tenant=config.get("INFO_DATA_MULTI_TENANT", False)
+        )
+        os.makedirs(script_args.sample_dir, exist_ok=True)
+        for class_name in script_args.classes:
+            vectors = export_vectors(weaviate_store, class_name=class_name, sample_size=script_args.sample_size)
+            np.save(os.path.join(script_args.sample_dir, f"{class_name}.npy"), vectors)
+            logger.info(f"Exported {len(vectors)} {class_name} vectors")
+
+    elif script_args.command == "sweep":
+        recommendations = {}
+        for class_name in script_args.classes:
+            vectors = np.load(os.path.join(script_args.sample_dir, f"{class_name}.npy"))
+            logger.info(
+                f"Sweeping HNSW parameters for {class_name} ({vectors.shape[0]} vectors of {vectors.shape[1]} dims)"
+            )
+            results = sweep(
+                vectors=vectors,
+                max_connections_values=script_args.max_connections,
+                ef_construction_values=script_args.ef_construction,
+                ef_values=script_args.ef,
+                num_queries=script_args.num_queries,
+                top_k=script_args.top_k
+            )
+            with open(os.path.join(script_args.sample_dir, f"{class_name}_sweep.json"), "w") as f:
+                json.dump(results, f, indent=2)
+            recommendations[class_name] = recommend(results, target_recall=script_args.target_recall)
+
+        with open(os.path.join(script_args.sample_dir, "recommendations.json"), "w") as f:
+            json.dump(recommendations, f, indent=2)
+        logger.info(f"Recommended configs (target recall@{script_args.top_k}={script_args.target_recall}):\n"
+                    f"{json.dumps(recommendations, indent=2)}")
+
+
+if __name__ == '__main__':
+    main()
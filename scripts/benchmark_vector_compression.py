@@ -0,0 +1,228 @@
+import argparse
+import datetime
+import os
+import time
+
+import numpy as np
+
+import src.libs.logging as logging
+import src.libs.search.local_replica as local_replica
+
+from src.libs.config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+# Number of set bits in each byte value, used to compute hamming distances between packed binary codes
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def init_config(local_env_file: str | None):
+    config.init(
+        metadata=[
+            config.ConfigVarMetadata(var_name="INFO_DATA_NAMESPACE"),
+            config.ConfigVarMetadata(var_name="LOCAL_REPLICA_DIR"),
+        ],
+        local_env_file=local_env_file
+    )
+
+
+class ProductQuantizer:
+    """Product quantization: each vector is split into segments and each segment is replaced by the id of its
+    nearest centroid, so a vector is stored as one byte per segment.
+    """
+
+    def __init__(self, num_segments: int, num_centroids: int = 256):
+        self.num_segments = num_segments
+        self.num_centroids = num_centroids
+        self.codebooks: np.ndarray | None = None
+
+    def fit(self, vectors: np.ndarray, num_iterations: int = 10, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        segments = np.split(vectors, self.num_segments, axis=1)
+        codebooks = []
+        for segment in segments:
+            centroids = segment[rng.choice(len(segment), size=self.num_centroids, replace=False)]
+            for _ in range(num_iterations):
+                assignments = self._nearest_centroids(segment, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignments, segment)
+                counts = np.bincount(assignments, minlength=self.num_centroids)[:, np.newaxis]
+                # Keep the previous position of empty clusters
+                centroids = np.where(counts > 0, sums / np.maximum(counts, 1), centroids)
+            codebooks.append(centroids)
+        self.codebooks = np.stack(codebooks)
+
+    def encode(self, vectors: np.ndarray, chunk_size: int = 8192) -> np.ndarray:
+        codes = np.empty((len(vectors), self.num_segments), dtype=np.uint8)
+        for start in range(0, len(vectors), chunk_size):
+            chunk_segments = np.split(np.asarray(vectors[start:start + chunk_size]), self.num_segments, axis=1)
+            for segment_id, segment in enumerate(chunk_segments):
+                codes[start:start + chunk_size, segment_id] = self._nearest_centroids(segment, self.codebooks[segment_id])
+        return codes
+
+    def scores(self, query_vector: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Approximate dot products between a full precision query and the encoded vectors (asymmetric distance)"""
+        # Dot product of each query segment with each centroid of the segment, shape (num_segments, num_centroids)
+        lookup_table = np.einsum("sd,scd->sc", query_vector.reshape(self.num_segments, -1), self.codebooks)
+        return lookup_table[np.arange(self.num_segments), codes].sum(axis=1)
+
+    def codebook_bytes(self) -> int:
+        return self.codebooks.astype(np.float32).nbytes
+
+    @staticmethod
+    def _nearest_centroids(segment: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        distances = (centroids ** 2).sum(axis=1)[np.newaxis, :] - 2 * segment @ centroids.T
+        return np.argmin(distances, axis=1)
+
+
+class BinaryQuantizer:
+    """Binary quantization: each dimension is replaced by its sign bit, and vectors are compared with hamming
+    distance like Weaviate's BQ
+    """
+
+    @staticmethod
+    def encode(vectors: np.ndarray) -> np.ndarray:
+        return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+    def scores(self, query_vector: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        query_code = self.encode(query_vector[np.newaxis, :])
+        return -POPCOUNT[np.bitwise_xor(codes, query_code)].sum(axis=1, dtype=np.int32).astype(np.float32)
+
+
+def recall(found_ids: np.ndarray, true_ids: np.ndarray) -> float:
+    return len(np.intersect1d(found_ids, true_ids)) / len(true_ids)
+
+
+def top_ids(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(scores))
+    top_idx = np.argpartition(-scores, k - 1)[:k]
+    return top_idx[np.argsort(-scores[top_idx])]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="Offline recall vs memory benchmark of PQ and BQ compression of the TextContent vectors",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--env-file",
+        help="Local .env file containing config values",
+        default="/Users/jonahkatz/Dev/BU_Chatbot/src/services/chatbot/.env"
+    )
+    parser.add_argument(
+        "--replica-dir",
+        help="Directory of a synced local replica to read vectors from. Defaults to the LOCAL_REPLICA_DIR config value."
+    )
+    parser.add_argument("--university", default="BU")
+    parser.add_argument(
+        "--num-queries",
+        type=int,
+        help="Number of vectors held out of the corpus and used as queries",
+        default=200
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        help="Number of nearest neighbours recall is measured on",
+        default=10
+    )
+    parser.add_argument(
+        "--pq-segments",
+        type=int,
+        nargs="+",
+        help="PQ segment counts to benchmark, each must divide the vector dimension",
+        default=[96, 192, 256, 384]
+    )
+    parser.add_argument(
+        "--rescore-limits",
+        type=int,
+        nargs="+",
+        help="Numbers of compressed candidates rescored with full precision vectors",
+        default=[20, 50, 100, 200]
+    )
+    parser.add_argument(
+        "--training-size",
+        type=int,
+        help="Number of vectors PQ codebooks are trained on",
+        default=20_000
+    )
+
+    script_args = parser.parse_args()
+
+    # Initialize config
+    env_file = script_args.env_file
+    if not env_file.startswith("/"):
+        current_directory = os.path.dirname(__file__)
+        env_file = os.path.join(current_directory, env_file)
+    init_config(local_env_file=env_file)
+
+    replica = local_replica.LocalReplica(
+        directory=script_args.replica_dir or config.get("LOCAL_REPLICA_DIR"),
+        namespace=config.get("INFO_DATA_NAMESPACE"),
+        max_staleness=datetime.timedelta.max
+    )
+    vectors = np.asarray(replica.vectors(script_args.university))
+    num_vectors, dim = vectors.shape
+    logger.info(f"Loaded {num_vectors} vectors of {dim} dimensions for {script_args.university}")
+
+    # Hold out queries from the corpus, so a query never finds itself
+    rng = np.random.default_rng(0)
+    permutation = rng.permutation(num_vectors)
+    query_vectors = vectors[permutation[:script_args.num_queries]]
+    corpus_vectors = vectors[permutation[script_args.num_queries:]]
+    top_k = script_args.top_k
+
+    true_neighbours = [top_ids(corpus_vectors @ query_vector, top_k) for query_vector in query_vectors]
+
+    quantizers = {"bq": (BinaryQuantizer(), dim // 8, 0)}
+    training_sample_ids = rng.choice(
+        len(corpus_vectors),
+        size=min(script_args.training_size, len(corpus_vectors)),
+        replace=False
+    )
+    training_sample = corpus_vectors[training_sample_ids]
+    for num_segments in script_args.pq_segments:
+        if dim % num_segments:
+            logger.warning(f"Skipping PQ with {num_segments} segments, it does not divide {dim} dimensions")
+            continue
+        training_start_time = time.time()
+        product_quantizer = ProductQuantizer(num_segments=num_segments)
+        product_quantizer.fit(training_sample)
+        logger.info(f"Trained PQ codebooks with {num_segments} segments in {round(time.time() - training_start_time, 1)} seconds")
+        quantizers[f"pq-{num_segments}"] = (product_quantizer, num_segments, product_quantizer.codebook_bytes())
+
+    full_precision_bytes = dim * 4
+    logger.info(
+        f"float32: {full_precision_bytes} bytes/vector, "
+        f"{round(full_precision_bytes * len(corpus_vectors) / 2 ** 20, 1)} MB, recall@{top_k}=1.0"
+    )
+    for name, (quantizer, bytes_per_vector, overhead_bytes) in quantizers.items():
+        codes = quantizer.encode(corpus_vectors)
+
+        recalls = {rescore_limit: [] for rescore_limit in [top_k, *script_args.rescore_limits]}
+        search_latencies = []
+        for query_vector, true_ids in zip(query_vectors, true_neighbours):
+            search_start_time = time.time()
+            compressed_scores = quantizer.scores(query_vector, codes)
+            search_latencies.append((time.time() - search_start_time) * 1000)
+            candidate_ids = top_ids(compressed_scores, max(recalls))
+            for rescore_limit in recalls:
+                rescore_candidate_ids = candidate_ids[:rescore_limit]
+                exact_scores = corpus_vectors[rescore_candidate_ids] @ query_vector
+                recalls[rescore_limit].append(recall(rescore_candidate_ids[top_ids(exact_scores, top_k)], true_ids))
+
+        memory_mb = (bytes_per_vector * len(corpus_vectors) + overhead_bytes) / 2 ** 20
+        logger.info(
+            f"{name}: {bytes_per_vector} bytes/vector ({round(full_precision_bytes / bytes_per_vector, 1)}x smaller), "
+            f"{round(memory_mb, 1)} MB, brute force scan {round(float(np.median(search_latencies)), 1)} ms/query, "
+            + ", ".join(
+                f"recall@{top_k} rescoring {rescore_limit}={round(float(np.mean(rescore_recalls)), 3)}"
+                for rescore_limit, rescore_recalls in recalls.items()
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
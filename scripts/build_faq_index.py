@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import collections
+import datetime
+import os
+
+import langchain.chat_models
+import numpy as np
+
+import src.libs.logging as logging
+import src.libs.search.weaviate_search_engine as search_engine
+import src.libs.storage.embedding_projection as embedding_projection
+import src.libs.storage.storage_data_classes as storage_data_classes
+import src.libs.storage.user_management as user_management
+import src.libs.storage.weaviate_store as store
+from src.libs.search.search_agent.search_agent import SearchAgent, SearchAgentFeatures
+from src.services.chatbot.backend_control.backend import get_university, normalize_question
+
+from src.libs.config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+def init_config(local_env_file: str | None):
+    config.init(
+        metadata=[
+            config.ConfigVarMetadata(var_name="INFO_DATA_NAMESPACE"),
+            config.ConfigVarMetadata(var_name="INFO_DATA_MULTI_TENANT", is_json=True),
+            config.ConfigVarMetadata(var_name="EMBEDDING_PROJECTION_PATH"),
+            config.ConfigVarMetadata(var_name="USER_DATA_NAMESPACE"),
+            config.ConfigVarMetadata(var_name="WEAVIATE_URL"),
+            config.ConfigVarMetadata(var_name="WEAVIATE_API_KEY"),
+            config.ConfigVarMetadata(var_name="OPENAI_API_KEY"),
+            config.ConfigVarMetadata(var_name="COHERE_API_KEY"),
+        ],
+        local_env_file=local_env_file
+    )
+
+
+def cluster_questions(
+        questions: list[str],
+        askers: list[set[str]],
+        vectors: np.ndarray,
+        min_similarity: float
+) -> list[tuple[str, set[str]]]:
+    """Group rephrasings of the same question together.
+
+    Questions are visited from most to least asked, each one joins the first cluster whose leader it is similar
+    enough to, or starts a new cluster. The canonical question of a cluster is the member nearest to its centroid.
+
+    Args:
+        questions: Distinct questions
+        askers: Users who asked each question
+        vectors: Unit length embeddings of the questions
+        min_similarity: Cosine similarity a question must have with a cluster leader to join the cluster
+
+    Returns:
+        List of (canonical question, users who asked any question of the cluster) pairs, asked by the most users
+        first
+    """
+    counts = [len(question_askers) for question_askers in askers]
+    leader_ids = []
+    clusters = []
+    for question_id in np.argsort(-np.asarray(counts), kind="stable"):
+        if leader_ids:
+            similarities = vectors[leader_ids] @ vectors[question_id]
+            nearest_cluster_id = int(np.argmax(similarities))
+            if similarities[nearest_cluster_id] >= min_similarity:
+                clusters[nearest_cluster_id].append(question_id)
+                continue
+        leader_ids.append(question_id)
+        clusters.append([question_id])
+
+    canonical_questions = []
+    for cluster in clusters:
+        centroid = (vectors[cluster] * np.asarray(counts)[cluster, np.newaxis]).sum(axis=0)
+        canonical_question_id = cluster[int(np.argmax(vectors[cluster] @ centroid))]
+        canonical_questions.append((questions[canonical_question_id], set().union(*(askers[i] for i in cluster))))
+
+    return sorted(canonical_questions, key=lambda canonical_question: -len(canonical_question[1]))
+
+
+async def answer_questions(
+        search_agent: SearchAgent,
+        university: str,
+        canonical_questions: list[tuple[str, int]],
+        max_concurrency: int
+) -> list[storage_data_classes.FaqEntry]:
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def answer_question(question: str, hit_count: int) -> storage_data_classes.FaqEntry | None:
+        async with semaphore:
+            try:
+                # Answers are generated without profile information, so they are valid for every user
+                agent_result = await search_agent.run(
+                    query=question,
+                    university=university,
+                    current_profile_info={},
+                    profile_info_vector=None
+                )
+            except Exception as e:
+                logger.error(f"Error answering \"{question}\": {e}", exc_info=e)
+                return None
+
+        if not agent_result.sources:
+            logger.warning(f"Skipping \"{question}\", its answer has no sources")
+            return None
+
+        return storage_data_classes.FaqEntry(
+            question=question,
+            answer=agent_result.answer,
+            university=university,
+            sources=[
+                {"url": source.url, "text": source.text, "score": source.score}
+                for source in agent_result.sources
+            ],
+            hit_count=hit_count,
+            created_time=datetime.datetime.now(datetime.timezone.utc).isoformat()
+        )
+
+    faq_entries = await asyncio.gather(*[
+        answer_question(question, hit_count) for question, hit_count in canonical_questions
+    ])
+    return [faq_entry for faq_entry in faq_entries if faq_entry]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="Build the FAQ index of pre-generated answers to the questions most commonly asked in the chat logs",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--env-file",
+        help="Local .env file containing config values",
+        default="/Users/jonahkatz/Dev/BU_Chatbot/src/services/chatbot/.env"
+    )
+    parser.add_argument("--university", nargs="+", default=["BU", "CAL"])
+    parser.add_argument(
+        "--max-questions",
+        type=int,
+        help="Maximum number of questions answered per university",
+        default=200
+    )
+    parser.add_argument(
+        "--min-hit-count",
+        type=int,
+        help="Minimum number of distinct users who must have asked a question (or a rephrasing of it) for it to be "
+             "answered",
+        default=3
+    )
+    parser.add_argument(
+        "--min-similarity",
+        type=float,
+        help="Cosine similarity above which two logged questions are considered rephrasings of each other",
+        default=0.92
+    )
+    parser.add_argument("--reasoning-llm", help="Reasoning LLM model name", default="gpt-3.5-turbo-0613")
+    parser.add_argument("--search-agent-features", type=SearchAgentFeatures, nargs="+",
+                        default=[SearchAgentFeatures.CROSS_ENCODER_RE_RANKING,
+                                 SearchAgentFeatures.QUERY_PLANNING],
+                        help="List of Search Agent features used to generate the answers, space-separated")
+    parser.add_argument("--max-concurrency", type=int, help="Number of questions answered at once", default=4)
+    parser.add_argument(
+        "--delete-if-exists",
+        action="store_true",
+        help="Re-create the FAQ index, dropping every existing entry"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only log the canonical questions that would be answered"
+    )
+
+    script_args = parser.parse_args()
+
+    # Initialize config
+    env_file = script_args.env_file
+    if not env_file.startswith("/"):
+        current_directory = os.path.dirname(__file__)
+        env_file = os.path.join(current_directory, env_file)
+    init_config(local_env_file=env_file)
+
+    # Initialize weaviate store
+    weaviate_store = store.WeaviateStore(
+        instance_url=config.get("WEAVIATE_URL"),
+        api_key=config.get("WEAVIATE_API_KEY"),
+        openai_api_key=config.get("OPENAI_API_KEY"),
+        namespace=config.get("INFO_DATA_NAMESPACE"),
+        cohere_api_key=config.get("COHERE_API_KEY"),
+        multi_tenant=config.get("INFO_DATA_MULTI_TENANT", False),
+        embedding_projection=(
+            embedding_projection.EmbeddingProjection.load(config.get("EMBEDDING_PROJECTION_PATH"))
+            if config.get("EMBEDDING_PROJECTION_PATH") else None
+        )
+    )
+    user_database_manager = user_management.UserDatabaseManager(
+        instance_url=config.get("WEAVIATE_URL"),
+        api_key=config.get("WEAVIATE_API_KEY"),
+        openai_api_key=config.get("OPENAI_API_KEY"),
+        namespace=config.get("USER_DATA_NAMESPACE"),
+        cohere_api_key=config.get("COHERE_API_KEY")
+    )
+
+    # The FAQ_LOOKUP feature is never enabled here, so answers are always generated from search results
+    search_agent = SearchAgent(
+        weaviate_search_engine=search_engine.WeaviateSearchEngine(weaviate_store=weaviate_store),
+        reasoning_llm=langchain.chat_models.ChatOpenAI(
+            model_name=script_args.reasoning_llm,
+            temperature=0.0,
+            openai_api_key=config.get("OPENAI_API_KEY")
+        ),
+        features=[
+            feature for feature in script_args.search_agent_features if feature != SearchAgentFeatures.FAQ_LOOKUP
+        ]
+    )
+
+    # Collect the users who asked each question about each university, normalized like the questions of concurrent
+    # requests sharing a search agent run. A user repeating a question counts once.
+    question_askers = {university: collections.defaultdict(set) for university in script_args.university}
+    question_texts = {}
+    for query_str, gmail in user_database_manager.get_user_queries():
+        university = get_university(gmail)
+        if university not in question_askers:
+            continue
+        normalized_question = normalize_question(query_str)
+        question_askers[university][normalized_question].add(gmail)
+        question_texts.setdefault(normalized_question, query_str.strip())
+
+    if not script_args.dry_run:
+        weaviate_store.create_faq_schema(delete_if_exists=script_args.delete_if_exists)
+
+    for university, askers in question_askers.items():
+        if not askers:
+            logger.info(f"No logged questions for {university}")
+            continue
+
+        questions = list(askers)
+        vectors = np.asarray(weaviate_store.create_embeddings([question_texts[q] for q in questions]), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        clusters = [
+            (question_texts[question], cluster_askers)
+            for question, cluster_askers in cluster_questions(
+                questions=questions,
+                askers=[askers[question] for question in questions],
+                vectors=vectors,
+                min_similarity=script_args.min_similarity
+            )
+            if len(cluster_askers) >= script_args.min_hit_count
+        ][:script_args.max_questions]
+        canonical_questions = [(question, len(cluster_askers)) for question, cluster_askers in clusters]
+        total_askers = len(set().union(*askers.values()))
+        covered_askers = len(set().union(*(cluster_askers for _, cluster_askers in clusters)))
+        logger.info(
+            f"{university}: {len(canonical_questions)} canonical questions were asked by {covered_askers} of the "
+            f"{total_askers} users who asked questions"
+        )
+        for question, hit_count in canonical_questions:
+            logger.info(f"\t{hit_count}: {question}")
+
+        if script_args.dry_run:
+            continue
+
+        faq_entries = asyncio.run(answer_questions(
+            search_agent=search_agent,
+            university=university,
+            canonical_questions=canonical_questions,
+            max_concurrency=script_args.max_concurrency
+        ))
+        weaviate_store.insert_faq_entries(faq_entries)
+
+        source_counts = collections.Counter(
+            source["url"] for faq_entry in faq_entries for source in faq_entry.sources
+        )
+        logger.info(f"{university}: inserted {len(faq_entries)} FAQ entries, most cited pages:")
+        for url, count in source_counts.most_common(10):
+            logger.info(f"\t{count}: {url}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import argparse
+import datetime
+import os
+import time
+
+import numpy as np
+
+import src.libs.logging as logging
+import src.libs.search.local_replica as local_replica
+import src.libs.storage.embedding_projection as embedding_projection
+
+from src.libs.config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+def init_config(local_env_file: str | None):
+    config.init(
+        metadata=[
+            config.ConfigVarMetadata(var_name="INFO_DATA_NAMESPACE"),
+            config.ConfigVarMetadata(var_name="LOCAL_REPLICA_DIR"),
+        ],
+        local_env_file=local_env_file
+    )
+
+
+def top_ids(similarities: np.ndarray, k: int) -> np.ndarray:
+    top_idx = np.argpartition(-similarities, k - 1)[:k]
+    return top_idx[np.argsort(-similarities[top_idx])]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="Fit and evaluate the projection of embeddings onto fewer dimensions",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--env-file",
+        help="Local .env file containing config values",
+        default="/Users/jonahkatz/Dev/BU_Chatbot/src/services/chatbot/.env"
+    )
+    parser.add_argument(
+        "--replica-dir",
+        help="Directory of a local replica synced with full dimension embeddings, the corpus sample is read from it. "
+             "Defaults to the LOCAL_REPLICA_DIR config value."
+    )
+    parser.add_argument(
+        "--university",
+        nargs="+",
+        help="Universities whose embeddings are sampled. Defaults to every university in the replica."
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+
+    fit_parser = subparsers.add_parser("fit", help="Fit a projection and save it, to be used as EMBEDDING_PROJECTION_PATH")
+    fit_parser.add_argument("output", help="Path of the .npz file the projection is saved to")
+    fit_parser.add_argument("--dim", type=int, help="Number of dimensions to project onto", default=384)
+    fit_parser.add_argument("--method", choices=["pca", "random"], default="pca")
+
+    evaluate_parser = subparsers.add_parser(
+        "evaluate",
+        help="Measure the nearest neighbour recall lost by projecting onto each number of dimensions"
+    )
+    evaluate_parser.add_argument("--dims", type=int, nargs="+", default=[256, 384, 512])
+    evaluate_parser.add_argument("--methods", choices=["pca", "random"], nargs="+", default=["pca", "random"])
+    evaluate_parser.add_argument(
+        "--num-queries",
+        type=int,
+        help="Number of embeddings held out of the corpus and used as queries",
+        default=200
+    )
+    evaluate_parser.add_argument(
+        "--top-k",
+        type=int,
+        help="Number of nearest neighbours recall is measured on",
+        default=10
+    )
+
+    script_args = parser.parse_args()
+
+    # Initialize config
+    env_file = script_args.env_file
+    if not env_file.startswith("/"):
+        current_directory = os.path.dirname(__file__)
+        env_file = os.path.join(current_directory, env_file)
+    init_config(local_env_file=env_file)
+
+    replica = local_replica.LocalReplica(
+        directory=script_args.replica_dir or config.get("LOCAL_REPLICA_DIR"),
+        namespace=config.get("INFO_DATA_NAMESPACE"),
+        max_staleness=datetime.timedelta.max
+    )
+    universities = script_args.university or replica.universities
+    vectors = np.concatenate([np.asarray(replica.vectors(university)) for university in universities])
+    logger.info(f"Loaded {vectors.shape[0]} embeddings of {vectors.shape[1]} dimensions for {universities}")
+
+    if script_args.command == "fit":
+        projection = embedding_projection.EmbeddingProjection.fit(
+            vectors=vectors,
+            output_dim=script_args.dim,
+            method=script_args.method
+        )
+        projection.save(script_args.output)
+        logger.info(f"Saved {script_args.method} projection onto {script_args.dim} dimensions to {script_args.output}")
+
+    elif script_args.command == "evaluate":
+        # Hold out queries from the corpus, so the projection is evaluated on embeddings it wasn't fitted on
+        permutation = np.random.default_rng(0).permutation(len(vectors))
+        query_vectors = vectors[permutation[:script_args.num_queries]]
+        corpus_vectors = vectors[permutation[script_args.num_queries:]]
+        top_k = script_args.top_k
+
+        true_neighbours = [top_ids(corpus_vectors @ query_vector, top_k) for query_vector in query_vectors]
+        full_search_start_time = time.time()
+        corpus_vectors @ query_vectors.T
+        full_search_ms = (time.time() - full_search_start_time) * 1000 / len(query_vectors)
+        logger.info(
+            f"{vectors.shape[1]} dims: {round(corpus_vectors.nbytes / 2 ** 20, 1)} MB, "
+            f"brute force search {round(full_search_ms, 2)} ms/query"
+        )
+
+        for method in script_args.methods:
+            for dim in script_args.dims:
+                projection = embedding_projection.EmbeddingProjection.fit(
+                    vectors=corpus_vectors,
+                    output_dim=dim,
+                    method=method
+                )
+                projected_corpus_vectors = projection.project(corpus_vectors)
+                projected_query_vectors = projection.project(query_vectors)
+
+                search_start_time = time.time()
+                projected_corpus_vectors @ projected_query_vectors.T
+                search_ms = (time.time() - search_start_time) * 1000 / len(query_vectors)
+
+                recalls = [
+                    len(np.intersect1d(top_ids(projected_corpus_vectors @ query_vector, top_k), true_ids)) / top_k
+                    for query_vector, true_ids in zip(projected_query_vectors, true_neighbours)
+                ]
+                logger.info(
+                    f"{method} {dim} dims: {round(projected_corpus_vectors.nbytes / 2 ** 20, 1)} MB, "
+                    f"brute force search {round(search_ms, 2)} ms/query, "
+                    f"recall@{top_k}={round(float(np.mean(recalls)), 3)}"
+                )
+
+
+if __name__ == '__main__':
+    main()
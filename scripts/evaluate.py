@@ -13,10 +13,16 @@ import langchain.chat_models
 
 import src.libs.eval.utils as utils
 import src.libs.eval.schema.evaluation_test_schema as evaluation_test_schema
-from src.libs.search.search_agent.search_agent import SearchAgent, SearchAgentFeatures
+from src.libs.search.search_agent.search_agent import SearchAgent, SearchAgentFeatures, Degradation
+from src.libs.search.search_agent.query_router import QueryRouter, LogisticModel, DEFAULT_PLANNING_THRESHOLD
+from src.libs.search.search_agent.search_parameter_gen import ReRankingWeights, RE_RANKING_WEIGHT_NAMES
 import src.libs.eval.evaluation_agent as evaluation_agent
+import src.libs.search.search_agent.llm_cache as llm_cache
+import src.libs.search.search_agent.llm_governor as llm_governor
+import src.libs.search.search_agent.llm_hedging as llm_hedging
 import src.libs.config as config
 import src.libs.logging as logging
+import src.libs.tracing as tracing
 import src.libs.search as search
 import src.libs.storage as storage
 
@@ -42,24 +48,26 @@ def init_config(local_env_file: str | None):
     )
 
 
-async def search_agent_job(agent: SearchAgent, query: str) -> dict:
+async def search_agent_job(agent: SearchAgent, query: str, university: str) -> dict:
     logger.info(f"Running job: {query}")
     search_job_start_time = time.time()
-    result = await agent.run(query=query)
+    with tracing.start_trace("evaluation_test", query=query) as trace_span:
+        result = await agent.run(query=query, university=university, current_profile_info={}, profile_info_vector=None)
 
     result_dict = asdict(result)
     result_dict['search_job_duration'] = round((time.time() - search_job_start_time), 2)
+    result_dict['trace_id'] = trace_span.trace_id
     logger.info(f"Running job: {query} finished")
     return result_dict
 
 
-async def run_search_agent_jobs(agent: SearchAgent, test_specs: list[dict]):
+async def run_search_agent_jobs(agent: SearchAgent, test_specs: list[dict], university: str):
     # Run all tests
     tasks = []
     for spec in test_specs:
         query = spec['definition']['request']
         if spec['definition']['enable']:
-            task = asyncio.create_task(search_agent_job(agent, query))
+            task = asyncio.create_task(search_agent_job(agent, query, university))
             tasks.append(task)
         else:
             logger.info(f"Skipping disabled query {query}")
@@ -122,6 +130,17 @@ def check_test_file(test_specs: list[dict]):
     evaluation_test_schema.EvaluationTestList.parse_obj(test_specs)
 
 
+def parse_re_ranking_weight(weight_str: str) -> tuple[str, float]:
+    """Parse a name=value re-ranking weight CLI argument"""
+    name, _, value = weight_str.partition("=")
+    if name not in RE_RANKING_WEIGHT_NAMES:
+        raise argparse.ArgumentTypeError(f"Unknown re-ranking weight '{name}', expected one of {RE_RANKING_WEIGHT_NAMES}")
+    try:
+        return name, float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid value for re-ranking weight '{name}': '{value}'")
+
+
 def select_tests_to_run_by_id(test_specs: list[dict], test_ids: list) -> list[dict]:
     return [x for x in test_specs if x['metadata']['test_id'] in test_ids]
 
@@ -162,6 +181,33 @@ async def main():
                                  SearchAgentFeatures.QUERY_PLANNING],
                         help="List of Search Agent features, space-separated, "
                              "Default=CROSS_ENCODER_RE_RANKING QUERY_PLANNING")
+    parser.add_argument("--university", help="University the test questions are asked about. Default=BU", default="BU")
+    parser.add_argument("--query-router-model",
+                        help="Query router model fitted by scripts/query_router.py, only used with the QUERY_ROUTING "
+                             "feature. Default: heuristics only")
+    parser.add_argument("--query-router-threshold", type=float, default=DEFAULT_PLANNING_THRESHOLD,
+                        help="Probability above which the query router model routes a question to the query planner. "
+                             f"Default={DEFAULT_PLANNING_THRESHOLD}")
+    parser.add_argument("--re-ranking-weights", type=parse_re_ranking_weight, nargs="+", default=[],
+                        help="Re-ranking weights to evaluate, as space-separated name=value pairs, e.g. "
+                             "recency_weight=0.3 inbound_links_weight=0.2. Compare the evaluation scores of runs with "
+                             "different weights to tune them. "
+                             "Default: relevance_weight=1.0 and 0 for the page feature weights")
+    parser.add_argument("--llm-max-in-flight-requests", type=int, default=llm_governor.DEFAULT_MAX_IN_FLIGHT_REQUESTS,
+                        help="Maximum number of LLM requests in flight at once. "
+                             f"Default={llm_governor.DEFAULT_MAX_IN_FLIGHT_REQUESTS}")
+    parser.add_argument("--llm-cache",
+                        help="SQLite file caching the responses of the temperature 0 LLM calls, so repeated runs only "
+                             "call the LLMs for the prompts that changed. Default: no caching")
+    parser.add_argument("--llm-hedge-max-rate", type=float,
+                        help="Fire a duplicate of the LLM calls slower than the p90 of similar calls, for at most this "
+                             "fraction of the calls, e.g. 0.05. Default: no hedging")
+    parser.add_argument("--deadline-seconds", type=float,
+                        help="Time budget of each test question. Questions short of time skip planning or formatting, "
+                             "or are answered with the retrieved sources alone. Default: no time limit")
+    parser.add_argument("--trace-file",
+                        help="JSON lines file the spans of each test question (planning, searches, LLM calls...) are "
+                             "appended to, the results reference them by trace_id. Default: no tracing")
     parser.add_argument("--test-ids", nargs="+",
                         default=[],
                         help="Subset of test ids to run (from the --test-file), space-separated. Default: run all")
@@ -183,6 +229,11 @@ async def main():
         env_file = os.path.join(current_directory, env_file)
     init_config(local_env_file=env_file)
 
+    llm_governor.configure(max_in_flight=script_args.llm_max_in_flight_requests)
+    llm_cache.configure(path=script_args.llm_cache)
+    llm_hedging.configure(max_hedge_rate=script_args.llm_hedge_max_rate)
+    tracing.configure(jsonl_path=script_args.trace_file)
+
     # Initialize weaviate store
     weaviate_store = storage.WeaviateStore(
         namespace=config.get("INFO_DATA_NAMESPACE"),
@@ -204,7 +255,13 @@ async def main():
     search_agent_args = {
         "weaviate_search_engine": weaviate_search_engine,
         "reasoning_llm": reasoning_llm,
-        "features": script_args.search_agent_features
+        "features": script_args.search_agent_features,
+        "router": QueryRouter(
+            model=LogisticModel.load(script_args.query_router_model) if script_args.query_router_model else None,
+            threshold=script_args.query_router_threshold
+        ),
+        "re_ranking_weights": dict(script_args.re_ranking_weights),
+        "default_deadline_seconds": script_args.deadline_seconds
     }
 
     search_agent = SearchAgent(**search_agent_args)
@@ -227,8 +284,9 @@ async def main():
     for spec in test_specs:
         logger.info(f"\tquestion: {spec['definition']['request']}")
 
-    # Run all tests
-    results = await run_search_agent_jobs(search_agent, test_specs)
+    # Run all tests, their LLM requests are capped and timed by the LLM governor
+    with llm_governor.request_context(user_id="evaluation", priority=llm_governor.Priority.EVALUATION):
+        results = await run_search_agent_jobs(search_agent, test_specs, script_args.university)
     search_run_time = round((time.time() - start_time), 1)
 
     # Prepare structures for langchain evaluation
@@ -256,7 +314,8 @@ async def main():
         evaluation_llm=evaluation_llm
     )
     # Run all evaluations
-    evaluations = await run_evaluation_agent_jobs(eval_agent, test_specs, predictions)
+    with llm_governor.request_context(user_id="evaluation", priority=llm_governor.Priority.EVALUATION):
+        evaluations = await run_evaluation_agent_jobs(eval_agent, test_specs, predictions)
 
     # Create a complete evaluation structure and write it to a file
     test_results = []
@@ -270,6 +329,9 @@ async def main():
         'cumulative_score': 0,
         'slowest_test': {'test_id': "", 'time': 0.0, "tokens": 0, "cost": 0.0},
         'priciest_test': {'test_id': "", 'time': 0.0, "tokens": 0, "cost": 0.0},
+        'planning_skipped': 0,
+        'planning_latency_saved': 0.0,
+        'degradations': {degradation.value: 0 for degradation in Degradation},
         'namespace': config.get("DATA_NAMESPACE"),
         'user': getpass.getuser(),
         'datetime': datetime.now().isoformat()}
@@ -292,6 +354,12 @@ async def main():
             test_summary['priciest_test']['test_id'] = test['metadata']['test_id']
             test_summary['priciest_test']['tokens'] = test['result']['total_tokens_used']
             test_summary['priciest_test']['cost'] = test['result']['total_tokens_cost']
+        routing_decision = test['result'].get('routing_decision')
+        if routing_decision and not routing_decision['needs_planning']:
+            test_summary['planning_skipped'] += 1
+            test_summary['planning_latency_saved'] += routing_decision['saved_latency'] or 0.0
+        for degradation in test['result']['degradations']:
+            test_summary['degradations'][Degradation(degradation).value] += 1
         test['evaluation'] = {}
 
         test['evaluation']['grade'] = evaluations[idx]['grade']
@@ -314,6 +382,13 @@ async def main():
 
     test_summary['search_agent_tokens_cost'] = round(test_summary['search_agent_tokens_cost'], 2)
     test_summary['evaluation_tokens_cost'] = round(test_summary['evaluation_tokens_cost'], 2)
+    test_summary['planning_latency_saved'] = round(test_summary['planning_latency_saved'], 1)
+    test_summary['query_router_threshold'] = script_args.query_router_threshold
+    test_summary['llm_cache'] = llm_cache.get_cache().stats() if llm_cache.get_cache() is not None else None
+    test_summary['llm_hedging'] = llm_hedging.get_policy().stats() if llm_hedging.get_policy() is not None else None
+    test_summary['llm_queue_waits'] = llm_governor.get_governor().stats()['waits']['evaluation']
+    test_summary['deadline_seconds'] = script_args.deadline_seconds
+    test_summary['re_ranking_weights'] = ReRankingWeights(**dict(script_args.re_ranking_weights)).dict()
     test_summary['evaluation_score'] = \
         int(round(test_summary['cumulative_score'] / test_summary['number_of_tests']))
     test_summary['reasoning_llm'] = reasoning_llm_model_name
@@ -406,6 +481,7 @@ Test {idx + 1}:
    Evaluation Score Explanation: {score_explanation}
    Sources: .................... {sources}
    Search Time: ................ {test['result']['search_job_duration']}
+   Routing Decision: ........... {test['result'].get('routing_decision')}
    Test ID: .................... {test['metadata']['test_id']}
 """
 
@@ -454,6 +530,14 @@ FULL EVALUATION SUMMARY:
     Evaluation tokens cost: ..... {summary['evaluation_tokens_cost']}
     Search run time (sec): ...... {summary['search_run_time']}
     Total run time (sec): ....... {summary['run_time']}
+    Planning skipped: ........... {summary['planning_skipped']} tests, \
+~{summary['planning_latency_saved']} secs saved (router threshold: {summary['query_router_threshold']})
+    Re-ranking weights: ......... {summary['re_ranking_weights']}
+    Deadline degradations: ...... {summary['degradations']} (deadline: {summary['deadline_seconds']} secs)
+    LLM queue waits (sec): ...... mean: {summary['llm_queue_waits']['mean_wait']}, \
+p95: {summary['llm_queue_waits']['p95_wait']}, max: {summary['llm_queue_waits']['max_wait']}
+    LLM cache: .................. {summary['llm_cache']}
+    LLM hedging: ................ {summary['llm_hedging']}
     Slowest test (search) ....... {summary['slowest_test']['test_id']}, time: {summary['slowest_test']['time']} secs, \
      tokens: {summary['slowest_test']['tokens']}, cost: ${round(summary['slowest_test']['cost'], 3)}
     Priciest test (search) ...... {summary['priciest_test']['test_id']}, time: {summary['priciest_test']['time']} secs,\
@@ -0,0 +1,161 @@
+import argparse
+import datetime
+import os
+import statistics
+import time
+
+import src.libs.logging as logging
+import src.libs.storage.weaviate_store as store
+import src.libs.search.weaviate_search_engine as search_engine
+import src.libs.search.local_replica as local_replica
+
+from src.libs.config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+def init_config(local_env_file: str | None):
+    config.init(
+        metadata=[
+            config.ConfigVarMetadata(var_name="INFO_DATA_NAMESPACE"),
+            config.ConfigVarMetadata(var_name="INFO_DATA_MULTI_TENANT", is_json=True),
+            config.ConfigVarMetadata(var_name="WEAVIATE_URL"),
+            config.ConfigVarMetadata(var_name="WEAVIATE_API_KEY"),
+            config.ConfigVarMetadata(var_name="OPENAI_API_KEY"),
+            config.ConfigVarMetadata(var_name="COHERE_API_KEY"),
+            config.ConfigVarMetadata(var_name="LOCAL_REPLICA_DIR"),
+        ],
+        local_env_file=local_env_file
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="Manage the local read replica of the search index",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--env-file",
+        help="Local .env file containing config values",
+        default="/Users/jonahkatz/Dev/BU_Chatbot/src/services/chatbot/.env"
+    )
+    parser.add_argument(
+        "--replica-dir",
+        help="Directory the replica is stored in. Defaults to the LOCAL_REPLICA_DIR config value."
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+
+    sync_parser = subparsers.add_parser("sync", help="Fill the replica from a cursor scan over Weaviate")
+    sync_parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Number of objects fetched from Weaviate per cursor page",
+        default=500
+    )
+
+    benchmark_parser = subparsers.add_parser(
+        "benchmark",
+        help="Run searches against the replica and against Weaviate, and compare latency and results"
+    )
+    benchmark_parser.add_argument(
+        "queries",
+        nargs="*",
+        default=["Where is Mugar library?", "How do I apply for financial aid?", "describe sm 132"]
+    )
+    benchmark_parser.add_argument("--university", default="BU")
+    benchmark_parser.add_argument(
+        "--mode",
+        choices=["semantic", "hybrid", "keyword"],
+        nargs="+",
+        help="Search modes to benchmark",
+        default=["semantic", "hybrid", "keyword"]
+    )
+    benchmark_parser.add_argument(
+        "--top-k",
+        type=int,
+        help="Number of most relevant results to return",
+        default=3
+    )
+    benchmark_parser.add_argument(
+        "--repeat",
+        type=int,
+        help="Number of times each query is run against each engine",
+        default=5
+    )
+
+    script_args = parser.parse_args()
+
+    # Initialize config
+    env_file = script_args.env_file
+    if not env_file.startswith("/"):
+        current_directory = os.path.dirname(__file__)
+        env_file = os.path.join(current_directory, env_file)
+    init_config(local_env_file=env_file)
+
+    # Initialize weaviate store
+    weaviate_store = store.WeaviateStore(
+        instance_url=config.get("WEAVIATE_URL"),
+        api_key=config.get("WEAVIATE_API_KEY"),
+        openai_api_key=config.get("OPENAI_API_KEY"),
+        namespace=config.get("INFO_DATA_NAMESPACE"),
+        cohere_api_key=config.get("COHERE_API_KEY"),
+        multi_tenant=config.get("INFO_DATA_MULTI_TENANT", False)
+    )
+
+    replica = local_replica.LocalReplica(
+        directory=script_args.replica_dir or config.get("LOCAL_REPLICA_DIR"),
+        namespace=config.get("INFO_DATA_NAMESPACE"),
+        max_staleness=datetime.timedelta.max
+    )
+
+    if script_args.command == "sync":
+        sync_start_time = time.time()
+        counts = replica.sync(weaviate_store=weaviate_store, batch_size=script_args.batch_size)
+        for university, count in counts.items():
+            logger.info(f"Replicated {count} TextContent objects for {university}")
+        logger.info(f"Finished syncing local replica in {round(time.time() - sync_start_time, 1)} seconds")
+
+    elif script_args.command == "benchmark":
+        filters = {"university": script_args.university}
+        remote_engine = search_engine.WeaviateSearchEngine(weaviate_store=weaviate_store)
+        local_engine = search_engine.WeaviateSearchEngine(weaviate_store=weaviate_store, local_replica=replica)
+
+        # Cache query embeddings, so the benchmark measures search latency and not the OpenAI embeddings API
+        create_embedding = weaviate_store.create_embedding
+        query_embeddings = {query: create_embedding(query) for query in script_args.queries}
+        weaviate_store.create_embedding = lambda text: query_embeddings.get(text) or create_embedding(text)
+
+        for mode in script_args.mode:
+            latencies = {"weaviate": [], "local": []}
+            overlaps = []
+            for query in script_args.queries:
+                results = {}
+                for engine_name, engine in [("weaviate", remote_engine), ("local", local_engine)]:
+                    for _ in range(script_args.repeat):
+                        search_start_time = time.time()
+                        results[engine_name] = engine.search(
+                            query_str=query,
+                            mode=mode,
+                            top_k=script_args.top_k,
+                            filters=filters
+                        )
+                        latencies[engine_name].append((time.time() - search_start_time) * 1000)
+
+                remote_texts = {search_result.text for search_result in results["weaviate"]}
+                local_texts = {search_result.text for search_result in results["local"]}
+                overlaps.append(len(remote_texts & local_texts) / max(len(remote_texts), 1))
+
+            for engine_name, engine_latencies in latencies.items():
+                engine_latencies = sorted(engine_latencies)
+                logger.info(
+                    f"[{mode}] {engine_name}: "
+                    f"p50={round(statistics.median(engine_latencies), 1)} ms, "
+                    f"p95={round(engine_latencies[int(0.95 * (len(engine_latencies) - 1))], 1)} ms"
+                )
+            logger.info(f"[{mode}] local results overlap with Weaviate results: {round(statistics.mean(overlaps), 2)}")
+
+
+if __name__ == '__main__':
+    main()
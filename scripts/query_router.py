@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import json
+import os
+
+import langchain.chat_models
+import numpy as np
+
+import src.libs.logging as logging
+import src.libs.search.search_agent.query_router as query_router
+import src.libs.search.weaviate_search_engine as search_engine
+import src.libs.storage.embedding_projection as embedding_projection
+import src.libs.storage.user_management as user_management
+import src.libs.storage.weaviate_store as store
+from src.libs.search.search_agent.search_agent import SearchAgent
+
+from src.libs.config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+def init_config(local_env_file: str | None):
+    config.init(
+        metadata=[
+            config.ConfigVarMetadata(var_name="INFO_DATA_NAMESPACE"),
+            config.ConfigVarMetadata(var_name="INFO_DATA_MULTI_TENANT", is_json=True),
+            config.ConfigVarMetadata(var_name="EMBEDDING_PROJECTION_PATH"),
+            config.ConfigVarMetadata(var_name="USER_DATA_NAMESPACE"),
+            config.ConfigVarMetadata(var_name="WEAVIATE_URL"),
+            config.ConfigVarMetadata(var_name="WEAVIATE_API_KEY"),
+            config.ConfigVarMetadata(var_name="OPENAI_API_KEY"),
+            config.ConfigVarMetadata(var_name="COHERE_API_KEY"),
+        ],
+        local_env_file=local_env_file
+    )
+
+
+async def label_questions(search_agent: SearchAgent, questions: list[str], max_concurrency: int) -> dict[str, bool]:
+    """Label each question with whether the LLM query planner decomposes it into several queries"""
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def label_question(question: str) -> bool | None:
+        async with semaphore:
+            try:
+                query_plan = await search_agent.build_query_plan(query=question)
+            except Exception as e:
+                logger.warning(f"Failed to plan \"{question}\": {e}")
+                return None
+        # The planner often returns the question rephrased as a single query, which the question is inserted on top of
+        return len(query_plan.query_graph) - 1 > 1
+
+    labels = await asyncio.gather(*[label_question(question) for question in questions])
+    return {question: label for question, label in zip(questions, labels) if label is not None}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="Fit the query router model that decides which questions need LLM query planning",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--env-file",
+        help="Local .env file containing config values",
+        default="/Users/jonahkatz/Dev/BU_Chatbot/src/services/chatbot/.env"
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+
+    label_parser = subparsers.add_parser(
+        "label",
+        help="Label the questions logged in the user database by running the LLM query planner on them"
+    )
+    label_parser.add_argument("labels_file", help="JSON file the {question: needs_planning} labels are written to")
+    label_parser.add_argument("--max-questions", type=int, help="Number of distinct questions labeled", default=2000)
+    label_parser.add_argument("--reasoning-llm", help="Reasoning LLM model name", default="gpt-3.5-turbo-0613")
+    label_parser.add_argument("--max-concurrency", type=int, help="Number of questions planned at once", default=8)
+
+    fit_parser = subparsers.add_parser("fit", help="Fit the model on labeled questions and save it")
+    fit_parser.add_argument("labels_file", help="JSON file of {question: needs_planning} labels")
+    fit_parser.add_argument("output", help="Path of the .npz file the model is saved to, used as QUERY_ROUTER_MODEL_PATH")
+    fit_parser.add_argument(
+        "--thresholds",
+        type=float,
+        nargs="+",
+        help="Thresholds the held out accuracy and planning rate are reported for",
+        default=[0.3, 0.4, 0.5, 0.6, 0.7]
+    )
+
+    script_args = parser.parse_args()
+
+    # Initialize config
+    env_file = script_args.env_file
+    if not env_file.startswith("/"):
+        current_directory = os.path.dirname(__file__)
+        env_file = os.path.join(current_directory, env_file)
+    init_config(local_env_file=env_file)
+
+    # Initialize weaviate store
+    weaviate_store = store.WeaviateStore(
+        instance_url=config.get("WEAVIATE_URL"),
+        api_key=config.get("WEAVIATE_API_KEY"),
+        openai_api_key=config.get("OPENAI_API_KEY"),
+        namespace=config.get("INFO_DATA_NAMESPACE"),
+        cohere_api_key=config.get("COHERE_API_KEY"),
+        multi_tenant=config.get("INFO_DATA_MULTI_TENANT", False),
+        embedding_projection=(
+            embedding_projection.EmbeddingProjection.load(config.get("EMBEDDING_PROJECTION_PATH"))
+            if config.get("EMBEDDING_PROJECTION_PATH") else None
+        )
+    )
+
+    if script_args.command == "label":
+        user_database_manager = user_management.UserDatabaseManager(
+            instance_url=config.get("WEAVIATE_URL"),
+            api_key=config.get("WEAVIATE_API_KEY"),
+            openai_api_key=config.get("OPENAI_API_KEY"),
+            namespace=config.get("USER_DATA_NAMESPACE"),
+            cohere_api_key=config.get("COHERE_API_KEY")
+        )
+        questions = list(dict.fromkeys(
+            " ".join(query_str.split()) for query_str, _ in user_database_manager.get_user_queries()
+        ))[:script_args.max_questions]
+
+        search_agent = SearchAgent(
+            weaviate_search_engine=search_engine.WeaviateSearchEngine(weaviate_store=weaviate_store),
+            reasoning_llm=langchain.chat_models.ChatOpenAI(
+                model_name=script_args.reasoning_llm,
+                temperature=0.0,
+                openai_api_key=config.get("OPENAI_API_KEY")
+            )
+        )
+        labels = asyncio.run(label_questions(
+            search_agent=search_agent,
+            questions=questions,
+            max_concurrency=script_args.max_concurrency
+        ))
+        with open(script_args.labels_file, "w") as labels_file:
+            json.dump(labels, labels_file, indent=2)
+        logger.info(
+            f"Labeled {len(labels)} questions, {sum(labels.values())} of them were decomposed by the planner"
+        )
+
+    elif script_args.command == "fit":
+        with open(script_args.labels_file) as labels_file:
+            labels = json.load(labels_file)
+
+        # The heuristics decide the clear cases, so the model only learns from the questions it will be asked about
+        heuristic_decisions = {
+            question: query_router.QueryRouter.match_heuristics(question) for question in labels
+        }
+        heuristic_agreements = [
+            decision.needs_planning == labels[question]
+            for question, decision in heuristic_decisions.items() if decision
+        ]
+        logger.info(
+            f"Heuristics decide {len(heuristic_agreements)} of {len(labels)} labeled questions, agreeing with the "
+            f"planner on {round(float(np.mean(heuristic_agreements)), 3) if heuristic_agreements else '-'} of them"
+        )
+        questions = [question for question, decision in heuristic_decisions.items() if decision is None]
+        vectors = np.asarray(weaviate_store.create_embeddings(questions), dtype=np.float32)
+        question_labels = np.asarray([labels[question] for question in questions], dtype=np.float32)
+
+        # Report the accuracy on held out questions, then fit the saved model on every question
+        permutation = np.random.default_rng(0).permutation(len(questions))
+        num_held_out = len(questions) // 5
+        held_out_ids, training_ids = permutation[:num_held_out], permutation[num_held_out:]
+        model = query_router.LogisticModel.fit(vectors=vectors[training_ids], labels=question_labels[training_ids])
+        held_out_probabilities = model.predict_proba(vectors[held_out_ids])
+        for threshold in script_args.thresholds:
+            predictions = held_out_probabilities >= threshold
+            true_labels = question_labels[held_out_ids] == 1
+            missed_planning = np.sum(~predictions & true_labels) / max(np.sum(true_labels), 1)
+            logger.info(
+                f"threshold={threshold}: accuracy={round(float(np.mean(predictions == true_labels)), 3)}, "
+                f"planned={round(float(np.mean(predictions)), 3)}, "
+                f"decomposable questions not planned={round(float(missed_planning), 3)}"
+            )
+
+        query_router.LogisticModel.fit(vectors=vectors, labels=question_labels).save(script_args.output)
+        logger.info(f"Saved query router model to {script_args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ import asyncio
 import os
 
 import src.libs.logging as logging
+import src.libs.storage.embedding_projection as embedding_projection
 import src.libs.storage.weaviate_store as store
 import src.libs.search.weaviate_search_engine as search_engine
 import src.libs.storage.data_connnector.webpage_splitter as webpage_splitter
@@ -18,6 +19,8 @@ def init_config(local_env_file: str | None):
     config.init(
         metadata=[
             config.ConfigVarMetadata(var_name="INFO_DATA_NAMESPACE"),
+            config.ConfigVarMetadata(var_name="INFO_DATA_MULTI_TENANT", is_json=True),
+            config.ConfigVarMetadata(var_name="EMBEDDING_PROJECTION_PATH"),
             config.ConfigVarMetadata(var_name="WEAVIATE_URL"),
             config.ConfigVarMetadata(var_name="WEAVIATE_API_KEY"),
             config.ConfigVarMetadata(var_name="OPENAI_API_KEY"),
@@ -144,7 +147,12 @@ async def main():
         api_key=config.get("WEAVIATE_API_KEY"),
         openai_api_key=config.get("OPENAI_API_KEY"),
         namespace=config.get("INFO_DATA_NAMESPACE"),
-        cohere_api_key=config.get("COHERE_API_KEY")
+        cohere_api_key=config.get("COHERE_API_KEY"),
+        multi_tenant=config.get("INFO_DATA_MULTI_TENANT", False),
+        embedding_projection=(
+            embedding_projection.EmbeddingProjection.load(config.get("EMBEDDING_PROJECTION_PATH"))
+            if config.get("EMBEDDING_PROJECTION_PATH") else None
+        )
     )
 
     weaviate_store.print_webpage_count()
@@ -0,0 +1,97 @@
+import argparse
+import os
+
+import src.libs.logging as logging
+import src.libs.storage.weaviate_store as store
+
+from src.libs.config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+def init_config(local_env_file: str | None):
+    config.init(
+        metadata=[
+            config.ConfigVarMetadata(var_name="INFO_DATA_NAMESPACE"),
+            config.ConfigVarMetadata(var_name="WEAVIATE_URL"),
+            config.ConfigVarMetadata(var_name="WEAVIATE_API_KEY"),
+            config.ConfigVarMetadata(var_name="OPENAI_API_KEY"),
+            config.ConfigVarMetadata(var_name="COHERE_API_KEY"),
+        ],
+        local_env_file=local_env_file
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="Manage the per university tenants of a multi-tenant info index",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--env-file",
+        help="Local .env file containing config values",
+        default="/Users/jonahkatz/Dev/BU_Chatbot/src/services/chatbot/.env"
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+
+    create_schema_parser = subparsers.add_parser(
+        "create-schema",
+        help="Create the multi-tenant schema, with a tenant for each of the given universities"
+    )
+    create_schema_parser.add_argument("universities", nargs="*", default=["BU", "CAL"])
+    create_schema_parser.add_argument(
+        "--delete-if-exists",
+        action="store_true",
+        help="Re-create the schema if it already exists. This deletes ALL universities' data."
+    )
+
+    subparsers.add_parser("list", help="List the universities that have a tenant")
+
+    add_parser = subparsers.add_parser("add", help="Add a tenant for a university, other universities are untouched")
+    add_parser.add_argument("university")
+
+    remove_parser = subparsers.add_parser(
+        "remove",
+        help="Delete the tenant of a university and all of its data, other universities are untouched"
+    )
+    remove_parser.add_argument("university")
+
+    script_args = parser.parse_args()
+
+    # Initialize config
+    env_file = script_args.env_file
+    if not env_file.startswith("/"):
+        current_directory = os.path.dirname(__file__)
+        env_file = os.path.join(current_directory, env_file)
+    init_config(local_env_file=env_file)
+
+    # Initialize weaviate store
+    weaviate_store = store.WeaviateStore(
+        instance_url=config.get("WEAVIATE_URL"),
+        api_key=config.get("WEAVIATE_API_KEY"),
+        openai_api_key=config.get("OPENAI_API_KEY"),
+        namespace=config.get("INFO_DATA_NAMESPACE"),
+        cohere_api_key=config.get("COHERE_API_KEY"),
+        multi_tenant=True
+    )
+
+    if script_args.command == "create-schema":
+        weaviate_store.create_schema(
+            delete_if_exists=script_args.delete_if_exists,
+            universities=script_args.universities
+        )
+        logger.info(f"Created multi-tenant schema with tenants {weaviate_store.universities}")
+    elif script_args.command == "list":
+        logger.info(f"Universities: {weaviate_store.universities}")
+    elif script_args.command == "add":
+        weaviate_store.add_university(script_args.university)
+        logger.info(f"Universities: {weaviate_store.universities}")
+    elif script_args.command == "remove":
+        weaviate_store.remove_university(script_args.university)
+        logger.info(f"Universities: {weaviate_store.universities}")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@ import langchain.chat_models
 import langchain.schema
 
 import src.libs.eval.schema.evaluation_llm_schema as evaluation_llm_schema
+import src.libs.search.search_agent.utils as search_agent_utils
 
 
 class EvaluationAgent:
@@ -64,7 +65,8 @@ as long as it does not contain any conflicting statements. Begin!
                     content=f"QUESTION: {query}\nBOT ANSWER: {bot_rsp}\nTRUE ANSWER: {expected_rsp}"),
             ]
 
-            llm_response_message = await self._evaluation_llm.apredict_messages(
+            llm_response_message = await search_agent_utils.apredict_messages(
+                self._evaluation_llm,
                 messages=llm_prompt_messages,
                 functions=[evaluation_llm_schema.EvaluationLlmSchema.openai_schema],
                 function_call={
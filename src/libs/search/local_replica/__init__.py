@@ -0,0 +1 @@
+from src.libs.search.local_replica.replica import LocalReplica
@@ -0,0 +1,172 @@
+import collections
+import json
+import os
+import re
+
+import numpy as np
+
+import src.libs.logging as logging
+
+
+logger = logging.getLogger(__name__)
+
+
+VOCABULARY_FILE = "bm25_vocabulary.json"
+POSTINGS_OFFSETS_FILE = "bm25_postings_offsets.npy"
+POSTINGS_DOC_IDS_FILE = "bm25_postings_doc_ids.npy"
+POSTINGS_TERM_FREQS_FILE = "bm25_postings_term_freqs.npy"
+DOC_LENGTHS_FILE = "bm25_doc_lengths.npy"
+
+# Weaviate's default BM25 parameters: https://weaviate.io/developers/weaviate/config-refs/schema#bm25
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+# Weaviate's "en" stopwords preset, which is removed from keyword queries by default
+STOPWORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "if", "in", "into", "is", "it", "no", "not",
+    "of", "on", "or", "such", "that", "the", "their", "then", "there", "these", "they", "this", "to", "was",
+    "will", "with"
+])
+
+_WORD_TOKENIZATION_PATTERN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase alphanumeric tokens, matching Weaviate's "word" tokenization"""
+    return _WORD_TOKENIZATION_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Compact BM25 inverted index, scoring documents the same way as Weaviate's bm25 search.
+
+    Postings are stored CSR style in flat arrays: the postings of term t are
+    doc_ids[offsets[t]:offsets[t + 1]] with their term frequencies in term_freqs.
+
+    Args:
+        vocabulary: Mapping of term to term id
+        offsets: Array of shape (num_terms + 1,) with the start of each term's postings
+        doc_ids: Document ids of all postings
+        term_freqs: Term frequency of each posting
+        doc_lengths: Number of tokens in each document
+        k1: BM25 term frequency saturation parameter
+        b: BM25 document length normalization parameter
+    """
+
+    def __init__(
+        self,
+        vocabulary: dict[str, int],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        term_freqs: np.ndarray,
+        doc_lengths: np.ndarray,
+        k1: float = DEFAULT_K1,
+        b: float = DEFAULT_B
+    ):
+        self._vocabulary = vocabulary
+        self._offsets = offsets
+        self._doc_ids = doc_ids
+        self._term_freqs = term_freqs
+        self._doc_lengths = doc_lengths
+        self._k1 = k1
+        self._b = b
+        self._avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @property
+    def num_docs(self) -> int:
+        return len(self._doc_lengths)
+
+    @classmethod
+    def build(cls, texts: list[str]) -> "BM25Index":
+        """Build an index over a list of documents, the document id is the position in the list"""
+        vocabulary: dict[str, int] = {}
+        posting_term_ids = []
+        posting_doc_ids = []
+        posting_term_freqs = []
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[doc_id] = len(tokens)
+            for term, term_freq in collections.Counter(tokens).items():
+                posting_term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                posting_doc_ids.append(doc_id)
+                posting_term_freqs.append(term_freq)
+
+        posting_term_ids = np.array(posting_term_ids, dtype=np.int64)
+        order = np.argsort(posting_term_ids, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(posting_term_ids, minlength=len(vocabulary)))])
+
+        return cls(
+            vocabulary=vocabulary,
+            offsets=offsets.astype(np.int64),
+            doc_ids=np.array(posting_doc_ids, dtype=np.int32)[order],
+            term_freqs=np.array(posting_term_freqs, dtype=np.float32)[order],
+            doc_lengths=doc_lengths
+        )
+
+    def scores(self, query_str: str) -> np.ndarray:
+        """Compute the BM25 score of every document for a query
+
+        Returns:
+            Array of shape (num_docs,) with the score of each document, 0 for documents without any query term
+        """
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        query_terms = [term for term in tokenize(query_str) if term not in STOPWORDS]
+
+        for term in query_terms:
+            term_id = self._vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            doc_ids = self._doc_ids[start:end]
+            term_freqs = self._term_freqs[start:end]
+
+            num_docs_with_term = end - start
+            idf = np.log(1 + (self.num_docs - num_docs_with_term + 0.5) / (num_docs_with_term + 0.5))
+            length_norm = 1 - self._b + self._b * self._doc_lengths[doc_ids] / self._avg_doc_length
+            # Postings hold each document at most once per term, so fancy indexed += is safe
+            scores[doc_ids] += idf * term_freqs * (self._k1 + 1) / (term_freqs + self._k1 * length_norm)
+
+        return scores
+
+    def search(self, query_str: str, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Find the documents with the highest BM25 score for a query
+
+        Returns:
+            Tuple of document ids and BM25 scores, highest score first. Documents that don't match any
+            query term are never returned.
+        """
+        scores = self.scores(query_str)
+        matching_doc_ids = np.flatnonzero(scores)
+        top_k = min(top_k, len(matching_doc_ids))
+        if top_k == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        top_idx = np.argpartition(-scores[matching_doc_ids], top_k - 1)[:top_k]
+        top_doc_ids = matching_doc_ids[top_idx]
+        top_doc_ids = top_doc_ids[np.argsort(-scores[top_doc_ids], kind="stable")]
+
+        return top_doc_ids, scores[top_doc_ids]
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, VOCABULARY_FILE), "w") as f:
+            json.dump(self._vocabulary, f)
+        np.save(os.path.join(directory, POSTINGS_OFFSETS_FILE), self._offsets)
+        np.save(os.path.join(directory, POSTINGS_DOC_IDS_FILE), self._doc_ids)
+        np.save(os.path.join(directory, POSTINGS_TERM_FREQS_FILE), self._term_freqs)
+        np.save(os.path.join(directory, DOC_LENGTHS_FILE), self._doc_lengths)
+
+    @classmethod
+    def load(cls, directory: str) -> "BM25Index":
+        """Load an index from a directory, memory-mapping the postings arrays"""
+        with open(os.path.join(directory, VOCABULARY_FILE), "r") as f:
+            vocabulary = json.load(f)
+
+        return cls(
+            vocabulary=vocabulary,
+            offsets=np.load(os.path.join(directory, POSTINGS_OFFSETS_FILE)),
+            doc_ids=np.load(os.path.join(directory, POSTINGS_DOC_IDS_FILE), mmap_mode="r"),
+            term_freqs=np.load(os.path.join(directory, POSTINGS_TERM_FREQS_FILE), mmap_mode="r"),
+            doc_lengths=np.load(os.path.join(directory, DOC_LENGTHS_FILE))
+        )
@@ -0,0 +1,89 @@
+import numpy as np
+import weaviate.gql.get
+
+# Alias, so the local replica speaks the same fusion types as the Weaviate client
+HybridFusion = weaviate.gql.get.HybridFusion
+
+# Weaviate's default hybrid fusion algorithm (used when with_hybrid isn't given a fusion_type)
+DEFAULT_FUSION_TYPE = HybridFusion.RANKED
+
+# Constant added to the rank of each result in ranked fusion, same as Weaviate
+RANKED_FUSION_K = 60
+
+
+def fuse(
+    vector_results: tuple[np.ndarray, np.ndarray],
+    keyword_results: tuple[np.ndarray, np.ndarray],
+    alpha: float,
+    fusion_type: HybridFusion = DEFAULT_FUSION_TYPE
+) -> tuple[np.ndarray, np.ndarray]:
+    """Fuse vector and keyword search results the same way Weaviate's hybrid search does.
+
+    The vector results are weighted by alpha and the keyword results by 1 - alpha:
+    - ranked fusion scores each result with weight / (rank + 60), summed over both result sets
+    - relative score fusion min-max normalizes the scores of each result set to [0, 1] before the weighted sum
+
+    Args:
+        vector_results: Tuple of ids and scores of the vector search results, highest score first
+        keyword_results: Tuple of ids and scores of the keyword search results, highest score first
+        alpha: Weight of the vector search results, 1 is a pure vector search and 0 a pure keyword search
+        fusion_type: The fusion algorithm to use
+
+    Returns:
+        Tuple of ids and fused scores, highest score first
+    """
+    fused_scores: dict[int, float] = {}
+    for (ids, scores), weight in [(keyword_results, 1 - alpha), (vector_results, alpha)]:
+        if len(ids) == 0:
+            continue
+
+        if fusion_type == HybridFusion.RANKED:
+            weighted_scores = weight / (np.arange(len(ids)) + RANKED_FUSION_K)
+        else:
+            max_score, min_score = np.max(scores), np.min(scores)
+            if max_score == min_score:
+                weighted_scores = np.full(len(ids), weight)
+            else:
+                weighted_scores = weight * (scores - min_score) / (max_score - min_score)
+
+        for result_id, weighted_score in zip(ids.tolist(), weighted_scores.tolist()):
+            fused_scores[result_id] = fused_scores.get(result_id, 0.0) + weighted_score
+
+    # Sort by fused score, Python's sort is stable so ties keep keyword results first like Weaviate
+    fused = sorted(fused_scores.items(), key=lambda item: item[1], reverse=True)
+
+    return (
+        np.array([result_id for result_id, _ in fused], dtype=np.int64),
+        np.array([score for _, score in fused], dtype=np.float32)
+    )
+
+
+def autocut(scores: np.ndarray, cut_off: int) -> int:
+    """Number of results to keep when limiting results to the first cut_off groups of similar scores.
+
+    Port of Weaviate's autocut: scores are normalized to [0, 1] from the first to the last result, and results are
+    cut at the cut_off-th local maximum of the difference between the normalized scores and their evenly spaced
+    positions in [0, 1], i.e. after the cut_off-th jump in score.
+
+    Args:
+        scores: Result scores, highest first
+        cut_off: Number of score jumps after which to cut the results
+
+    Returns:
+        The number of leading results to keep
+    """
+    num_results = len(scores)
+    if num_results <= 1 or scores[0] == scores[-1]:
+        return num_results
+
+    x_values = np.arange(num_results) / (num_results - 1)
+    diff = (scores - scores[0]) / (scores[-1] - scores[0]) - x_values
+
+    extrema_count = 0
+    for i in range(1, num_results - 1):
+        if diff[i] > diff[i - 1] and diff[i] > diff[i + 1]:
+            extrema_count += 1
+            if extrema_count >= cut_off:
+                return i
+
+    return num_results
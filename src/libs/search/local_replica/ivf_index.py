@@ -0,0 +1,186 @@
+import json
+import os
+
+import numpy as np
+
+import src.libs.logging as logging
+
+
+logger = logging.getLogger(__name__)
+
+
+VECTORS_FILE = "vectors.f32"
+CENTROIDS_FILE = "ivf_centroids.npy"
+LIST_OFFSETS_FILE = "ivf_list_offsets.npy"
+INDEX_META_FILE = "ivf_index.json"
+
+# Partitions smaller than this are searched exhaustively, clustering them would not pay off
+MIN_VECTORS_PER_LIST = 256
+# Number of vectors used to train the IVF centroids
+MAX_TRAINING_SAMPLE_SIZE = 50_000
+
+
+class IVFIndex:
+    """Inverted file (IVF) index for approximate nearest neighbour search over normalized float32 vectors.
+
+    Vectors are clustered with spherical k-means and stored on disk ordered by cluster (inverted list), so each
+    list is a contiguous slice of a memory-mapped array. A query only scans the lists whose centroids are closest
+    to it, which keeps search cheap without holding the full matrix in memory.
+
+    Args:
+        vectors: Matrix of shape (num_vectors, dim), rows ordered by inverted list
+        centroids: Matrix of shape (num_lists, dim) with the normalized centroid of each inverted list
+        list_offsets: Array of shape (num_lists + 1,) where list i is vectors[list_offsets[i]:list_offsets[i + 1]]
+    """
+
+    def __init__(self, vectors: np.ndarray, centroids: np.ndarray, list_offsets: np.ndarray):
+        self._vectors = vectors
+        self._centroids = centroids
+        self._list_offsets = list_offsets
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Matrix of shape (num_vectors, dim) of the normalized vectors, rows ordered by inverted list"""
+        return self._vectors
+
+    @property
+    def num_vectors(self) -> int:
+        return self._vectors.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self._vectors.shape[1]
+
+    @property
+    def num_lists(self) -> int:
+        return self._centroids.shape[0]
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, num_lists: int | None = None, seed: int = 0) -> tuple["IVFIndex", np.ndarray]:
+        """Build an index by clustering the vectors into inverted lists.
+
+        Args:
+            vectors: Matrix of shape (num_vectors, dim)
+            num_lists: Number of inverted lists. Defaults to ~sqrt(num_vectors).
+            seed: Random seed used for k-means initialization
+
+        Returns:
+            Tuple of the index and the permutation applied to the input rows, i.e. row i of the index
+            is row order[i] of the input vectors
+        """
+        vectors = normalize(np.asarray(vectors, dtype=np.float32))
+        num_vectors = vectors.shape[0]
+        if num_lists is None:
+            num_lists = max(1, min(int(np.sqrt(num_vectors)), num_vectors // MIN_VECTORS_PER_LIST))
+
+        if num_lists <= 1:
+            centroids = normalize(vectors.mean(axis=0, keepdims=True)) if num_vectors else vectors[:0]
+            order = np.arange(num_vectors)
+            list_offsets = np.array([0, num_vectors], dtype=np.int64)
+            return cls(vectors=vectors, centroids=centroids, list_offsets=list_offsets), order
+
+        centroids = _train_centroids(vectors=vectors, num_lists=num_lists, seed=seed)
+        assignments = _assign(vectors=vectors, centroids=centroids)
+
+        order = np.argsort(assignments, kind="stable")
+        list_sizes = np.bincount(assignments, minlength=num_lists)
+        list_offsets = np.concatenate([[0], np.cumsum(list_sizes)]).astype(np.int64)
+
+        return cls(vectors=vectors[order], centroids=centroids, list_offsets=list_offsets), order
+
+    def search(self, query_vector: np.ndarray, top_k: int, num_probes: int = 8) -> tuple[np.ndarray, np.ndarray]:
+        """Find the approximate nearest neighbours of a query vector by cosine similarity.
+
+        Args:
+            query_vector: Vector of shape (dim,)
+            top_k: Number of nearest neighbours to return
+            num_probes: Number of inverted lists (closest to the query) to scan
+
+        Returns:
+            Tuple of row ids and cosine similarities of the nearest neighbours, most similar first
+        """
+        if self.num_vectors == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        query_vector = normalize(np.asarray(query_vector, dtype=np.float32)[np.newaxis, :])[0]
+
+        centroid_scores = self._centroids @ query_vector
+        num_probes = min(num_probes, self.num_lists)
+        probed_lists = np.argpartition(-centroid_scores, num_probes - 1)[:num_probes]
+
+        candidate_ids = np.concatenate([
+            np.arange(self._list_offsets[list_id], self._list_offsets[list_id + 1])
+            for list_id in probed_lists
+        ])
+        candidate_scores = np.asarray(self._vectors[candidate_ids] @ query_vector)
+
+        top_k = min(top_k, len(candidate_ids))
+        if top_k == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        top_idx = np.argpartition(-candidate_scores, top_k - 1)[:top_k]
+        top_idx = top_idx[np.argsort(-candidate_scores[top_idx])]
+
+        return candidate_ids[top_idx], candidate_scores[top_idx]
+
+    def vector(self, row_id: int) -> np.ndarray:
+        return np.asarray(self._vectors[row_id])
+
+    def save(self, directory: str):
+        """Write the index to a directory. The vectors are written as a raw float32 file so they can be memory-mapped."""
+        os.makedirs(directory, exist_ok=True)
+        self._vectors.astype(np.float32).tofile(os.path.join(directory, VECTORS_FILE))
+        np.save(os.path.join(directory, CENTROIDS_FILE), self._centroids.astype(np.float32))
+        np.save(os.path.join(directory, LIST_OFFSETS_FILE), self._list_offsets)
+        with open(os.path.join(directory, INDEX_META_FILE), "w") as f:
+            json.dump({"num_vectors": self.num_vectors, "dim": self.dim}, f)
+
+    @classmethod
+    def load(cls, directory: str) -> "IVFIndex":
+        """Load an index from a directory, memory-mapping the vectors instead of reading them into memory."""
+        with open(os.path.join(directory, INDEX_META_FILE), "r") as f:
+            index_meta = json.load(f)
+
+        shape = (index_meta["num_vectors"], index_meta["dim"])
+        if shape[0] == 0:
+            vectors = np.zeros(shape, dtype=np.float32)
+        else:
+            vectors = np.memmap(os.path.join(directory, VECTORS_FILE), dtype=np.float32, mode="r", shape=shape)
+
+        return cls(
+            vectors=vectors,
+            centroids=np.load(os.path.join(directory, CENTROIDS_FILE)),
+            list_offsets=np.load(os.path.join(directory, LIST_OFFSETS_FILE))
+        )
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale each row of a matrix to unit length, so dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _train_centroids(vectors: np.ndarray, num_lists: int, seed: int, num_iterations: int = 10) -> np.ndarray:
+    """Train inverted list centroids with spherical k-means on a sample of the vectors"""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), MAX_TRAINING_SAMPLE_SIZE)
+    sample = vectors[rng.choice(len(vectors), size=sample_size, replace=False)]
+
+    centroids = sample[rng.choice(sample_size, size=num_lists, replace=False)]
+    for _ in range(num_iterations):
+        assignments = _assign(vectors=sample, centroids=centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        # Re-seed empty clusters with random sample vectors
+        empty = np.bincount(assignments, minlength=num_lists) == 0
+        sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+
+    return centroids
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 8192) -> np.ndarray:
+    """Assign each vector to its most similar centroid, in chunks to bound memory use"""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        assignments[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+    return assignments
@@ -0,0 +1,389 @@
+import dataclasses
+import datetime
+import json
+import os
+import shutil
+import threading
+import typing
+
+import numpy as np
+import tqdm
+
+from src.libs.search import search_data_classes as search_data_classes
+from src.libs.search.local_replica import bm25_index as bm25_index
+from src.libs.search.local_replica import fusion as fusion
+from src.libs.search.local_replica import ivf_index as ivf_index
+from src.libs.storage import storage_data_classes as storage_data_classes
+from src.libs.storage import weaviate_store as weaviate_store
+import src.libs.logging as logging
+
+
+logger = logging.getLogger(__name__)
+
+
+# Aliases
+TextContent = storage_data_classes.TextContent
+Webpage = storage_data_classes.Webpage
+SearchResult = search_data_classes.SearchResult
+
+MANIFEST_FILE = "manifest.json"
+RECORDS_FILE = "records.jsonl"
+
+DEFAULT_MAX_STALENESS = datetime.timedelta(hours=24)
+
+
+@dataclasses.dataclass
+class ReplicaRecord:
+    """Copy of a TextContent object, and the page it belongs to, held by the local replica"""
+    id: str
+    text: str
+    index: int
+    url: str
+    webpage_id: str
+    mime_type: str | None
+    university: str
+    num_tokens: int | None = None
+    num_inbound_links: int | None = None
+    last_modified: str | None = None
+    path_depth: int | None = None
+
+
+@dataclasses.dataclass
+class ReplicaPartition:
+    """The replicated TextContent objects of a single university"""
+    university: str
+    synced_at: datetime.datetime
+    records: list[ReplicaRecord]
+    vector_index: ivf_index.IVFIndex
+    keyword_index: bm25_index.BM25Index
+    # Modification time (ns) of the manifest the partition was loaded from, a newer manifest means it was re-synced
+    manifest_mtime: int = 0
+
+
+class LocalReplica:
+    """In-process read replica of the TextContent vectors of a Weaviate namespace, partitioned by university.
+
+    The replica is filled by sync(), which does a cursor scan over every TextContent object in Weaviate and
+    writes one partition per university to disk. Each partition holds an IVF vector index and a BM25 keyword
+    index over the same objects, so semantic, keyword and hybrid searches can all be answered locally.
+    Partitions are memory-mapped, so the replica can be shared by every worker process on a host.
+
+    Args:
+        directory: Directory the replica partitions are stored in
+        namespace: Weaviate data namespace being replicated
+        max_staleness: Partitions synced longer ago than this are considered stale and are not searched
+        num_probes: Number of IVF lists scanned per query, higher is more accurate but slower
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        namespace: str,
+        max_staleness: datetime.timedelta = DEFAULT_MAX_STALENESS,
+        num_probes: int = 8
+    ):
+        self._directory = os.path.join(directory, namespace)
+        self._namespace = namespace
+        self._max_staleness = max_staleness
+        self._num_probes = num_probes
+
+        self._partitions: dict[str, ReplicaPartition] = {}
+        self._partitions_lock = threading.Lock()
+
+    @property
+    def universities(self) -> list[str]:
+        """Universities that have a partition on disk"""
+        if not os.path.isdir(self._directory):
+            return []
+        return sorted(
+            name for name in os.listdir(self._directory)
+            if os.path.isfile(os.path.join(self._directory, name, MANIFEST_FILE))
+        )
+
+    def is_fresh(self, university: str) -> bool:
+        """Check if the partition for a university exists and was synced recently enough to be searched"""
+        partition = self._get_partition(university)
+        if partition is None:
+            return False
+
+        return datetime.datetime.now(datetime.timezone.utc) - partition.synced_at <= self._max_staleness
+
+    def search(
+        self,
+        university: str,
+        mode: typing.Literal["semantic", "hybrid", "keyword"] = "hybrid",
+        query_str: str | None = None,
+        query_vector: list[float] | None = None,
+        top_k: int = 3,
+        alpha: float = 0.75,
+        fusion_type: fusion.HybridFusion = fusion.DEFAULT_FUSION_TYPE,
+        autocut: int | None = None,
+        num_candidates: int = 100
+    ) -> list[SearchResult]:
+        """Search the partition of a university, mirroring WeaviateSearchEngine.search()
+
+        Args:
+            university: The university to search for information in
+            mode: Either "semantic", "keyword" or "hybrid"
+            query_str: The search query, required for keyword and hybrid searches
+            query_vector: The embedding of the search query, required for semantic and hybrid searches
+            top_k: Number of most relevant results to return
+            alpha: Only relevant for hybrid mode searches, the weight of vector vs keyword results
+            fusion_type: Only relevant for hybrid mode searches, how vector and keyword results are fused
+            autocut: Cut off results after this many jumps in score, like Weaviate's autocut
+            num_candidates: Only relevant for hybrid mode searches, the number of vector and keyword
+                results fused together
+
+        Returns:
+            List of SearchResult objects. Semantic results are scored with Weaviate's certainty
+            ((1 + cosine similarity) / 2), keyword results with BM25 and hybrid results with the fused score.
+        """
+        partition = self._get_partition(university)
+        if partition is None:
+            return []
+
+        if mode == "semantic":
+            row_ids, similarities = self._vector_search(partition, query_vector=query_vector, top_k=top_k)
+            scores = (1 + similarities) / 2
+        elif mode == "keyword":
+            row_ids, scores = partition.keyword_index.search(query_str=query_str, top_k=top_k)
+        else:
+            row_ids, scores = fusion.fuse(
+                vector_results=self._vector_search(partition, query_vector=query_vector, top_k=num_candidates),
+                keyword_results=partition.keyword_index.search(query_str=query_str, top_k=num_candidates),
+                alpha=alpha,
+                fusion_type=fusion_type
+            )
+
+        if autocut:
+            num_results = fusion.autocut(scores=scores, cut_off=autocut)
+            row_ids, scores = row_ids[:num_results], scores[:num_results]
+
+        return [
+            SearchResult(
+                text=partition.records[row_id].text,
+                url=partition.records[row_id].url,
+                score=float(score),
+                index=partition.records[row_id].index,
+                num_tokens=partition.records[row_id].num_tokens,
+                num_inbound_links=partition.records[row_id].num_inbound_links,
+                last_modified=partition.records[row_id].last_modified,
+                path_depth=partition.records[row_id].path_depth
+            )
+            for row_id, score in zip(row_ids[:top_k], scores[:top_k])
+        ]
+
+    def vectors(self, university: str) -> np.ndarray:
+        """The normalized vectors of a university's partition, memory-mapped. Empty if there is no partition."""
+        partition = self._get_partition(university)
+        if partition is None:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        return partition.vector_index.vectors
+
+    def sync(self, weaviate_store: weaviate_store.WeaviateStore, batch_size: int = 500) -> dict[str, int]:
+        """Re-build every partition of the replica from a cursor scan over the TextContent objects in Weaviate.
+
+        Args:
+            weaviate_store: Store connected to the Weaviate instance to replicate
+            batch_size: Number of objects fetched per cursor page
+
+        Returns:
+            Dictionary mapping each university to the number of TextContent objects replicated for it
+        """
+        synced_at = datetime.datetime.now(datetime.timezone.utc)
+        staging_directory = os.path.join(self._directory, ".staging")
+        shutil.rmtree(staging_directory, ignore_errors=True)
+        os.makedirs(staging_directory)
+
+        # Stream the objects to per university staging files so the whole corpus is never held in memory
+        vector_files = {}
+        record_files = {}
+        counts = {}
+        dim = None
+        try:
+            for raw_object in tqdm.tqdm(self._scan_text_contents(weaviate_store, batch_size), desc="TextContent"):
+                vector = raw_object["_additional"]["vector"]
+                if not raw_object.get("contentOf") or not vector:
+                    continue
+                webpage = raw_object["contentOf"][0]
+                university = webpage.get("university")
+                if not university:
+                    continue
+                dim = dim or len(vector)
+
+                if university not in vector_files:
+                    os.makedirs(os.path.join(staging_directory, university))
+                    vector_files[university] = open(os.path.join(staging_directory, university, "staging.f32"), "wb")
+                    record_files[university] = open(os.path.join(staging_directory, university, RECORDS_FILE), "w")
+                    counts[university] = 0
+
+                vector_files[university].write(np.asarray(vector, dtype=np.float32).tobytes())
+                record = ReplicaRecord(
+                    id=raw_object["_additional"]["id"],
+                    text=raw_object["text"],
+                    index=raw_object["index"],
+                    url=webpage["url"],
+                    webpage_id=webpage["webpage_id"],
+                    mime_type=webpage.get("mimeType"),
+                    university=university,
+                    num_tokens=raw_object.get("numTokens"),
+                    num_inbound_links=raw_object.get("numInboundLinks"),
+                    last_modified=raw_object.get("lastModified"),
+                    path_depth=raw_object.get("pathDepth")
+                )
+                record_files[university].write(json.dumps(dataclasses.asdict(record)) + "\n")
+                counts[university] += 1
+        finally:
+            for f in [*vector_files.values(), *record_files.values()]:
+                f.close()
+
+        for university, count in counts.items():
+            logger.info(f"Building local replica partition for {university} ({count} objects)")
+            self._build_partition(
+                partition_directory=os.path.join(staging_directory, university),
+                num_vectors=count,
+                dim=dim,
+                synced_at=synced_at
+            )
+            self._swap_in_partition(university=university, staging_directory=staging_directory)
+
+        shutil.rmtree(staging_directory, ignore_errors=True)
+        self.reload()
+
+        return counts
+
+    def reload(self):
+        """Drop partitions loaded in memory, so they are re-loaded from disk on next use"""
+        with self._partitions_lock:
+            self._partitions = {}
+
+    def _vector_search(
+        self,
+        partition: ReplicaPartition,
+        query_vector: list[float],
+        top_k: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        return partition.vector_index.search(
+            query_vector=np.asarray(query_vector, dtype=np.float32),
+            top_k=top_k,
+            num_probes=self._num_probes
+        )
+
+    def _scan_text_contents(self, weaviate_store: weaviate_store.WeaviateStore, batch_size: int):
+        """Iterate over every TextContent object (with its vector and page) using the Weaviate cursor API"""
+        # Multi-tenant stores are scanned one university tenant at a time
+        tenants = weaviate_store.universities if weaviate_store.multi_tenant else [None]
+        for tenant in tenants:
+            yield from self._scan_tenant_text_contents(weaviate_store, batch_size=batch_size, tenant=tenant)
+
+    def _scan_tenant_text_contents(
+        self,
+        weaviate_store: weaviate_store.WeaviateStore,
+        batch_size: int,
+        tenant: str | None
+    ):
+        text_content_class_name = TextContent.weaviate_class_name(namespace=self._namespace)
+        webpage_class_name = Webpage.weaviate_class_name(namespace=self._namespace)
+        cursor = None
+        while True:
+            query = (
+                weaviate_store.client.query
+                .get(text_content_class_name,
+                     ["index", "text", *weaviate_store.backfilled_text_content_properties, f"contentOf {{ ... on {webpage_class_name} {{ url, webpage_id, mimeType, university }} }}"])
+                .with_additional(properties=["id", "vector"])
+                .with_limit(batch_size)
+            )
+            if tenant:
+                query = query.with_tenant(tenant)
+            if cursor:
+                query = query.with_after(cursor)
+            raw_objects = query.do()["data"]["Get"][text_content_class_name]
+
+            if not raw_objects:
+                break
+            yield from raw_objects
+            cursor = raw_objects[-1]["_additional"]["id"]
+
+    @staticmethod
+    def _build_partition(partition_directory: str, num_vectors: int, dim: int, synced_at: datetime.datetime):
+        """Build the vector index of a staged partition and write its manifest"""
+        staging_vectors_path = os.path.join(partition_directory, "staging.f32")
+        vectors = np.memmap(staging_vectors_path, dtype=np.float32, mode="r", shape=(num_vectors, dim))
+        vector_index, order = ivf_index.IVFIndex.build(vectors=vectors)
+        del vectors
+        os.remove(staging_vectors_path)
+        vector_index.save(partition_directory)
+
+        # Re-order the records to match the order of the rows in the vector index
+        records_path = os.path.join(partition_directory, RECORDS_FILE)
+        with open(records_path, "r") as f:
+            lines = f.readlines()
+        lines = [lines[row] for row in order]
+        with open(records_path, "w") as f:
+            f.writelines(lines)
+
+        # The keyword index shares document ids with the vector index rows
+        keyword_index = bm25_index.BM25Index.build(texts=[json.loads(line)["text"] for line in lines])
+        keyword_index.save(partition_directory)
+
+        with open(os.path.join(partition_directory, MANIFEST_FILE), "w") as f:
+            json.dump({
+                "synced_at": synced_at.isoformat(),
+                "num_vectors": num_vectors,
+                "dim": dim,
+                "num_lists": vector_index.num_lists
+            }, f)
+
+    def _swap_in_partition(self, university: str, staging_directory: str):
+        """Replace the live partition of a university with its freshly built staging partition"""
+        live_directory = os.path.join(self._directory, university)
+        old_directory = os.path.join(self._directory, f".{university}.old")
+        shutil.rmtree(old_directory, ignore_errors=True)
+        if os.path.isdir(live_directory):
+            os.rename(live_directory, old_directory)
+        os.rename(os.path.join(staging_directory, university), live_directory)
+        shutil.rmtree(old_directory, ignore_errors=True)
+
+    def _get_partition(self, university: str) -> ReplicaPartition | None:
+        """Get the partition for a university, loading it from disk if needed.
+
+        Partitions are re-synced by another process (scripts/local_replica.py), so the loaded partition is replaced
+        as soon as the manifest on disk is newer than the one it was loaded from.
+        """
+        with self._partitions_lock:
+            cached_partition = self._partitions.get(university)
+            partition_directory = os.path.join(self._directory, university)
+            manifest_path = os.path.join(partition_directory, MANIFEST_FILE)
+            try:
+                manifest_mtime = os.stat(manifest_path).st_mtime_ns
+            except FileNotFoundError:
+                # The partition is being swapped in by a sync, keep serving the loaded one meanwhile
+                return cached_partition
+
+            if cached_partition is not None and cached_partition.manifest_mtime == manifest_mtime:
+                return cached_partition
+
+            try:
+                with open(manifest_path, "r") as f:
+                    manifest = json.load(f)
+                with open(os.path.join(partition_directory, RECORDS_FILE), "r") as f:
+                    records = [ReplicaRecord(**json.loads(line)) for line in f]
+
+                partition = ReplicaPartition(
+                    university=university,
+                    synced_at=datetime.datetime.fromisoformat(manifest["synced_at"]),
+                    records=records,
+                    vector_index=ivf_index.IVFIndex.load(partition_directory),
+                    keyword_index=bm25_index.BM25Index.load(partition_directory),
+                    manifest_mtime=manifest_mtime
+                )
+            except OSError as e:
+                logger.warning(f"Failed to load the local replica partition of {university}, it is being synced: {e}")
+                return cached_partition
+
+            if cached_partition is not None:
+                logger.info(f"Reloaded the local replica partition of {university} synced at {partition.synced_at}")
+            self._partitions[university] = partition
+
+            return partition
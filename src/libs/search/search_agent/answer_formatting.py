@@ -1,3 +1,4 @@
+import asyncio
 import re
 
 import langchain.chat_models
@@ -6,18 +7,23 @@ import langchain.schema
 import src.libs.search.search_agent.schemas as schemas
 import src.libs.search.search_agent.utils as utils
 import src.libs.logging as logging
+import src.libs.tracing as tracing
 
 logger = logging.getLogger(__name__)
 
 
-instructions_msg = langchain.prompts.SystemMessagePromptTemplate.from_template(
-    template="You are tasked with ensuring that an answer that was generated by an LLM is formatted correctly. "
-    "Your task is to ensure that the answer is formatted according to **ALL** the following rules. If the answer "
-    "is already formatted correctly, please leave it as is.\n\n"
+# Formatting rules every answer must follow, also used to generate answers that are already formatted
+formatting_rules_tmpl = (
     "Rule 1. Ensure that crucial or definitive parts of the answer are wrapped in asterisks like **this**.\n"
     "Rule 2. The answer must start with '{answer_prefix}'.\n"
     "Rule 3. If the question requests a list of items, the answer should contain a bulleted list of items "
-    "appropriate to the question.",
+    "appropriate to the question."
+)
+
+instructions_msg = langchain.prompts.SystemMessagePromptTemplate.from_template(
+    template="You are tasked with ensuring that an answer that was generated by an LLM is formatted correctly. "
+    "Your task is to ensure that the answer is formatted according to **ALL** the following rules. If the answer "
+    "is already formatted correctly, please leave it as is.\n\n" + formatting_rules_tmpl,
     template_format="f-string",
 )
 
@@ -41,16 +47,28 @@ instructions_reminder_msg = langchain.schema.SystemMessage(
 )
 
 
+def get_answer_prefix(num_sources: int) -> str:
+    """The phrase every answer starts with"""
+    return "Based on the provided sources, " if num_sources > 1 else "Based on the provided source, "
+
+
+def get_answer_paragraph_prefix(num_sources: int) -> str:
+    """The answer prefix as a paragraph of its own, used when the answer starts with a list or a heading"""
+    return get_answer_prefix(num_sources).rstrip(", ") + ":\n\n"
+
+
+def build_formatting_rules(num_sources: int) -> str:
+    """The formatting rules of an answer generated from num_sources sources"""
+    return formatting_rules_tmpl.format(answer_prefix=get_answer_prefix(num_sources))
+
+
 def build_format_answer_prompt_msgs(
     generated_answer: str,
     sources: list[schemas.SearchResult],
     question: str,
 ) -> list[langchain.prompts.base.BaseMessage]:
-    # Set answer prefix
-    answer_prefix = "Based on the provided sources, " if len(sources) > 1 else "Based on the provided source, "
-
     prompt_messages = [
-        instructions_msg.format(answer_prefix=answer_prefix),
+        instructions_msg.format(answer_prefix=get_answer_prefix(len(sources))),
         question_msg_prompt_tmpl.format(question=question),
         generated_answer_msg_prompt_tmpl.format(answer=generated_answer),
         instructions_reminder_msg,
@@ -59,7 +77,141 @@ def build_format_answer_prompt_msgs(
     return prompt_messages
 
 
+# Lines starting with any of these markers are list items, they are normalized to markdown list items
+BULLET_LIST_ITEM_PATTERN = re.compile(r"^(\s*)(?:[-*•·–—]|\u2022)\s+(?=\S)")
+NUMBERED_LIST_ITEM_PATTERN = re.compile(r"^(\s*)(\d+)[.)]\s+(?=\S)")
+MARKDOWN_HEADING_PATTERN = re.compile(r"^\s*#{1,6}\s+(?=\S)")
+# Phrasings of questions that explicitly ask for a list of items (Rule 3)
+LIST_QUESTION_PATTERN = re.compile(r"\b(list|examples|what are some|ways to|steps)\b", re.IGNORECASE)
+# Existing variants of the answer prefix the LLM may have written, replaced with the exact prefix (Rule 2)
+ANSWER_PREFIX_PATTERN = re.compile(
+    r"^\s*\**\s*based on (the )?(provided |available )?(sources?|information|search results?)\s*\**\s*,?\s*",
+    re.IGNORECASE
+)
+# First words of an answer that are safe to lowercase when the prefix is prepended to it
+LOWERCASE_SENTENCE_STARTERS = {
+    "a", "an", "the", "there", "this", "these", "that", "those", "it", "its", "you", "your", "yes", "no",
+    "students", "to", "in", "at", "for", "if", "unfortunately", "currently", "here", "some", "most", "all", "each",
+    "as", "when", "according"
+}
+
+
+def post_process_answer(answer: str, num_sources: int) -> str:
+    """Deterministically apply the formatting rules that don't need an LLM: the answer prefix (Rule 2) and the
+    structure of lists, which markdown only renders when they are separated from the previous paragraph.
+
+    Args:
+        answer: The generated answer
+        num_sources: Number of sources the answer was generated from
+
+    Returns:
+        The post-processed answer
+    """
+    answer = answer.strip()
+    if not answer:
+        return answer
+
+    # Normalize list item markers and make sure each list starts after a blank line
+    lines = []
+    previous_line_is_list_item = False
+    for line in answer.splitlines():
+        line = line.rstrip()
+        if BULLET_LIST_ITEM_PATTERN.match(line) and not line.lstrip().startswith("**"):
+            line = BULLET_LIST_ITEM_PATTERN.sub(r"\1- ", line)
+        else:
+            line = NUMBERED_LIST_ITEM_PATTERN.sub(r"\1\2. ", line)
+        is_list_item = bool(BULLET_LIST_ITEM_PATTERN.match(line) or NUMBERED_LIST_ITEM_PATTERN.match(line))
+        if is_list_item and not previous_line_is_list_item and lines and lines[-1]:
+            lines.append("")
+        lines.append(line)
+        previous_line_is_list_item = is_list_item
+    answer = "\n".join(lines)
+
+    # Replace the LLM's variant of the prefix, if any, with the exact prefix
+    answer_prefix = get_answer_prefix(num_sources)
+    answer, num_replaced_prefixes = ANSWER_PREFIX_PATTERN.subn("", answer, count=1)
+    if num_replaced_prefixes:
+        answer = answer.lstrip(": \n")
+
+    # A list or a heading can't continue the prefix's sentence, so the prefix gets a paragraph of its own
+    first_line = answer.split("\n", 1)[0]
+    if BULLET_LIST_ITEM_PATTERN.match(first_line) or NUMBERED_LIST_ITEM_PATTERN.match(first_line) \
+            or MARKDOWN_HEADING_PATTERN.match(first_line):
+        return f"{get_answer_paragraph_prefix(num_sources)}{answer}"
+
+    first_word = answer.split(maxsplit=1)[0] if answer.split() else ""
+    if first_word.strip(",.:!").lower() in LOWERCASE_SENTENCE_STARTERS and first_word[:1].isupper():
+        answer = answer[:1].lower() + answer[1:]
+
+    return f"{answer_prefix}{answer}"
+
+
+# Number of sources listed by a retrieval-only answer, and the maximum length of the excerpt of each
+RETRIEVAL_ONLY_NUM_SOURCES = 3
+RETRIEVAL_ONLY_EXCERPT_CHARS = 300
+
+
+def build_retrieval_only_answer(sources: list[schemas.SearchResult]) -> str:
+    """Answer listing the most relevant sources with an excerpt of each, used when there is no time left to generate
+    an answer from them
+
+    Args:
+        sources: Ranked sources, most relevant first
+
+    Returns:
+        The answer, as markdown
+    """
+    if not sources:
+        return "I couldn't find an answer to your question in time, please try again in a few moments."
+
+    source_items = []
+    for source in sources[:RETRIEVAL_ONLY_NUM_SOURCES]:
+        excerpt = " ".join(source.text.split())
+        if len(excerpt) > RETRIEVAL_ONLY_EXCERPT_CHARS:
+            excerpt = excerpt[:RETRIEVAL_ONLY_EXCERPT_CHARS].rsplit(" ", 1)[0] + "..."
+        source_items.append(f"- **{source.url}**: {excerpt}")
+
+    return (
+        "I couldn't finish writing an answer in time, but these pages look the most relevant to your question:\n\n"
+        + "\n".join(source_items)
+    )
+
+
+def validate_answer(answer: str, question: str) -> list[str]:
+    """Cheaply check an answer against the formatting rules
+
+    Args:
+        answer: The post-processed answer
+        question: The question the answer is for
+
+    Returns:
+        Descriptions of the rules the answer breaks, empty if it is formatted correctly
+    """
+    problems = []
+    if not answer.strip():
+        return ["answer is empty"]
+
+    answer_prefixes = tuple(
+        prefix(num_sources) for prefix in (get_answer_prefix, get_answer_paragraph_prefix) for num_sources in (1, 2)
+    )
+    if not answer.startswith(answer_prefixes):
+        problems.append("answer doesn't start with the answer prefix")
+
+    if "**" not in answer:
+        problems.append("no part of the answer is in bold")
+
+    has_list = any(
+        BULLET_LIST_ITEM_PATTERN.match(line) or NUMBERED_LIST_ITEM_PATTERN.match(line)
+        for line in answer.splitlines()
+    )
+    if LIST_QUESTION_PATTERN.search(question) and not has_list:
+        problems.append("question asks for a list but the answer has none")
+
+    return problems
+
+
 @utils.llm_schema_gen_retry_config
+@tracing.traced("formatting")
 async def format_answer(
     generated_answer: str,
     llm: langchain.chat_models.ChatOpenAI,
@@ -90,8 +242,13 @@ async def format_answer(
         question=query,
     )
 
-    llm_to_use = utils.get_llm_to_use(prompt_msgs, llm, fallback_llm, max_answer_tokens)
-    llm_answer_response_message = await llm_to_use.apredict_messages(
+    # Tokenizing the prompt is CPU bound, so it is run in the default loop's executor
+    llm_to_use = await asyncio.get_running_loop().run_in_executor(
+        None,
+        lambda: utils.get_llm_to_use(prompt_msgs, llm, fallback_llm, max_answer_tokens)
+    )
+    llm_answer_response_message = await utils.apredict_messages(
+        llm_to_use,
         messages=prompt_msgs,
         request_timeout=15,
     )
@@ -0,0 +1,117 @@
+import dataclasses
+import typing
+
+import numpy as np
+
+import src.libs.logging as logging
+import src.libs.search.weaviate_search_engine as weaviate_search_engine
+
+logger = logging.getLogger(__name__)
+
+
+# Tokens of the wrapper each source is given in the prompt: 'Search Result {n}:\n"""\n{text}\n"""\n\n'
+SOURCE_OVERHEAD_TOKENS = 12
+# Sources that don't fit whole are truncated to the remaining budget, unless fewer tokens than this are left
+MIN_TRUNCATED_SOURCE_TOKENS = 100
+# Marker appended to the text of truncated sources, so the LLM knows the text is incomplete
+TRUNCATION_MARKER = " [...]"
+# Upper bound of the tokens of the truncation marker
+TRUNCATION_MARKER_TOKENS = 4
+# Utility given to the lowest scored source, so it still counts as worth including
+MIN_SOURCE_UTILITY = 0.05
+
+
+@dataclasses.dataclass
+class PackedContext:
+    """Container for the sources chosen to fit in a prompt"""
+    # Sources included in the prompt, in their original (ranking) order
+    sources: list[weaviate_search_engine.SearchResult]
+    # Text of each included source as it appears in the prompt, truncated for the sources that didn't fit whole
+    texts: list[str]
+    # Tokens used by the included sources, including their wrapper
+    num_tokens: int
+    token_budget: int
+    num_dropped_sources: int
+    num_truncated_sources: int
+    # Tokens of source text left out of the prompt, from both dropped and truncated sources
+    num_dropped_tokens: int
+
+
+def pack_sources(
+        sources: list[weaviate_search_engine.SearchResult],
+        token_budget: int,
+        count_source_tokens: typing.Callable[[weaviate_search_engine.SearchResult], int],
+        truncate_text: typing.Callable[[str, int], str]
+) -> PackedContext:
+    """Choose the sources that give the most relevance per token without exceeding a token budget.
+
+    The top ranked source is always included, truncated to the budget if needed. The other sources are added
+    greedily by normalized score per token. A source that doesn't fit whole is truncated to the remaining budget
+    when enough of it is left, otherwise it is dropped and smaller sources may still fill the gap.
+
+    Args:
+        sources: Re-ranked sources, most relevant first
+        token_budget: Maximum number of tokens the sources can take up in the prompt
+        count_source_tokens: Returns the number of tokens in the text of a source
+        truncate_text: Returns the first tokens of a text, given the text and the number of tokens to keep
+
+    Returns:
+        PackedContext with the chosen sources
+    """
+    num_source_tokens = [count_source_tokens(source) for source in sources]
+    utilities = _source_utilities(sources)
+
+    # The top source is considered first regardless of its length, the rest by utility per token
+    candidate_ids = sorted(
+        range(len(sources)),
+        key=lambda i: (i != 0, -utilities[i] / (num_source_tokens[i] + SOURCE_OVERHEAD_TOKENS))
+    )
+
+    packed_texts: dict[int, str] = {}
+    num_tokens = 0
+    num_truncated_sources = 0
+    num_dropped_tokens = 0
+    for source_id in candidate_ids:
+        remaining_tokens = token_budget - num_tokens - SOURCE_OVERHEAD_TOKENS
+        source_tokens = num_source_tokens[source_id]
+        if source_tokens <= remaining_tokens:
+            packed_texts[source_id] = sources[source_id].text
+            num_tokens += source_tokens + SOURCE_OVERHEAD_TOKENS
+        elif remaining_tokens >= MIN_TRUNCATED_SOURCE_TOKENS or (source_id == 0 and remaining_tokens > 0):
+            kept_tokens = remaining_tokens - TRUNCATION_MARKER_TOKENS
+            packed_texts[source_id] = truncate_text(sources[source_id].text, kept_tokens) + TRUNCATION_MARKER
+            num_tokens += remaining_tokens + SOURCE_OVERHEAD_TOKENS
+            num_truncated_sources += 1
+            num_dropped_tokens += source_tokens - kept_tokens
+        else:
+            num_dropped_tokens += source_tokens
+
+    packed_ids = sorted(packed_texts)
+    return PackedContext(
+        sources=[sources[source_id] for source_id in packed_ids],
+        texts=[packed_texts[source_id] for source_id in packed_ids],
+        num_tokens=num_tokens,
+        token_budget=token_budget,
+        num_dropped_sources=len(sources) - len(packed_ids),
+        num_truncated_sources=num_truncated_sources,
+        num_dropped_tokens=num_dropped_tokens
+    )
+
+
+def _source_utilities(sources: list[weaviate_search_engine.SearchResult]) -> np.ndarray:
+    """Relevance of each source on a 0-1 scale.
+
+    Scores are min-max normalized as they come from different scales depending on the search mode. Sources without
+    scores are valued by their rank instead.
+    """
+    if not sources:
+        return np.zeros(0)
+
+    if any(source.score is None for source in sources):
+        utilities = 1 - np.arange(len(sources)) / len(sources)
+    else:
+        scores = np.array([source.score for source in sources], dtype=np.float64)
+        score_range = scores.max() - scores.min()
+        utilities = (scores - scores.min()) / score_range if score_range > 0 else np.ones(len(sources))
+
+    return np.maximum(utilities, MIN_SOURCE_UTILITY)
@@ -0,0 +1,48 @@
+import asyncio
+import dataclasses
+import time
+import typing
+
+T = typing.TypeVar("T")
+
+
+@dataclasses.dataclass(frozen=True)
+class Deadline:
+    """Point in time a request must be answered by, drawn down by each stage of the request"""
+    # time.monotonic() value of the deadline
+    end_time: float
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        """Deadline the given number of seconds from now"""
+        return cls(end_time=time.monotonic() + seconds)
+
+    def remaining(self, reserve: float = 0.0) -> float:
+        """Seconds left until the deadline, keeping reserve seconds for the stages that come after"""
+        return max(self.end_time - time.monotonic() - reserve, 0.0)
+
+    def has_time_for(self, seconds: float, reserve: float = 0.0) -> bool:
+        """Check that a stage expected to take the given number of seconds can run, keeping reserve seconds"""
+        return self.remaining(reserve=reserve) >= seconds
+
+    async def run(self, awaitable: typing.Awaitable[T], reserve: float = 0.0) -> T:
+        """Await a stage within the time left, keeping reserve seconds for the stages that come after.
+
+        Args:
+            awaitable: The stage
+            reserve: Seconds before the deadline the stage must be done by
+
+        Returns:
+            The result of the stage
+
+        Raises:
+            asyncio.TimeoutError: The stage didn't finish in time, it is cancelled
+        """
+        return await asyncio.wait_for(awaitable, timeout=self.remaining(reserve=reserve))
+
+
+async def run_within(deadline: Deadline | None, awaitable: typing.Awaitable[T], reserve: float = 0.0) -> T:
+    """Await a stage within a deadline, or without a time limit when there is no deadline"""
+    if deadline is None:
+        return await awaitable
+    return await deadline.run(awaitable, reserve=reserve)
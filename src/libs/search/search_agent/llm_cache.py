@@ -0,0 +1,138 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import langchain.chat_models
+import langchain.schema
+
+import src.libs.logging as logging
+
+logger = logging.getLogger(__name__)
+
+
+# Cached responses are served for a week, so changes to the indexed pages eventually show up in answers
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+# Least recently used responses are evicted past this number of entries
+DEFAULT_MAX_ENTRIES = 100_000
+# Arguments of ChatOpenAI.apredict_messages that don't change the response
+UNCACHED_ARGUMENTS = ("callbacks", "request_timeout")
+
+
+class LLMResponseCache:
+    """SQLite backed cache of the responses of deterministic (temperature 0) LLM calls.
+
+    Responses are keyed by a hash of the model, its parameters, the prompt messages, and the functions and other
+    arguments of the call. Entries expire after a TTL, and the least recently used entries are evicted once the
+    cache holds more than max_entries responses.
+
+    Args:
+        path: Path of the SQLite database file, created if it doesn't exist
+        ttl_seconds: Number of seconds a response is served for after it was cached
+        max_entries: Maximum number of responses kept
+    """
+    def __init__(self, path: str, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        # The connection is shared by the threads of the default executor, SQLite calls are serialized with the lock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_time REAL NOT NULL, last_access_time REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS llm_responses_last_access_time ON llm_responses (last_access_time)"
+            )
+        self.num_hits = 0
+        self.num_misses = 0
+
+    @staticmethod
+    def is_cacheable(llm: langchain.chat_models.ChatOpenAI) -> bool:
+        """Only the calls of deterministic LLMs returning a single response are cached"""
+        return llm.temperature == 0 and llm.n == 1
+
+    @staticmethod
+    def build_key(
+            llm: langchain.chat_models.ChatOpenAI,
+            messages: list[langchain.schema.BaseMessage],
+            **kwargs
+    ) -> str:
+        """Hash of everything that determines the response of an LLM call
+
+        Args:
+            llm: The LLM called
+            messages: The prompt messages
+            kwargs: The other arguments of ChatOpenAI.apredict_messages (functions, function_call...)
+
+        Returns:
+            Hex digest identifying the call
+        """
+        key = {
+            "model_name": llm.model_name,
+            "temperature": llm.temperature,
+            "max_tokens": llm.max_tokens,
+            "model_kwargs": llm.model_kwargs,
+            "messages": langchain.schema.messages_to_dict(messages),
+            "arguments": {name: value for name, value in kwargs.items() if name not in UNCACHED_ARGUMENTS},
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key: str) -> langchain.schema.BaseMessage | None:
+        """The cached response of a call, None if it isn't cached or has expired"""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response FROM llm_responses WHERE key = ? AND created_time > ?",
+                (key, now - self._ttl_seconds)
+            ).fetchone()
+            if row is not None:
+                self._connection.execute("UPDATE llm_responses SET last_access_time = ? WHERE key = ?", (now, key))
+
+        if row is None:
+            self.num_misses += 1
+            return None
+
+        self.num_hits += 1
+        return langchain.schema.messages_from_dict([json.loads(row[0])])[0]
+
+    def set(self, key: str, response: langchain.schema.BaseMessage):
+        """Cache the response of a call, evicting expired and least recently used responses as needed"""
+        now = time.time()
+        response_json = json.dumps(langchain.schema.messages_to_dict([response])[0])
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, response, created_time, last_access_time) "
+                "VALUES (?, ?, ?, ?)",
+                (key, response_json, now, now)
+            )
+            self._connection.execute("DELETE FROM llm_responses WHERE created_time <= ?", (now - self._ttl_seconds,))
+            self._connection.execute(
+                "DELETE FROM llm_responses WHERE key IN ("
+                "SELECT key FROM llm_responses ORDER BY last_access_time DESC LIMIT -1 OFFSET ?)",
+                (self._max_entries,)
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        return {"num_entries": len(self), "num_hits": self.num_hits, "num_misses": self.num_misses}
+
+
+_cache: LLMResponseCache | None = None
+
+
+def get_cache() -> LLMResponseCache | None:
+    """The cache LLM calls are served from, None if caching isn't enabled"""
+    return _cache
+
+
+def configure(path: str | None, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES):
+    """Enable caching LLM responses in a SQLite database, or disable it when path is None"""
+    global _cache
+    _cache = LLMResponseCache(path=path, ttl_seconds=ttl_seconds, max_entries=max_entries) if path else None
@@ -0,0 +1,212 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import dataclasses
+import enum
+import time
+
+import numpy as np
+
+import src.libs.logging as logging
+
+logger = logging.getLogger(__name__)
+
+
+# Maximum number of LLM requests in flight at once in the process, across every user
+DEFAULT_MAX_IN_FLIGHT_REQUESTS = 16
+# Waits longer than this are logged as warnings
+SLOW_WAIT_SECONDS = 5.0
+# Number of most recent waits of each priority the wait percentiles are computed over
+NUM_RECENT_WAITS = 1000
+
+
+class Priority(int, enum.Enum):
+    """Priority of the LLM requests of a job, lower values are served first"""
+    INTERACTIVE = 0
+    EVALUATION = 1
+    BATCH = 2
+
+
+@dataclasses.dataclass(frozen=True)
+class RequestContext:
+    """Who the LLM requests made in the current context are made for"""
+    user_id: str
+    priority: Priority
+
+
+# Requests made outside of a request_context() are from scripts and background jobs
+_DEFAULT_REQUEST_CONTEXT = RequestContext(user_id="batch", priority=Priority.BATCH)
+_request_context: contextvars.ContextVar[RequestContext] = contextvars.ContextVar(
+    "llm_request_context", default=_DEFAULT_REQUEST_CONTEXT
+)
+
+
+@contextlib.contextmanager
+def request_context(user_id: str, priority: Priority = Priority.INTERACTIVE):
+    """Attribute the LLM requests made in the block, including by the tasks it creates, to a user and priority"""
+    token = _request_context.set(RequestContext(user_id=user_id, priority=priority))
+    try:
+        yield
+    finally:
+        _request_context.reset(token)
+
+
+def get_request_context() -> RequestContext:
+    return _request_context.get()
+
+
+@dataclasses.dataclass
+class WaitStats:
+    """Queue wait times of the LLM requests of a priority"""
+    num_requests: int = 0
+    num_queued: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    recent_waits: collections.deque = dataclasses.field(
+        default_factory=lambda: collections.deque(maxlen=NUM_RECENT_WAITS)
+    )
+
+    def record(self, wait: float, queued: bool):
+        self.num_requests += 1
+        self.num_queued += queued
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent_waits.append(wait)
+
+    def to_dict(self) -> dict:
+        recent_waits = np.asarray(self.recent_waits) if self.recent_waits else np.zeros(1)
+        return {
+            "num_requests": self.num_requests,
+            "num_queued": self.num_queued,
+            "mean_wait": round(self.total_wait / self.num_requests, 3) if self.num_requests else 0.0,
+            "p50_wait": round(float(np.percentile(recent_waits, 50)), 3),
+            "p95_wait": round(float(np.percentile(recent_waits, 95)), 3),
+            "max_wait": round(self.max_wait, 3),
+        }
+
+
+class LLMGovernor:
+    """Process wide cap on the number of LLM requests in flight.
+
+    Requests over the cap are queued. Queued requests are served by priority, and within a priority round-robin
+    across users, so a user whose question fans out into many requests doesn't hold up everyone else.
+
+    Args:
+        max_in_flight: Maximum number of requests in flight at once
+    """
+    def __init__(self, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT_REQUESTS):
+        self._max_in_flight = max_in_flight
+        self._num_in_flight = 0
+        # Waiting requests of each priority, by user. The order of the users is the round-robin order.
+        self._waiters: dict[Priority, collections.OrderedDict[str, collections.deque[asyncio.Future]]] = {
+            priority: collections.OrderedDict() for priority in Priority
+        }
+        self._wait_stats = {priority: WaitStats() for priority in Priority}
+
+    @property
+    def max_in_flight(self) -> int:
+        return self._max_in_flight
+
+    @property
+    def num_in_flight(self) -> int:
+        return self._num_in_flight
+
+    @property
+    def num_waiting(self) -> int:
+        return sum(len(waiters) for user_waiters in self._waiters.values() for waiters in user_waiters.values())
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Hold one of the in-flight request slots for the duration of the block, waiting for one if needed.
+        The request is attributed to the user and priority of the current request_context()."""
+        context = get_request_context()
+        start_time = time.monotonic()
+        queued = self._num_in_flight >= self._max_in_flight or self.num_waiting > 0
+        if queued:
+            await self._wait_for_slot(context)
+        else:
+            self._num_in_flight += 1
+
+        wait = time.monotonic() - start_time
+        self._wait_stats[context.priority].record(wait=wait, queued=queued)
+        if wait > SLOW_WAIT_SECONDS:
+            logger.warning(
+                f"LLM request of {context.user_id} ({context.priority.name}) waited {round(wait, 1)}s for a slot, "
+                f"{self.num_waiting} requests still waiting"
+            )
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        """Snapshot of the queue and of the wait times of each priority, in seconds"""
+        return {
+            "max_in_flight": self._max_in_flight,
+            "num_in_flight": self._num_in_flight,
+            "num_waiting": self.num_waiting,
+            "waits": {priority.name.lower(): self._wait_stats[priority].to_dict() for priority in Priority},
+        }
+
+    async def _wait_for_slot(self, context: RequestContext):
+        waiter = asyncio.get_running_loop().create_future()
+        user_waiters = self._waiters[context.priority]
+        if context.user_id not in user_waiters:
+            user_waiters[context.user_id] = collections.deque()
+        user_waiters[context.user_id].append(waiter)
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over as the request was cancelled, pass it on
+                self._release()
+            else:
+                self._remove_waiter(context, waiter)
+            raise
+
+    def _remove_waiter(self, context: RequestContext, waiter: asyncio.Future):
+        user_waiters = self._waiters[context.priority]
+        waiters = user_waiters.get(context.user_id)
+        if waiters is None:
+            return
+        with contextlib.suppress(ValueError):
+            waiters.remove(waiter)
+        if not waiters:
+            del user_waiters[context.user_id]
+
+    def _release(self):
+        """Hand the released slot over to the next waiting request, or free it if none are waiting"""
+        for priority in Priority:
+            user_waiters = self._waiters[priority]
+            while user_waiters:
+                # Serve the first request of the next user, who then goes to the back of the round-robin
+                user_id, waiters = next(iter(user_waiters.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    user_waiters.move_to_end(user_id)
+                else:
+                    del user_waiters[user_id]
+
+                if not waiter.done():
+                    # The slot stays in flight, it now belongs to the waiter
+                    waiter.set_result(None)
+                    return
+
+        self._num_in_flight -= 1
+
+
+_governor = LLMGovernor()
+
+
+def get_governor() -> LLMGovernor:
+    """The governor every LLM request of the process goes through"""
+    return _governor
+
+
+def configure(max_in_flight: int):
+    """Replace the process wide governor, must be called before any LLM request is made"""
+    global _governor
+    _governor = LLMGovernor(max_in_flight=max_in_flight)
@@ -0,0 +1,157 @@
+import asyncio
+import collections
+import math
+import time
+import typing
+
+import langchain.chat_models
+import langchain.schema
+import numpy as np
+
+import src.libs.logging as logging
+
+logger = logging.getLogger(__name__)
+
+
+# Maximum fraction of the recent LLM calls a duplicate request is fired for
+DEFAULT_MAX_HEDGE_RATE = 0.05
+# Percentile of the recent latencies of similar calls after which a call is hedged
+HEDGE_LATENCY_PERCENTILE = 90
+# Calls aren't hedged until this many similar calls were timed, the percentile isn't meaningful before
+MIN_LATENCY_SAMPLES = 20
+# Number of most recent latencies of each model and prompt size the percentile is computed over
+NUM_RECENT_LATENCIES = 200
+# Number of most recent calls the hedge rate is computed over
+NUM_RECENT_CALLS = 1000
+
+T = typing.TypeVar("T")
+
+
+class HedgingPolicy:
+    """Fires a duplicate of an LLM call that is slower than the observed p90 of similar calls, and takes the response
+    that comes back first, cancelling the other.
+
+    Calls are similar when they are made to the same model with prompts of the same size, within a power of two. Only
+    a max_hedge_rate fraction of the recent calls are hedged, so a slow down of the LLM provider doesn't double the
+    requests sent to it.
+
+    Args:
+        max_hedge_rate: Maximum fraction of the recent calls a duplicate request is fired for
+    """
+    def __init__(self, max_hedge_rate: float = DEFAULT_MAX_HEDGE_RATE):
+        self._max_hedge_rate = max_hedge_rate
+        self._latencies: dict[tuple, collections.deque[float]] = {}
+        # Whether each recent call was hedged
+        self._recent_calls: collections.deque[bool] = collections.deque(maxlen=NUM_RECENT_CALLS)
+        self.num_calls = 0
+        self.num_hedges_fired = 0
+        self.num_hedges_won = 0
+        self.num_hedges_rate_limited = 0
+
+    @staticmethod
+    def build_key(llm: langchain.chat_models.ChatOpenAI, messages: list[langchain.schema.BaseMessage]) -> tuple:
+        """Key of the calls whose latencies a call's hedge delay is computed from, the model and prompt size bucket"""
+        prompt_size = sum(len(message.content) for message in messages)
+        return llm.model_name, int(math.log2(max(prompt_size, 1)))
+
+    def hedge_delay(self, key: tuple) -> float | None:
+        """Seconds after which a call is hedged, None while too few similar calls were timed"""
+        latencies = self._latencies.get(key)
+        if latencies is None or len(latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        return float(np.percentile(latencies, HEDGE_LATENCY_PERCENTILE))
+
+    async def run(
+            self,
+            key: tuple,
+            call: typing.Callable[[], typing.Awaitable[T]],
+            may_hedge: typing.Callable[[], bool] | None = None
+    ) -> T:
+        """Make a call, firing a duplicate of it if it hasn't returned after the hedge delay of its key.
+
+        Args:
+            key: Key of the call, see build_key()
+            call: Makes the call, called a second time to fire the duplicate
+            may_hedge: Optional check that a duplicate can be fired once the hedge delay has passed, e.g. that the
+                LLM isn't saturated
+
+        Returns:
+            The response of the call, or of its duplicate when it came back first
+        """
+        self.num_calls += 1
+        delay = self.hedge_delay(key)
+        start_time = time.monotonic()
+        primary = asyncio.ensure_future(call())
+        hedge = None
+        try:
+            if delay is not None:
+                await asyncio.wait({primary}, timeout=delay)
+                if not primary.done():
+                    if self._hedge_rate() >= self._max_hedge_rate:
+                        self.num_hedges_rate_limited += 1
+                    elif may_hedge is None or may_hedge():
+                        hedge = asyncio.ensure_future(call())
+                        self.num_hedges_fired += 1
+                        logger.info(f"LLM call to {key[0]} still running after {round(delay, 2)}s, hedging it")
+            self._recent_calls.append(hedge is not None)
+
+            if hedge is None:
+                response = await primary
+                self._record_latency(key, time.monotonic() - start_time)
+                return response
+
+            return await self._first_response(key=key, primary=primary, hedge=hedge, start_time=start_time)
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "max_hedge_rate": self._max_hedge_rate,
+            "num_calls": self.num_calls,
+            "num_hedges_fired": self.num_hedges_fired,
+            "num_hedges_won": self.num_hedges_won,
+            "num_hedges_rate_limited": self.num_hedges_rate_limited,
+            "recent_hedge_rate": round(self._hedge_rate(), 3),
+        }
+
+    async def _first_response(self, key: tuple, primary: asyncio.Future, hedge: asyncio.Future, start_time: float):
+        """Response of whichever of the call and its duplicate succeeds first, raising if both fail"""
+        pending = {primary, hedge}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    winner = primary if primary in succeeded else hedge
+                    if winner is hedge:
+                        self.num_hedges_won += 1
+                    return winner.result()
+                if not pending:
+                    raise primary.exception()
+        finally:
+            # The latency of the call is at least this long, even when its duplicate won and it gets cancelled
+            self._record_latency(key, time.monotonic() - start_time)
+
+    def _hedge_rate(self) -> float:
+        return sum(self._recent_calls) / len(self._recent_calls) if self._recent_calls else 0.0
+
+    def _record_latency(self, key: tuple, latency: float):
+        if key not in self._latencies:
+            self._latencies[key] = collections.deque(maxlen=NUM_RECENT_LATENCIES)
+        self._latencies[key].append(latency)
+
+
+_policy: HedgingPolicy | None = None
+
+
+def get_policy() -> HedgingPolicy | None:
+    """The policy LLM calls are hedged with, None if hedging isn't enabled"""
+    return _policy
+
+
+def configure(max_hedge_rate: float | None):
+    """Enable hedging LLM calls, or disable it when max_hedge_rate is None or 0"""
+    global _policy
+    _policy = HedgingPolicy(max_hedge_rate=max_hedge_rate) if max_hedge_rate else None
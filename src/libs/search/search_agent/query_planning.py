@@ -4,9 +4,21 @@ import typing
 import pydantic
 
 from src.libs.search.search_agent import openai_schema as openai_schema
+import src.libs.search.search_agent.context_packing as context_packing
 import src.libs.search.weaviate_search_engine as weaviate_search_engine
 
 
+@dataclasses.dataclass
+class QueryTiming:
+    """Timing of the execution of a query, in seconds since the execution of its query plan started"""
+    # When all of its sub-queries were answered
+    ready_time: float
+    # When it started executing, later than ready_time when the plan's concurrency limit was reached
+    start_time: float
+    search_end_time: float
+    end_time: float
+
+
 @dataclasses.dataclass
 class QueryResult:
     """Container for results of a query."""
@@ -14,6 +26,10 @@ class QueryResult:
     result: str
     sources: list[weaviate_search_engine.SearchResult]
     search_parameters: dict
+    # How the sources were fit into the QA LLM's prompt, None when the answer wasn't generated by the QA LLM
+    packed_context: context_packing.PackedContext | None = None
+    # None when the query wasn't executed as part of a query plan
+    timing: QueryTiming | None = None
 
 
 @dataclasses.dataclass
@@ -0,0 +1,180 @@
+import dataclasses
+import re
+
+import numpy as np
+
+import src.libs.logging as logging
+
+
+logger = logging.getLogger(__name__)
+
+
+# Probability above which a question is routed to the query planner
+DEFAULT_PLANNING_THRESHOLD = 0.5
+
+# Questions this short that match no decomposition pattern are answered without planning
+MAX_SIMPLE_QUESTION_WORDS = 8
+
+# Phrasings of questions that ask about several things at once, or whose answer depends on another answer
+DECOMPOSITION_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE)
+    for pattern in [
+        r"\bcompar(e|ed|ing|ison)\b",
+        r"\bdifferen(ce|ces|t)\b.*\b(between|from)\b",
+        r"\b(vs|versus)\b\.?",
+        r"\bwhich (one|is better|should)\b",
+        r"\b(both|each of|all of the)\b",
+        r"\b(before|after) (i|you|we)\b",
+        r"\bsteps?\b.*\b(to|for)\b",
+        r"\?.+\?",
+    ]
+]
+
+
+@dataclasses.dataclass
+class RoutingDecision:
+    """Container for the decision of whether a question is planned"""
+    needs_planning: bool
+    # Estimated probability that the question needs to be decomposed
+    probability: float
+    # Which rule made the decision: "pattern", "short", "model" or "default"
+    reason: str
+    # Estimated seconds saved by not planning the question, None if it is planned or nothing was planned yet
+    saved_latency: float | None = None
+
+
+class LogisticModel:
+    """Logistic regression over query embeddings, predicting whether a question needs to be decomposed.
+
+    Args:
+        weights: Array of shape (dim,)
+        bias: Intercept of the model
+    """
+
+    def __init__(self, weights: np.ndarray, bias: float):
+        self._weights = weights.astype(np.float32)
+        self._bias = float(bias)
+
+    @property
+    def dim(self) -> int:
+        return self._weights.shape[0]
+
+    @classmethod
+    def fit(
+        cls,
+        vectors: np.ndarray,
+        labels: np.ndarray,
+        l2: float = 1e-3,
+        learning_rate: float = 0.5,
+        num_iterations: int = 500
+    ) -> "LogisticModel":
+        """Fit the model with full batch gradient descent.
+
+        Args:
+            vectors: Matrix of shape (num_questions, dim) of question embeddings
+            labels: Array of shape (num_questions,), 1 for questions that need planning, 0 otherwise
+            l2: L2 regularization strength
+            learning_rate: Gradient descent step size
+            num_iterations: Number of gradient descent steps
+
+        Returns:
+            The fitted model
+        """
+        vectors = np.asarray(vectors, dtype=np.float64)
+        labels = np.asarray(labels, dtype=np.float64)
+        weights = np.zeros(vectors.shape[1])
+        # Start from the base rate, so the model is calibrated even when the embeddings carry little signal
+        positive_rate = np.clip(labels.mean(), 1e-3, 1 - 1e-3)
+        bias = np.log(positive_rate / (1 - positive_rate))
+        for _ in range(num_iterations):
+            errors = cls._sigmoid(vectors @ weights + bias) - labels
+            weights -= learning_rate * (vectors.T @ errors / len(labels) + l2 * weights)
+            bias -= learning_rate * errors.mean()
+
+        return cls(weights=weights, bias=bias)
+
+    def predict_proba(self, vectors: np.ndarray) -> np.ndarray:
+        """Probability that each question of a (num_questions, dim) matrix of embeddings needs planning"""
+        return self._sigmoid(np.asarray(vectors, dtype=np.float32) @ self._weights + self._bias)
+
+    def save(self, path: str):
+        np.savez(path, weights=self._weights, bias=np.array(self._bias))
+
+    @classmethod
+    def load(cls, path: str) -> "LogisticModel":
+        with np.load(path) as model_arrays:
+            return cls(weights=model_arrays["weights"], bias=float(model_arrays["bias"]))
+
+    @staticmethod
+    def _sigmoid(logits: np.ndarray) -> np.ndarray:
+        return 1 / (1 + np.exp(-logits))
+
+
+class QueryRouter:
+    """Decides whether a question needs to be decomposed by the LLM query planner, without calling an LLM.
+
+    Clear cases are decided by heuristics: questions matching a decomposition pattern are planned, and short
+    questions that don't are not. The remaining questions are scored by the logistic model when one is provided,
+    and planned otherwise, so the router never skips planning for a question it knows nothing about.
+
+    Args:
+        model: Optional logistic model over query embeddings, see scripts/query_router.py
+        threshold: Probability above which the model routes a question to the planner
+    """
+
+    def __init__(self, model: LogisticModel | None = None, threshold: float = DEFAULT_PLANNING_THRESHOLD):
+        self._model = model
+        self.threshold = threshold
+
+    @property
+    def uses_embeddings(self) -> bool:
+        """Whether routing needs the embedding of the question"""
+        return self._model is not None
+
+    @staticmethod
+    def match_heuristics(question: str) -> RoutingDecision | None:
+        """Decide the clear cases
+
+        Args:
+            question: The question to route
+
+        Returns:
+            The decision, None if the heuristics can't tell
+        """
+        if any(pattern.search(question) for pattern in DECOMPOSITION_PATTERNS):
+            return RoutingDecision(needs_planning=True, probability=1.0, reason="pattern")
+
+        if len(question.split()) <= MAX_SIMPLE_QUESTION_WORDS and " and " not in question.lower():
+            return RoutingDecision(needs_planning=False, probability=0.0, reason="short")
+
+        return None
+
+    def route(self, question: str, question_vector: list[float] | None = None) -> RoutingDecision:
+        """Decide whether a question needs planning
+
+        Args:
+            question: The question to route
+            question_vector: Embedding of the question, only used when the router has a model
+
+        Returns:
+            The routing decision
+        """
+        decision = self.match_heuristics(question)
+        if decision:
+            return decision
+
+        if self._model is not None and question_vector is not None:
+            if len(question_vector) != self._model.dim:
+                logger.warning(
+                    f"Query router model expects {self._model.dim} dimensions, got {len(question_vector)}. "
+                    "Was it fitted before the embedding projection changed?"
+                )
+            else:
+                probability = float(self._model.predict_proba(np.asarray([question_vector]))[0])
+                return RoutingDecision(
+                    needs_planning=probability >= self.threshold,
+                    probability=probability,
+                    reason="model"
+                )
+
+        return RoutingDecision(needs_planning=True, probability=1.0, reason="default")
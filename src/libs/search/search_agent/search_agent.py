@@ -2,20 +2,29 @@ import asyncio
 import dataclasses
 import datetime
 import enum
+import time
 import typing
 
 import langchain.callbacks
+import langchain.callbacks.base
 import langchain.chat_models
 import langchain.schema
 import llama_index.llms.openai_utils as openai_utils
 import numpy as np
 
 import src.libs.search.search_agent.query_planning as query_planning
+import src.libs.search.search_agent.query_router as query_router
 import src.libs.search.search_agent.search_parameter_gen as search_parameter_gen
 import src.libs.search.weaviate_search_engine as weaviate_search_engine
 import src.libs.search.search_agent.answer_formatting as answer_formatting
+import src.libs.search.search_agent.deadline as deadlines
+import src.libs.search.search_agent.context_packing as context_packing
+import src.libs.search.search_agent.source_aggregation as source_aggregation
+import src.libs.search.search_agent.utils as utils
 import src.libs.storage.storage_data_classes as storage_data_classes
+import src.libs.storage.tokenization as tokenization
 import src.libs.logging as logging
+import src.libs.tracing as tracing
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +34,39 @@ SOURCE_TYPE_TO_NULL_CHECK_PROPERTY = {
 }
 
 # Re-ranking config constants
-RELEVANCE_RE_RANKING_WEIGHT = 1.0
+# Age at which the recency of a page is halved
+RECENCY_HALF_LIFE_DAYS = 365
+
+# Certainty a FAQ question must reach to be served as the answer to a query. Certainty is (1 + cosine similarity) / 2,
+# so 0.97 keeps only close rephrasings of the FAQ question.
+DEFAULT_FAQ_MIN_CERTAINTY = 0.97
+
+# Maximum number of queries of a single query plan executed at once
+DEFAULT_MAX_QUERY_CONCURRENCY = 4
+
+# Deadline budget of a query: seconds kept for searching and answering when the query is planned. Planning is skipped
+# when it would be left less than MIN_PLANNING_SECONDS.
+EXECUTION_RESERVE_SECONDS = 8.0
+MIN_PLANNING_SECONDS = 2.0
+# The FAQ lookup and the query routing are skipped when they would be left less than this, keeping the execution
+# reserve too
+MIN_FAQ_LOOKUP_SECONDS = 0.5
+MIN_ROUTING_SECONDS = 0.5
+# Seconds kept to answer from the retrieved sources alone when searching and answering run out of time
+RETRIEVAL_ONLY_RESERVE_SECONDS = 0.5
+# Re-formatting the answer is skipped when less than this is left
+MIN_FORMATTING_SECONDS = 3.0
+
+# Tokens of the QA LLM's context kept free for the answer, search results are packed in the rest
+QA_ANSWER_RESERVED_TOKENS = 500
+
+# Role of the LLM answering questions from search results
+QA_ROLE_PROMPT = (
+    "You are a helpful, knowledgeable and confident university chatbot. "
+    "Your task is to respond to the student's question with a helpful, "
+    "accurate and concise answer based only on the information that can be "
+    "found in the university data."
+)
 
 
 class SearchAgent:
@@ -41,6 +82,13 @@ class SearchAgent:
         features: List of features to enable on the agent. Features are disabled, unless explicitly provided.
         include_source_types: Limit source types used as context for answering queries.
             Defaults to using all source types.
+        faq_min_certainty: Only relevant with the FAQ_LOOKUP feature, certainty the nearest FAQ question must reach
+            for its stored answer to be returned instead of running the query
+        router: Only relevant with the QUERY_ROUTING feature, decides which questions are planned.
+            Defaults to a router using heuristics only.
+        max_query_concurrency: Maximum number of queries of a query plan searched and answered at once
+        re_ranking_weights: Re-ranking weights overriding the ReRankingWeights defaults, by weight name
+        default_deadline_seconds: Time budget of the queries run without a deadline. Defaults to no time limit.
     """
 
     def __init__(
@@ -49,7 +97,12 @@ class SearchAgent:
             reasoning_llm: langchain.chat_models.ChatOpenAI,
             qa_llm: langchain.chat_models.ChatOpenAI | None = None,
             features: list["SearchAgentFeatures"] | None = None,
-            include_source_types: list[SOURCE_TYPE] | None = None
+            include_source_types: list[SOURCE_TYPE] | None = None,
+            faq_min_certainty: float = DEFAULT_FAQ_MIN_CERTAINTY,
+            router: query_router.QueryRouter | None = None,
+            max_query_concurrency: int = DEFAULT_MAX_QUERY_CONCURRENCY,
+            re_ranking_weights: dict[str, float] | None = None,
+            default_deadline_seconds: float | None = None
     ):
         self._weaviate_search_engine = weaviate_search_engine
         # self._university_type_filter = university
@@ -58,12 +111,16 @@ class SearchAgent:
         self._features = features or []
 
         self._include_source_types = include_source_types
+        self._faq_min_certainty = faq_min_certainty
+        self._router = router or query_router.QueryRouter()
+        self._max_query_concurrency = max_query_concurrency
+        self._re_ranking_weights = search_parameter_gen.ReRankingWeights(**(re_ranking_weights or {}))
+        self._default_deadline_seconds = default_deadline_seconds
+        # Moving average of query planning latency, used to estimate the latency saved by skipping planning
+        self._mean_planning_latency: float | None = None
 
         self._source_type_filter = self._build_source_type_filter()
 
-        # LLM used when prompt size is larger than the QA LLM supported context size
-        self._fallback_qa_llm_model_name = "gpt-3.5-turbo-16k"
-        # self._fallback_qa_llm_model_name = "gpt-4-32k"
         # Get the max context sizes for LLMs
         self._reasoning_llm_context_size = openai_utils.openai_modelname_to_contextsize(
             self._reasoning_llm.model_name
@@ -71,9 +128,6 @@ class SearchAgent:
         self._qa_llm_context_size = openai_utils.openai_modelname_to_contextsize(
             self._qa_llm.model_name
         )
-        self._fallback_qa_llm_context_size = openai_utils.openai_modelname_to_contextsize(
-            self._fallback_qa_llm_model_name
-        )
 
     async def run(
             self,
@@ -81,7 +135,8 @@ class SearchAgent:
             university: str,
             current_profile_info: dict,
             profile_info_vector: list[float],
-            context: "Context" = None
+            context: "Context" = None,
+            deadline: deadlines.Deadline | None = None
     ) -> "AgentResult":
         """Get an answer to a query by searching for information then generating response
 
@@ -91,58 +146,310 @@ class SearchAgent:
             current_profile_info: The current profile information for the user.
             profile_info_vector: The current profile information for the user.
             context: Context related to the query used for disambiguation
+            deadline: Time the answer must be returned by. The agent skips planning, skips re-formatting or answers
+                with the retrieved sources alone as needed to meet it. Defaults to the default_deadline_seconds
+                of the agent.
 
         Returns:
             An AgentResult object which contains the answer, sources used and various debug details
         """
-        with langchain.callbacks.get_openai_callback() as cb:
-            # Default query plan consists of just the original query passed to run()
-            query_plan = query_planning.QueryPlan(
-                query_graph=[
-                    query_planning.Query(
-                        id=1,
-                        question=query,
-                        sub_queries=[]
+        async for event in self.stream(
+            query=query,
+            university=university,
+            current_profile_info=current_profile_info,
+            profile_info_vector=profile_info_vector,
+            context=context,
+            deadline=deadline
+        ):
+            if event.type == AgentEventType.RESULT:
+                return event.data
+
+    async def stream(
+            self,
+            query: str,
+            university: str,
+            current_profile_info: dict,
+            profile_info_vector: list[float],
+            context: "Context" = None,
+            deadline: deadlines.Deadline | None = None
+    ) -> typing.AsyncIterator["AgentEvent"]:
+        """Get an answer to a query like run(), as a stream of events emitted as soon as each step is done.
+
+        Events are emitted in this order: PLAN once the query plan is ready, SOURCES as each query's search
+        results are found, TOKEN for each token of the answer as it is generated, ANSWER with the formatted
+        answer, FINAL_SOURCES with every source used, and RESULT with the AgentResult returned by run().
+        Only the answer of the root query is streamed token by token. When the answer is not generated by the
+        QA LLM (FAQ lookup, single round trip generation), no TOKEN events are emitted.
+
+        Args:
+            query: The query posed as a question
+            university: The university to search for information in
+            current_profile_info: The current profile information for the user.
+            profile_info_vector: The current profile information for the user.
+            context: Context related to the query used for disambiguation
+            deadline: Time the answer must be returned by, see run()
+
+        Yields:
+            AgentEvent objects
+        """
+        if deadline is None and self._default_deadline_seconds:
+            deadline = deadlines.Deadline.after(self._default_deadline_seconds)
+
+        events: asyncio.Queue[AgentEvent] = asyncio.Queue()
+        run_task = asyncio.create_task(self._run(
+            query=query,
+            university=university,
+            current_profile_info=current_profile_info,
+            profile_info_vector=profile_info_vector,
+            context=context,
+            events=events,
+            deadline=deadline
+        ))
+        try:
+            while True:
+                next_event = asyncio.ensure_future(events.get())
+                await asyncio.wait({next_event, run_task}, return_when=asyncio.FIRST_COMPLETED)
+                if not next_event.done():
+                    next_event.cancel()
+                    break
+                yield next_event.result()
+
+            # Emit the events put right before the run finished
+            while not events.empty():
+                yield events.get_nowait()
+
+            # Raises the exception of the run, if any
+            yield AgentEvent(type=AgentEventType.RESULT, data=run_task.result())
+        finally:
+            # Stop the run if the consumer stops listening, e.g. the client disconnected
+            run_task.cancel()
+
+    @tracing.traced("search_agent")
+    async def _run(
+            self,
+            query: str,
+            university: str,
+            current_profile_info: dict,
+            profile_info_vector: list[float],
+            context: "Context",
+            events: "asyncio.Queue[AgentEvent]",
+            deadline: deadlines.Deadline | None = None
+    ) -> "AgentResult":
+        """Get an answer to a query, putting the events of stream() on the events queue as it goes"""
+        degradations = []
+        # Default query plan consists of just the original query passed to run()
+        query_plan = query_planning.QueryPlan(
+            query_graph=[
+                query_planning.Query(
+                    id=1,
+                    question=query,
+                    sub_queries=[]
+                )
+            ]
+        )
+
+        # Common questions are answered from the FAQ index, skipping planning, search and generation
+        if self.is_enabled(SearchAgentFeatures.FAQ_LOOKUP):
+            faq_result = None
+            if deadline and not deadline.has_time_for(MIN_FAQ_LOOKUP_SECONDS, reserve=EXECUTION_RESERVE_SECONDS):
+                logger.warning("Not enough time left to look up the FAQ index, running the query")
+            else:
+                try:
+                    faq_result = await deadlines.run_within(
+                        deadline,
+                        self._lookup_faq(query=query, query_plan=query_plan, university=university, context=context),
+                        reserve=EXECUTION_RESERVE_SECONDS
                     )
-                ]
-            )
+                except asyncio.TimeoutError:
+                    logger.warning("FAQ lookup ran out of time, running the query")
+            if faq_result:
+                events.put_nowait(AgentEvent(type=AgentEventType.ANSWER, data=faq_result.answer))
+                events.put_nowait(AgentEvent(type=AgentEventType.FINAL_SOURCES, data=faq_result.sources))
+                return faq_result
+
+        speculative_search = None
+        with langchain.callbacks.get_openai_callback() as cb:
             # If query planning feature is enabled, auto generate a query plan
+            routing_decision = None
             if self.is_enabled(SearchAgentFeatures.QUERY_PLANNING):
-                query_plan = await self.build_query_plan(query=query)
+                # Only plan questions that need to be decomposed
+                # Routing is only worth it when there is time to plan after it, otherwise planning is skipped anyway
+                if self.is_enabled(SearchAgentFeatures.QUERY_ROUTING) and (
+                        deadline is None or deadline.has_time_for(
+                            MIN_ROUTING_SECONDS + MIN_PLANNING_SECONDS, reserve=EXECUTION_RESERVE_SECONDS
+                        )
+                ):
+                    try:
+                        routing_decision = await deadlines.run_within(
+                            deadline,
+                            self._route_query(query=query),
+                            reserve=MIN_PLANNING_SECONDS + EXECUTION_RESERVE_SECONDS
+                        )
+                    except asyncio.TimeoutError:
+                        logger.warning("Query routing ran out of time")
+
+                needs_planning = routing_decision is None or routing_decision.needs_planning
+                # Without enough time to plan and then execute the plan, the original question is answered directly
+                if needs_planning and deadline \
+                        and not deadline.has_time_for(MIN_PLANNING_SECONDS, reserve=EXECUTION_RESERVE_SECONDS):
+                    logger.warning("Not enough time left to plan the query, answering the original question directly")
+                    degradations.append(Degradation.SKIPPED_PLANNING)
+                elif needs_planning:
+                    # The original question is inserted at the root of every plan, so its search (and embedding)
+                    # is started while the planner is running instead of after it
+                    if self.is_enabled(SearchAgentFeatures.SPECULATIVE_RETRIEVAL):
+                        speculative_search = asyncio.create_task(self.search_queries(
+                            queries=query_plan.query_graph,
+                            university=university,
+                            profile_info_vector=profile_info_vector
+                        ))
+
+                    planning_start_time = time.time()
+                    try:
+                        query_plan = await deadlines.run_within(
+                            deadline,
+                            self.build_query_plan(query=query),
+                            reserve=EXECUTION_RESERVE_SECONDS
+                        )
+                        self._record_planning_latency(time.time() - planning_start_time)
+                    except asyncio.TimeoutError:
+                        logger.warning("Query planning ran out of time, answering the original question directly")
+                        degradations.append(Degradation.SKIPPED_PLANNING)
+                    except BaseException:
+                        if speculative_search:
+                            speculative_search.cancel()
+                        raise
 
             logger.info(f"Query plan: {query_plan}")
+            events.put_nowait(AgentEvent(type=AgentEventType.PLAN, data=query_plan))
 
-            # Execute the query plan
-            query_plan_results = await self.execute_query_plan(
-                query_plan=query_plan,
-                university=university,
-                current_profile_info=current_profile_info,
-                profile_info_vector=profile_info_vector,
-                context=context
+            # A plan of a single query can be searched and answered by Weaviate in one request
+            single_round_trip = (
+                self.is_enabled(SearchAgentFeatures.SINGLE_ROUND_TRIP_GENERATION)
+                and len(query_plan.query_graph) == 1
             )
 
+            # The speculative search is only valid for the original question, discard it if the planner rewrote it
+            prefetched_searches = {}
+            if speculative_search:
+                root_query_id = query_plan.get_root_query_id()
+                root_question = next(q.question for q in query_plan.query_graph if q.id == root_query_id)
+                if single_round_trip:
+                    # Weaviate searches again as part of the single round trip request
+                    speculative_search.cancel()
+                elif root_question == query:
+                    prefetched_searches[query] = speculative_search
+                    logger.info("Reusing the speculative search of the original question")
+                else:
+                    speculative_search.cancel()
+                    logger.info("Discarding the speculative search, the planner rewrote the original question")
+
+            # Sources found so far, answered with directly if generating the answer runs out of time
+            retrieved_sources = source_aggregation.SourceAggregator()
+            try:
+                if single_round_trip:
+                    root_query = query_plan.query_graph[0]
+                    query_plan_results = {
+                        root_query.id: await deadlines.run_within(
+                            deadline,
+                            self.execute_single_round_trip_query(
+                                query=root_query,
+                                university=university,
+                                profile_info_vector=profile_info_vector
+                            ),
+                            reserve=RETRIEVAL_ONLY_RESERVE_SECONDS
+                        )
+                    }
+                    events.put_nowait(AgentEvent(
+                        type=AgentEventType.SOURCES,
+                        data=(root_query.id, query_plan_results[root_query.id].sources)
+                    ))
+                else:
+                    # Execute the query plan
+                    query_plan_results = await deadlines.run_within(
+                        deadline,
+                        self.execute_query_plan(
+                            query_plan=query_plan,
+                            university=university,
+                            current_profile_info=current_profile_info,
+                            profile_info_vector=profile_info_vector,
+                            context=context,
+                            events=events,
+                            prefetched_searches=prefetched_searches,
+                            retrieved_sources=retrieved_sources
+                        ),
+                        reserve=RETRIEVAL_ONLY_RESERVE_SECONDS
+                    )
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"Answering the query plan ran out of time, answering with {len(retrieved_sources)} retrieved sources"
+                )
+                degradations.append(Degradation.RETRIEVAL_ONLY)
+                query_plan_results = None
+            finally:
+                # Stop the speculative search if it was never awaited, e.g. when the plan execution failed
+                if speculative_search and not speculative_search.done():
+                    speculative_search.cancel()
+
             # Capture the total number of LLM tokens used over the course of query plan execution
             total_tokens_used = cb.total_tokens
             total_tokens_cost = cb.total_cost
 
         # Get the result for the root query in the query plan which will be the original query passed to this run()
         root_query_id = query_plan.get_root_query_id()
+        if query_plan_results is None:
+            return self._build_retrieval_only_result(
+                query=query,
+                query_plan=query_plan,
+                sources=retrieved_sources.sources,
+                context=context,
+                events=events,
+                total_tokens_used=total_tokens_used,
+                total_tokens_cost=total_tokens_cost,
+                routing_decision=routing_decision,
+                degradations=degradations
+            )
         root_query_result = query_plan_results[root_query_id]
 
         # Get list of all sources used in the execution of query plan
-        all_sources = []
+        source_aggregator = source_aggregation.SourceAggregator()
         for _, query_result in query_plan_results.items():
-            for source in query_result.sources:
-                if source not in all_sources:
-                    all_sources.append(source)
+            source_aggregator.add(query_result.sources)
+        all_sources = source_aggregator.sources
 
-        formatted_answer = await answer_formatting.format_answer(
-            generated_answer=root_query_result.result,
-            sources=all_sources,
-            llm=self._qa_llm,
-            fallback_llm=self._reasoning_llm,
-            query=query,
+        # The formatting rules are part of the generation prompt, the prefix and lists are fixed up locally
+        formatted_answer = answer_formatting.post_process_answer(
+            answer=root_query_result.result,
+            num_sources=len(all_sources)
         )
+        formatting_problems = answer_formatting.validate_answer(answer=formatted_answer, question=query)
+        if formatting_problems and self.is_enabled(SearchAgentFeatures.LLM_ANSWER_FORMATTING_FALLBACK) \
+                and deadline and not deadline.has_time_for(MIN_FORMATTING_SECONDS):
+            logger.info(f"Answer breaks formatting rules ({', '.join(formatting_problems)}), no time left to re-format it")
+            degradations.append(Degradation.SKIPPED_FORMATTING)
+        elif formatting_problems and self.is_enabled(SearchAgentFeatures.LLM_ANSWER_FORMATTING_FALLBACK):
+            logger.info(f"Answer breaks formatting rules ({', '.join(formatting_problems)}), re-formatting it with LLM")
+            try:
+                formatted_answer = answer_formatting.post_process_answer(
+                    answer=await deadlines.run_within(
+                        deadline,
+                        answer_formatting.format_answer(
+                            generated_answer=formatted_answer,
+                            sources=all_sources,
+                            llm=self._qa_llm,
+                            fallback_llm=self._reasoning_llm,
+                            query=query,
+                        )
+                    ),
+                    num_sources=len(all_sources)
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Re-formatting the answer ran out of time, keeping the generated answer")
+                degradations.append(Degradation.SKIPPED_FORMATTING)
+        elif formatting_problems:
+            logger.info(f"Answer breaks formatting rules: {', '.join(formatting_problems)}")
+        events.put_nowait(AgentEvent(type=AgentEventType.ANSWER, data=formatted_answer))
+        events.put_nowait(AgentEvent(type=AgentEventType.FINAL_SOURCES, data=all_sources))
 
         return AgentResult(
             query=query,
@@ -153,7 +460,154 @@ class SearchAgent:
             features=self._features,
             context=context,
             total_tokens_used=total_tokens_used,
-            total_tokens_cost=total_tokens_cost
+            total_tokens_cost=total_tokens_cost,
+            routing_decision=routing_decision,
+            degradations=degradations
+        )
+
+    def _build_retrieval_only_result(
+            self,
+            query: str,
+            query_plan: query_planning.QueryPlan,
+            sources: list[weaviate_search_engine.SearchResult],
+            context: "Context",
+            events: "asyncio.Queue[AgentEvent]",
+            total_tokens_used: int,
+            total_tokens_cost: float,
+            routing_decision: query_router.RoutingDecision | None,
+            degradations: list["Degradation"]
+    ) -> "AgentResult":
+        """Answer with the sources retrieved for a query plan alone, when there is no time left to generate an answer"""
+        # Sources are aggregated in the order their queries were searched in, rank them by relevance instead
+        sources = sorted(sources, key=lambda source: source.score if source.score is not None else 0, reverse=True)
+        answer = answer_formatting.build_retrieval_only_answer(sources=sources)
+        sources = sources[:answer_formatting.RETRIEVAL_ONLY_NUM_SOURCES]
+        events.put_nowait(AgentEvent(type=AgentEventType.ANSWER, data=answer))
+        events.put_nowait(AgentEvent(type=AgentEventType.FINAL_SOURCES, data=sources))
+
+        root_query_id = query_plan.get_root_query_id()
+        root_query = next(query for query in query_plan.query_graph if query.id == root_query_id)
+        return AgentResult(
+            query=query,
+            answer=answer,
+            sources=sources,
+            query_plan=query_plan,
+            query_plan_results={
+                root_query_id: query_planning.QueryResult(
+                    query=root_query,
+                    result=answer,
+                    sources=sources,
+                    search_parameters={}
+                )
+            },
+            features=self._features,
+            context=context,
+            total_tokens_used=total_tokens_used,
+            total_tokens_cost=total_tokens_cost,
+            routing_decision=routing_decision,
+            degradations=degradations
+        )
+
+    @tracing.traced("routing")
+    async def _route_query(self, query: str) -> query_router.RoutingDecision:
+        """Decide whether the query needs to be decomposed by the query planner
+
+        Args:
+            query: The query posed as a question
+
+        Returns:
+            The routing decision, with the estimated latency saved when planning is skipped
+        """
+        question_vector = None
+        if self._router.uses_embeddings and not self._router.match_heuristics(query):
+            loop = asyncio.get_running_loop()
+            try:
+                question_vector = await loop.run_in_executor(
+                    None,
+                    tracing.in_current_context(
+                        lambda: self._weaviate_search_engine.embed_query(query.replace('\n', ' '))
+                    )
+                )
+            except Exception as e:
+                logger.warning(f"Failed to embed query for routing, falling back to planning: {e}")
+
+        routing_decision = self._router.route(question=query, question_vector=question_vector)
+        if not routing_decision.needs_planning:
+            routing_decision.saved_latency = self._mean_planning_latency
+
+        logger.info(
+            f"Query routing: needs_planning={routing_decision.needs_planning}, "
+            f"probability={round(routing_decision.probability, 3)}, reason={routing_decision.reason}"
+            + (
+                f", saved ~{round(routing_decision.saved_latency, 2)} seconds of planning"
+                if routing_decision.saved_latency is not None else ""
+            )
+        )
+
+        return routing_decision
+
+    def _record_planning_latency(self, planning_latency: float):
+        """Update the moving average of query planning latency"""
+        if self._mean_planning_latency is None:
+            self._mean_planning_latency = planning_latency
+        else:
+            self._mean_planning_latency = 0.9 * self._mean_planning_latency + 0.1 * planning_latency
+
+    @tracing.traced("faq_lookup")
+    async def _lookup_faq(
+            self,
+            query: str,
+            query_plan: query_planning.QueryPlan,
+            university: str,
+            context: "Context"
+    ) -> "AgentResult | None":
+        """Get the stored answer of the FAQ question nearest to the query, if it is near enough
+
+        Args:
+            query: The query posed as a question
+            query_plan: The default query plan of the query, reported as the plan of the FAQ answer
+            university: The university to search for information in
+            context: Context related to the query
+
+        Returns:
+            An AgentResult with the stored answer and sources, None if the query has to be run
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            faq_answer = await loop.run_in_executor(
+                None,
+                tracing.in_current_context(lambda: self._weaviate_search_engine.search_faq(
+                    query_str=query,
+                    university=university,
+                    min_certainty=self._faq_min_certainty
+                ))
+            )
+        except Exception as e:
+            # The FAQ index is an optimization, a failed lookup falls back to running the query
+            logger.warning(f"FAQ lookup failed: {e}")
+            return None
+
+        if not faq_answer:
+            return None
+
+        root_query = query_plan.query_graph[0]
+        return AgentResult(
+            query=query,
+            answer=faq_answer.answer,
+            sources=faq_answer.search_results,
+            query_plan=query_plan,
+            query_plan_results={
+                root_query.id: query_planning.QueryResult(
+                    query=root_query,
+                    result=faq_answer.answer,
+                    sources=faq_answer.search_results,
+                    search_parameters={}
+                )
+            },
+            features=self._features,
+            context=context,
+            total_tokens_used=0,
+            total_tokens_cost=0
         )
 
     async def execute_query_plan(
@@ -162,7 +616,10 @@ class SearchAgent:
             university: str,
             current_profile_info: dict,
             profile_info_vector: list[float],
-            context: "Context"
+            context: "Context",
+            events: "asyncio.Queue[AgentEvent] | None" = None,
+            prefetched_searches: dict[str, asyncio.Task] | None = None,
+            retrieved_sources: source_aggregation.SourceAggregator | None = None
     ) -> dict[int, query_planning.QueryResult]:
         """Executes the queries in the query plan in the correct order.
 
@@ -172,50 +629,125 @@ class SearchAgent:
             current_profile_info: The current profile information for the user.
             profile_info_vector:
             context: Context in which to run queries
+            events: Optional queue the SOURCES events and the TOKEN events of the root query's answer are put on
+            prefetched_searches: Searches started before the plan was built, keyed by question. Each is a task
+                returning the output of search_queries() for that single question, used instead of searching again.
+            retrieved_sources: Optional aggregator the sources of each query are added to as soon as they are found
 
         Returns:
             Dictionary mapping query ID to query result for each query in the query plan.
         """
+        # Validates the plan, raising on circular or missing dependencies
         execution_order: list[int] = query_plan.get_execution_order()
+        root_query_id = query_plan.get_root_query_id()
         queries: dict[int, query_planning.Query] = {q.id: q for q in query_plan.query_graph}
         query_results: dict[int: query_planning.QueryResult] = {}
-        while True:
-            ready_to_execute = [
-                queries[task_id]
-                for task_id in execution_order
-                if task_id not in query_results
-                   and all(
-                    sub_query_id in query_results for sub_query_id in queries[task_id].sub_queries
+
+        # Each query is launched as soon as all of its sub-queries are answered, so a slow query only delays the
+        # queries that depend on it
+        remaining_sub_queries = {query_id: set(queries[query_id].sub_queries) for query_id in execution_order}
+        parent_queries = {query_id: [] for query_id in execution_order}
+        for query in queries.values():
+            for sub_query_id in query.sub_queries:
+                parent_queries[sub_query_id].append(query.id)
+
+        semaphore = asyncio.Semaphore(self._max_query_concurrency)
+        plan_start_time = time.perf_counter()
+
+        @tracing.traced("query")
+        async def execute_node(
+                query: query_planning.Query,
+                search: asyncio.Task,
+                search_index: int
+        ) -> query_planning.QueryResult:
+            tracing.set_attributes(query_id=query.id, question=query.question)
+            ready_time = time.perf_counter() - plan_start_time
+            async with semaphore:
+                start_time = time.perf_counter() - plan_start_time
+                # The search is shared with the queries that became ready at the same time, it isn't cancelled with
+                # this query
+                sources, search_parameters = (await asyncio.shield(search))[search_index]
+                search_end_time = time.perf_counter() - plan_start_time
+                if retrieved_sources is not None:
+                    retrieved_sources.add(sources)
+                if events is not None:
+                    events.put_nowait(AgentEvent(type=AgentEventType.SOURCES, data=(query.id, sources)))
+
+                query_result = await self.execute_query(
+                    query=query,
+                    university=university,
+                    current_profile_info=current_profile_info,
+                    profile_info_vector=profile_info_vector,
+                    sub_query_results=query_planning.QueryResults(
+                        results=[query_results[sub_query_id] for sub_query_id in query.sub_queries]
+                    ),
+                    context=context,
+                    sources=sources,
+                    search_parameters=search_parameters,
+                    format_answer=query.id == root_query_id,
+                    events=events if query.id == root_query_id else None
                 )
+
+            query_result.timing = query_planning.QueryTiming(
+                ready_time=ready_time,
+                start_time=start_time,
+                search_end_time=search_end_time,
+                end_time=time.perf_counter() - plan_start_time
+            )
+            return query_result
+
+        running_tasks: dict[asyncio.Task, int] = {}
+        search_tasks: list[asyncio.Task] = []
+        prefetched_searches = prefetched_searches or {}
+
+        def launch_ready_queries():
+            ready_queries = [
+                queries[query_id] for query_id in execution_order
+                if not remaining_sub_queries[query_id] and query_id not in query_results
+                and query_id not in running_tasks.values()
             ]
-            logger.info(f"Queries ready to execute: {ready_to_execute}")
-
-            computed_query_results: list[query_planning.QueryResult] = await asyncio.gather(
-                *[
-                    self.execute_query(
-                        query=query,
-                        university=university,
-                        current_profile_info=current_profile_info,
-                        profile_info_vector=profile_info_vector,
-                        sub_query_results=query_planning.QueryResults(
-                            results=[
-                                result
-                                for result in query_results.values()
-                                if result.query.id in query.sub_queries
-                            ]
-                        ),
-                        context=context
-                    )
-                    for query in ready_to_execute
-                ]
+            if not ready_queries:
+                return
+
+            # The queries that became ready at the same time, e.g. all the leaf queries of the plan, are searched in a
+            # single batched request
+            search = asyncio.create_task(self._search_queries_with_prefetched(
+                queries=ready_queries,
+                university=university,
+                profile_info_vector=profile_info_vector,
+                prefetched_searches=prefetched_searches
+            ))
+            search_tasks.append(search)
+            for search_index, query in enumerate(ready_queries):
+                logger.info(f"Query ready to execute: {query}")
+                running_tasks[asyncio.create_task(execute_node(query, search=search, search_index=search_index))] = \
+                    query.id
+
+        try:
+            launch_ready_queries()
+            while running_tasks:
+                done_tasks, _ = await asyncio.wait(running_tasks, return_when=asyncio.FIRST_COMPLETED)
+                for done_task in done_tasks:
+                    query_id = running_tasks.pop(done_task)
+                    query_results[query_id] = done_task.result()
+                    for parent_query_id in parent_queries[query_id]:
+                        remaining_sub_queries[parent_query_id].discard(query_id)
+                launch_ready_queries()
+        finally:
+            # Stop the other queries when one of them fails
+            for running_task in [*running_tasks, *search_tasks]:
+                running_task.cancel()
+
+        logger.info(
+            "Query plan timing: " + ", ".join(
+                f"{query_id}: {query_result.timing.start_time:.2f}-{query_result.timing.end_time:.2f}s"
+                for query_id, query_result in query_results.items()
             )
-            for query_result in computed_query_results:
-                query_results[query_result.query.id] = query_result
-            if len(query_results) == len(execution_order):
-                break
+        )
 
         return query_results
 
+    @tracing.traced("generation")
     async def execute_query(
             self,
             query: query_planning.Query,
@@ -223,7 +755,11 @@ class SearchAgent:
             sub_query_results: query_planning.QueryResults,
             current_profile_info: dict,
             profile_info_vector: list[float],
-            context: "Context"
+            context: "Context",
+            sources: list[weaviate_search_engine.SearchResult] | None = None,
+            search_parameters: dict | None = None,
+            format_answer: bool = False,
+            events: "asyncio.Queue[AgentEvent] | None" = None
     ) -> query_planning.QueryResult:
         """Execute a query in the query plan.
 
@@ -235,57 +771,22 @@ class SearchAgent:
             current_profile_info: The current profile information for the user.
             profile_info_vector:
             context: Context in which to run the query
+            sources: Re-ranked sources already retrieved for this query (see search_queries()).
+                If not provided, a search is run for the query.
+            search_parameters: The search parameters used to retrieve the provided sources
+            format_answer: Ask the LLM to follow the answer formatting rules, only needed for the answer shown
+                to the student (the root query's)
+            events: Optional queue a TOKEN event is put on for each token of the answer as it is generated
 
         Returns:
             A QueryResult object which is a container for the generated answer with sources used.
         """
-        # If the automatic search param generation feature is enabled, use LLM to pick optimal params
-
-        if self.is_enabled(SearchAgentFeatures.AUTO_SEARCH_PARAMETER_GEN):
-            search_parameters = await self._generate_search_parameters(query=query.question)
-        else:
-            search_parameters = search_parameter_gen.SearchParameters().dict()
-
-        # Number of search results used to generate answer
-        num_results_for_gen = search_parameters["top_k"]
-
-        search_parameters["personalized_info_vector"] = profile_info_vector
-
-        search_parameters["filters"] = {"university": university}
-
-        # If the cross encoder re-ranking feature is enabled, increase number of search
-        # results retrieved from search engine to cast a wider initial net.
-        if self.is_enabled(SearchAgentFeatures.CROSS_ENCODER_RE_RANKING):
-            search_parameters["top_k"] = 50
-
-        # If the Agent is configured to only use specific source types, apply the filter to the search query
-        if self._source_type_filter:
-            search_parameters["filters"].append(self._source_type_filter)
-
-        # Get main loop so the synchronous Weaviate search function can be
-        # run async in the default loop's executor (ThreadPoolExecutor)
-        loop = asyncio.get_running_loop()
-        sources = await loop.run_in_executor(
-            None,
-            lambda: self._weaviate_search_engine.search(
-                query_str=query.question,
-                re_rank=self.is_enabled(SearchAgentFeatures.CROSS_ENCODER_RE_RANKING),
-                **search_parameters
+        if sources is None:
+            [(sources, search_parameters)] = await self.search_queries(
+                queries=[query],
+                university=university,
+                profile_info_vector=profile_info_vector
             )
-        )
-
-        # Re-rank and get top K sources
-        sources = self._re_rank(sources=sources, top_k=num_results_for_gen)
-
-        # Build up the sources context string from the sources returned by search
-        source_texts = []
-        for source in sources:
-            # For CSV data, only take the first 10k characters so as to not exceed context token limit with large CSVs
-            source_texts.append(source.text)
-        sources_context = "\n\n".join([
-            f'Search Result {idx + 1}:\n"""\n{source_text}\n"""'
-            for idx, source_text in enumerate(source_texts)
-        ])
 
         # If this query has results for sub-queries, use those as context as well
         sub_query_results_context = "\n\n".join([
@@ -300,10 +801,7 @@ class SearchAgent:
 
         # First system message explains to LLM its role and the job to be done.
         role_prompt_message = langchain.schema.SystemMessage(
-            content="You are a helpful, knowledgeable and confident university chatbot. "
-                    "Your task is to respond to the student's question with a helpful, "
-                    "accurate and concise answer based only on the information that can be "
-                    "found in the university data. Before answering the student's question, "
+            content=f"{QA_ROLE_PROMPT} Before answering the student's question, "
                     "first search for supporting information from the university's data."
         )
 
@@ -311,11 +809,16 @@ class SearchAgent:
         question_prompt_message = langchain.schema.HumanMessage(content=f"Question: {query.question}")
 
         # AI message (impersonate the AI) containing the search results
-        search_results_prompt_message = langchain.schema.AIMessage(
-            content="I searched the university's data for supporting information and found the "
-                    "following results related to your question. "
-                    f"The search results are in order of trustworthiness:\n{sources_context}"
-        )
+        def build_search_results_prompt_message(source_texts: list[str]) -> langchain.schema.AIMessage:
+            sources_context = "\n\n".join([
+                f'Search Result {idx + 1}:\n"""\n{source_text}\n"""'
+                for idx, source_text in enumerate(source_texts)
+            ])
+            return langchain.schema.AIMessage(
+                content="I searched the university's data for supporting information and found the "
+                        "following results related to your question. "
+                        f"The search results are in order of trustworthiness:\n{sources_context}"
+            )
 
         # AI message (impersonate the AI) containing answers to sub-queries
         sub_query_results_prompt_message = langchain.schema.AIMessage(
@@ -324,15 +827,21 @@ class SearchAgent:
         ) if sub_query_results_context else None
 
         # Another system message to re-enforce the rules of the AI's answer
-        answer_rules_prompt_message = langchain.schema.SystemMessage(
-            content=f"Use the above search results "
-                    f"{'and answers to related questions ' if sub_query_results_prompt_message else ''}"
-                    f"to provide a helpful, accurate and concise answer to the student's question. "
-                    f"If there is conflicting information between search results, "
-                    f"use the more trustworthy result (higher up in search results). "
-                    "If you can't answer the question, be honest and tell the student what information "
-                    "you were able to find and what information is missing to answer their question."
-        )
+        def build_answer_rules_prompt_message(num_sources: int) -> langchain.schema.SystemMessage:
+            return langchain.schema.SystemMessage(
+                content=f"Use the above search results "
+                        f"{'and answers to related questions ' if sub_query_results_prompt_message else ''}"
+                        f"to provide a helpful, accurate and concise answer to the student's question. "
+                        f"If there is conflicting information between search results, "
+                        f"use the more trustworthy result (higher up in search results). "
+                        "If you can't answer the question, be honest and tell the student what information "
+                        "you were able to find and what information is missing to answer their question."
+                        + (
+                            "\nThe answer must be formatted according to **ALL** the following rules.\n"
+                            f"{answer_formatting.build_formatting_rules(num_sources=num_sources)}"
+                            if format_answer else ""
+                        )
+            )
 
         # qa_convo_hist_msg_prompt_tmpl = langchain.prompts.SystemMessagePromptTemplate.from_template(
         #     template="""Related questions you previously answered:
@@ -351,43 +860,277 @@ class SearchAgent:
         #             f"{current_profile_info}"
         # )
 
-        # Create the artificial history of messages to prompt LLM
-        llm_prompt_messages = [
-            role_prompt_message,
-            question_prompt_message,
-            search_results_prompt_message,
-            # user_personal_information
-        ]
-        if sub_query_results_prompt_message:
-            llm_prompt_messages.append(sub_query_results_prompt_message)
-        llm_prompt_messages.append(answer_rules_prompt_message)
-
-        # If the prompt is too large for the LLM's max context size, automatically switch to a larger LLM.
+        def build_llm_prompt_messages(source_texts: list[str]) -> list[langchain.schema.BaseMessage]:
+            # Create the artificial history of messages to prompt LLM
+            llm_prompt_messages = [
+                role_prompt_message,
+                question_prompt_message,
+                build_search_results_prompt_message(source_texts),
+                # user_personal_information
+            ]
+            if sub_query_results_prompt_message:
+                llm_prompt_messages.append(sub_query_results_prompt_message)
+            llm_prompt_messages.append(build_answer_rules_prompt_message(num_sources=len(source_texts)))
+            return llm_prompt_messages
+
+        # Chunks of a page with consecutive indexes are given to the LLM as a single search result, so the text
+        # repeated between them by the splitter is only in the prompt once
+        sources = source_aggregation.merge_adjacent_chunks(sources)
+
+        # Fit as much of the most relevant sources as the QA LLM's context leaves room for after the rest of the
+        # prompt and the answer, so the prompt never exceeds the context size.
+        # Tokenizing is CPU bound, so it is run in the default loop's executor.
+        packed_context = await asyncio.get_running_loop().run_in_executor(
+            None,
+            tracing.in_current_context(lambda: self._pack_sources(
+                sources=sources,
+                prompt_messages_without_sources=build_llm_prompt_messages(source_texts=[])
+            ))
+        )
+        if packed_context.num_dropped_tokens:
+            logger.info(
+                f"Query {query.id} context packed {len(packed_context.sources)} of {len(sources)} sources in "
+                f"{packed_context.num_tokens}/{packed_context.token_budget} tokens: "
+                f"{packed_context.num_dropped_sources} dropped, {packed_context.num_truncated_sources} truncated, "
+                f"{packed_context.num_dropped_tokens} tokens left out"
+            )
+        llm_prompt_messages = build_llm_prompt_messages(source_texts=packed_context.texts)
         llm_override_params = {}
-        num_tokens_in_prompt = self._qa_llm.get_num_tokens_from_messages(llm_prompt_messages)
-        if num_tokens_in_prompt > (self._qa_llm_context_size - 500):
-            if num_tokens_in_prompt > (self._fallback_qa_llm_context_size - 500):
-                # TODO: Auto retry with fewer search results instead of throwing exception?
-                logger.warning(
-                    f"Query {query.id} prompt has {num_tokens_in_prompt} tokens which is larger "
-                    f"than maximum supported context size ({self._fallback_qa_llm_context_size})."
-                )
 
-            logger.warning(
-                f"Query {query.id} prompt has {num_tokens_in_prompt} tokens which is larger than "
-                f"the QA LLM's context size, switching to {self._fallback_qa_llm_model_name}."
-            )
-            llm_override_params = {"model": self._fallback_qa_llm_model_name}
+        qa_llm = self._qa_llm
+        if events is not None:
+            # Stream the answer tokens to the events queue as the LLM generates them
+            # copy() leaves out the fields excluded from serialization, which the LLM reads when it is called
+            qa_llm = self._qa_llm.copy(update={
+                "streaming": True,
+                "callbacks": self._qa_llm.callbacks,
+                "callback_manager": self._qa_llm.callback_manager,
+                "tags": self._qa_llm.tags
+            })
+            llm_override_params["callbacks"] = [TokenEventsCallbackHandler(events=events)]
 
-        llm_answer_message = await self._qa_llm.apredict_messages(messages=llm_prompt_messages, **llm_override_params)
+        llm_answer_message = await utils.apredict_messages(qa_llm, messages=llm_prompt_messages, **llm_override_params)
 
         return query_planning.QueryResult(
             query=query,
             result=llm_answer_message.content,
+            sources=packed_context.sources,
+            search_parameters=search_parameters,
+            packed_context=packed_context
+        )
+
+    @tracing.traced("context_packing")
+    def _pack_sources(
+            self,
+            sources: list[weaviate_search_engine.SearchResult],
+            prompt_messages_without_sources: list[langchain.schema.BaseMessage]
+    ) -> context_packing.PackedContext:
+        """Choose the sources that fit in the QA LLM's prompt, see context_packing.pack_sources()
+
+        Args:
+            sources: Re-ranked sources, most relevant first
+            prompt_messages_without_sources: The QA prompt with an empty list of search results
+
+        Returns:
+            PackedContext with the chosen sources
+        """
+        model_name = self._qa_llm.model_name
+        num_tokens_without_sources = tokenization.count_message_tokens(
+            [message.content for message in prompt_messages_without_sources],
+            model_name=model_name
+        )
+
+        # Token counts stored at ingestion are used instead of re-tokenizing the sources, when they were counted
+        # with the QA LLM's encoding
+        stored_num_tokens = (
+            {id(source): source.num_tokens for source in sources if source.num_tokens is not None}
+            if tokenization.has_ingestion_encoding(model_name) else {}
+        )
+
+        return context_packing.pack_sources(
             sources=sources,
+            token_budget=max(self._qa_llm_context_size - QA_ANSWER_RESERVED_TOKENS - num_tokens_without_sources, 0),
+            count_source_tokens=lambda source: (
+                stored_num_tokens[id(source)] if id(source) in stored_num_tokens
+                else tokenization.count_tokens(source.text, model_name=model_name)
+            ),
+            truncate_text=lambda text, num_tokens: tokenization.truncate_tokens(
+                text, num_tokens=num_tokens, model_name=model_name
+            )
+        )
+
+    @tracing.traced("single_round_trip")
+    async def execute_single_round_trip_query(
+            self,
+            query: query_planning.Query,
+            university: str,
+            profile_info_vector: list[float]
+    ) -> query_planning.QueryResult:
+        """Search for and answer a query with a single Weaviate request, using Weaviate's generative module.
+
+        The formatting rules are part of the grouped task, so this replaces both the search request and the QA LLM
+        call of the regular execution of a query.
+
+        Args:
+            query: The query to execute, it must not have sub-queries
+            university: The university to search for information in
+            profile_info_vector: The profile information vector for the user.
+
+        Returns:
+            The result of the query
+        """
+        search_parameters, num_results_for_gen = await self._build_search_parameters(
+            query=query.question,
+            university=university,
+            profile_info_vector=profile_info_vector
+        )
+        # Every search result is passed to the generative module, so don't cast a wider net for re-ranking
+        search_parameters["top_k"] = num_results_for_gen
+
+        loop = asyncio.get_running_loop()
+        answer = await loop.run_in_executor(
+            None,
+            tracing.in_current_context(lambda: self._weaviate_search_engine.ask(
+                ask_str=query.question,
+                **search_parameters,
+                re_rank=self.is_enabled(SearchAgentFeatures.CROSS_ENCODER_RE_RANKING),
+                grouped_task=self._build_grouped_task(question=query.question, num_sources=num_results_for_gen)
+            ))
+        )
+
+        return query_planning.QueryResult(
+            query=query,
+            result=answer.answer,
+            sources=answer.search_results,
             search_parameters=search_parameters
         )
 
+    @staticmethod
+    def _build_grouped_task(question: str, num_sources: int) -> str:
+        """Build the prompt Weaviate's generative module answers a question with, the search results are appended
+        to it as context.
+
+        Args:
+            question: The question to answer
+            num_sources: Number of search results the answer is generated from
+
+        Returns:
+            The grouped task prompt
+        """
+        return (
+            f"{QA_ROLE_PROMPT} The context is only visible to you, all the student will see is your answer. "
+            "If there is conflicting information in the context, use the information that comes first. "
+            "If you can't answer the question, be honest and tell the student what information "
+            "you were able to find and what information is missing to answer their question.\n"
+            "The answer must be formatted according to **ALL** the following rules.\n"
+            f"{answer_formatting.build_formatting_rules(num_sources=num_sources)}\n"
+            f"Question: {question}\n"
+            "Context: "
+        )
+
+    @tracing.traced("search")
+    async def search_queries(
+            self,
+            queries: list[query_planning.Query],
+            university: str,
+            profile_info_vector: list[float]
+    ) -> list[tuple[list[weaviate_search_engine.SearchResult], dict]]:
+        """Search for the information needed to answer each of the queries.
+
+        All the searches are sent to the search engine in a single batched request.
+
+        Args:
+            queries: The queries to search for
+            university: The university to search for information in
+            profile_info_vector: The profile information vector for the user.
+
+        Returns:
+            List of (re-ranked top k sources, search parameters) pairs, in the same order as the queries
+        """
+        tracing.set_attributes(num_queries=len(queries))
+        queries_search_parameters = await asyncio.gather(
+            *[
+                self._build_search_parameters(
+                    query=query.question,
+                    university=university,
+                    profile_info_vector=profile_info_vector
+                )
+                for query in queries
+            ]
+        )
+
+        # Get main loop so the synchronous Weaviate search function can be
+        # run async in the default loop's executor (ThreadPoolExecutor)
+        loop = asyncio.get_running_loop()
+        batched_sources = await loop.run_in_executor(
+            None,
+            tracing.in_current_context(lambda: self._weaviate_search_engine.batch_search(
+                queries=[
+                    (
+                        query.question,
+                        {
+                            **search_parameters,
+                            "re_rank": self.is_enabled(SearchAgentFeatures.CROSS_ENCODER_RE_RANKING)
+                        }
+                    )
+                    for query, (search_parameters, _) in zip(queries, queries_search_parameters)
+                ]
+            ))
+        )
+
+        # Re-rank and get top K sources for each query
+        return [
+            (
+                self._re_rank(sources=sources, top_k=num_results_for_gen),
+                search_parameters
+            )
+            for sources, (search_parameters, num_results_for_gen) in zip(batched_sources, queries_search_parameters)
+        ]
+
+    async def _search_queries_with_prefetched(
+            self,
+            queries: list[query_planning.Query],
+            university: str,
+            profile_info_vector: list[float],
+            prefetched_searches: dict[str, asyncio.Task]
+    ) -> list[tuple[list[weaviate_search_engine.SearchResult], dict]]:
+        """Like search_queries(), using the prefetched search of a query's question instead of searching for it.
+
+        Prefetched searches are removed from prefetched_searches once used. If a prefetched search failed, the query
+        is searched again.
+        """
+        prefetched_queries = [query for query in queries if query.question in prefetched_searches]
+        queries_to_search = [query for query in queries if query.question not in prefetched_searches]
+
+        async def await_prefetched(query: query_planning.Query):
+            try:
+                [search] = await prefetched_searches.pop(query.question)
+                return search
+            except Exception as e:
+                logger.warning(f"Prefetched search of query {query.id} failed, searching again: {e}")
+                [search] = await self.search_queries(
+                    queries=[query],
+                    university=university,
+                    profile_info_vector=profile_info_vector
+                )
+                return search
+
+        searched, *prefetched = await asyncio.gather(
+            self.search_queries(
+                queries=queries_to_search,
+                university=university,
+                profile_info_vector=profile_info_vector
+            ) if queries_to_search else asyncio.sleep(0, result=[]),
+            *[await_prefetched(query) for query in prefetched_queries]
+        )
+
+        searches = {
+            query.id: search
+            for query, search in zip([*queries_to_search, *prefetched_queries], [*searched, *prefetched])
+        }
+        return [searches[query.id] for query in queries]
+
+    @tracing.traced("planning")
     async def build_query_plan(self, query: str) -> query_planning.QueryPlan:
         """Build a computational graph of queries and sub-queries needed to answer the query.
 
@@ -412,7 +1155,8 @@ class SearchAgent:
             langchain.schema.HumanMessage(content=query),
         ]
 
-        llm_query_plan_response_message = await self._reasoning_llm.apredict_messages(
+        llm_query_plan_response_message = await utils.apredict_messages(
+            self._reasoning_llm,
             messages=llm_prompt_messages,
             functions=[query_planning.QueryPlan.openai_schema],
             function_call={"name": query_planning.QueryPlan.openai_schema["name"]},
@@ -424,6 +1168,7 @@ class SearchAgent:
 
         return query_plan
 
+    @tracing.traced("rerank")
     def _re_rank(
             self,
             sources: list[weaviate_search_engine.SearchResult],
@@ -431,11 +1176,15 @@ class SearchAgent:
     ) -> list[weaviate_search_engine.SearchResult]:
         """Re-rank search results then filter to top k.
 
-        The re-ranking is done by taking a weighted sum of 1 or more of the following:
+        The re-ranking is done by taking a weighted sum of the following, each normalized to a 0-1 range over the
+        search results, with the agent's re-ranking weights:
         - relevance score (returned by Weaviate as a result of keyword/vector/hybrid search + optional cross-encoder)
-        - number of references score (using # document references metric)
-        - update recency score (using the inverse of last updated time metric)
-        - content type score (weights certain type of content higher than others. Ex: document > message)
+        - number of references score (log of the number of pages linking to the result's page)
+        - update recency score (exponential decay of the age of the result's page)
+        - path depth score (pages closer to the root of their site are overviews, which rank higher)
+
+        Results missing a page feature (ingested before it was stored) are given the mean of the other results, so
+        the feature doesn't move them.
 
         Args:
             sources: List of search results to re-rank
@@ -444,25 +1193,47 @@ class SearchAgent:
         Returns:
             Top k search results
         """
-        scores = np.zeros(len(sources))
+        if not sources:
+            return []
+
+        weights = np.array(
+            [getattr(self._re_ranking_weights, name) for name in search_parameter_gen.RE_RANKING_WEIGHT_NAMES],
+            dtype=np.float64
+        )
 
-        # Relevance scores returned by Weaviate are always used to rank sources
-        relevance_scores = np.array([source.score for source in sources])
-        relevance_scores = self._normalize_values(relevance_scores)
-        # TODO: weights should be configurable
-        scores += relevance_scores * RELEVANCE_RE_RANKING_WEIGHT
+        now = time.time()
+        features = np.array(
+            [
+                [
+                    source.score,
+                    source.num_inbound_links,
+                    (now - self._parse_date(source.last_modified)) / 86400 if source.last_modified else None,
+                    source.path_depth
+                ]
+                for source in sources
+            ],
+            dtype=np.float64
+        )
+        # Columns are ordered as RE_RANKING_WEIGHT_NAMES, higher values are better after these transforms
+        features[:, 1] = np.log1p(features[:, 1])
+        features[:, 2] = 0.5 ** (np.maximum(features[:, 2], 0) / RECENCY_HALF_LIFE_DAYS)
+        features[:, 3] = -features[:, 3]
 
-        sources_with_scores = zip(sources, scores)
+        # Fill the missing features with the mean of their column, then min-max normalize each column
+        column_means = np.nanmean(np.where(np.isnan(features).all(axis=0), 0, features), axis=0)
+        features = np.where(np.isnan(features), column_means, features)
+        features = self._normalize_values(features)
 
-        re_ranked_sources = sorted(sources_with_scores, key=lambda x: x[1], reverse=True)
+        scores = features @ weights
 
-        top_k_sources = [source_with_score[0] for source_with_score in re_ranked_sources[:top_k]]
+        # Stable sort, so sources keep their search engine order on ties
+        re_ranked_ids = np.argsort(-scores, kind="stable")
 
-        return top_k_sources
+        return [sources[source_id] for source_id in re_ranked_ids[:top_k]]
 
     @staticmethod
     def _normalize_values(data: np.array) -> np.array:
-        """Normalize the values in a list to a range from 0 to 1.
+        """Normalize the values in a list, or in each column of a 2D array, to a range from 0 to 1.
 
         Normalization is based on minimum and maximum values present in the data.
 
@@ -472,12 +1243,58 @@ class SearchAgent:
         Returns:
             Normalized array of data values where each item is between 0 and 1
         """
-        min_val = np.min(data)
-        max_val = np.where(np.max(data) - min_val == 0, min_val + 0.001,
-                           np.max(data))  # 0.001 to avoid division by zero
+        min_val = np.min(data, axis=0)
+        max_val = np.where(np.max(data, axis=0) - min_val == 0, min_val + 0.001,
+                           np.max(data, axis=0))  # 0.001 to avoid division by zero
         normalized_data = (data - min_val) / (max_val - min_val)
         return normalized_data
 
+    @staticmethod
+    def _parse_date(date_str: str) -> float:
+        """Timestamp of an RFC 3339 date returned by Weaviate"""
+        return datetime.datetime.fromisoformat(date_str).timestamp()
+
+    async def _build_search_parameters(
+            self,
+            query: str,
+            university: str,
+            profile_info_vector: list[float]
+    ) -> tuple[dict, int]:
+        """Build the search parameters for a query.
+
+        Args:
+            query: The query to build search parameters for
+            university: The university to search for information in
+            profile_info_vector: The profile information vector for the user.
+
+        Returns:
+            Tuple of the search parameters that can be passed to WeaviateSearchEngine.search()
+            and the number of search results used to generate the answer
+        """
+        # If the automatic search param generation feature is enabled, use LLM to pick optimal params
+        if self.is_enabled(SearchAgentFeatures.AUTO_SEARCH_PARAMETER_GEN):
+            search_parameters = await self._generate_search_parameters(query=query)
+        else:
+            search_parameters = search_parameter_gen.SearchParameters().dict()
+
+        # Number of search results used to generate answer
+        num_results_for_gen = search_parameters["top_k"]
+
+        search_parameters["personalized_info_vector"] = profile_info_vector
+
+        search_parameters["filters"] = {"university": university}
+
+        # If the cross encoder re-ranking feature is enabled, increase number of search
+        # results retrieved from search engine to cast a wider initial net.
+        if self.is_enabled(SearchAgentFeatures.CROSS_ENCODER_RE_RANKING):
+            search_parameters["top_k"] = 50
+
+        # If the Agent is configured to only use specific source types, apply the filter to the search query
+        if self._source_type_filter:
+            search_parameters["filters"].append(self._source_type_filter)
+
+        return search_parameters, num_results_for_gen
+
     async def _generate_search_parameters(self, query: str) -> dict:
         """Generate optimal Weaviate query engine search parameters for the given query.
 
@@ -501,7 +1318,8 @@ class SearchAgent:
             langchain.schema.HumanMessage(content=f"Query: {query}"),
         ]
 
-        llm_search_params_response_message = await self._reasoning_llm.apredict_messages(
+        llm_search_params_response_message = await utils.apredict_messages(
+            self._reasoning_llm,
             messages=llm_prompt_messages,
             functions=[search_parameter_gen.SearchParameters.openai_schema],
             function_call={
@@ -554,12 +1372,61 @@ class SearchAgentFeatures(enum.Enum):
     AUTO_SEARCH_PARAMETER_GEN = "AUTO_SEARCH_PARAMETER_GEN"
     QUERY_PLANNING = "QUERY_PLANNING"
     CROSS_ENCODER_RE_RANKING = "CROSS_ENCODER_RE_RANKING"
+    FAQ_LOOKUP = "FAQ_LOOKUP"
+    SINGLE_ROUND_TRIP_GENERATION = "SINGLE_ROUND_TRIP_GENERATION"
+    QUERY_ROUTING = "QUERY_ROUTING"
+    LLM_ANSWER_FORMATTING_FALLBACK = "LLM_ANSWER_FORMATTING_FALLBACK"
+    SPECULATIVE_RETRIEVAL = "SPECULATIVE_RETRIEVAL"
     # Not implemented
     MESSAGE_DISAMBIGUATION = "MESSAGE_DISAMBIGUATION"
     AUTO_SEARCH_FILTER_GEN = "AUTO_SEARCH_FILTER_GEN"
     ADAPTIVE_QUERY_PLANNING = "ADAPTIVE_QUERY_PLANNING"
 
 
+class AgentEventType(str, enum.Enum):
+    """Types of the events emitted by SearchAgent.stream()"""
+    # data: the QueryPlan
+    PLAN = "plan"
+    # data: (query id, list of SearchResult found for the query)
+    SOURCES = "sources"
+    # data: a token of the root query's answer
+    TOKEN = "token"
+    # data: the formatted answer, which replaces the concatenated tokens
+    ANSWER = "answer"
+    # data: list of every SearchResult used to answer the query
+    FINAL_SOURCES = "final_sources"
+    # data: the AgentResult
+    RESULT = "result"
+
+
+class Degradation(str, enum.Enum):
+    """Stage of a query skipped or cut short to answer it within its deadline"""
+    # The original question was answered directly, without a query plan
+    SKIPPED_PLANNING = "skipped_planning"
+    # The answer breaks the formatting rules, it wasn't re-formatted by the LLM
+    SKIPPED_FORMATTING = "skipped_formatting"
+    # No answer was generated, the answer lists the most relevant sources retrieved
+    RETRIEVAL_ONLY = "retrieval_only"
+
+
+@dataclasses.dataclass
+class AgentEvent:
+    """Event emitted by SearchAgent.stream()"""
+    type: AgentEventType
+    data: typing.Any
+
+
+class TokenEventsCallbackHandler(langchain.callbacks.base.AsyncCallbackHandler):
+    """Callback handler putting each token generated by a streaming LLM on an events queue"""
+
+    def __init__(self, events: asyncio.Queue[AgentEvent]):
+        self._events = events
+
+    async def on_llm_new_token(self, token: str, **kwargs: typing.Any):
+        if token:
+            self._events.put_nowait(AgentEvent(type=AgentEventType.TOKEN, data=token))
+
+
 @dataclasses.dataclass
 class Context:
     """Container for context used by Agent to run a query"""
@@ -583,3 +1450,7 @@ class AgentResult:
     features: list[SearchAgentFeatures]
     total_tokens_used: int
     total_tokens_cost: int
+    # Only set when the QUERY_ROUTING feature decided whether to plan the query
+    routing_decision: query_router.RoutingDecision | None = None
+    # Stages skipped or cut short to answer within the deadline
+    degradations: list["Degradation"] = dataclasses.field(default_factory=list)
@@ -55,4 +55,38 @@ class SearchParameters(openai_schema.OpenAISchema):
     )
 
     class Config:
-        use_enum_values = True
\ No newline at end of file
+        use_enum_values = True
+
+
+class ReRankingWeights(pydantic.BaseModel):
+    """Weights the search agent re-ranks search results with.
+
+    Kept out of SearchParameters, the weights are tuned offline (see scripts/evaluate.py) and aren't picked by the LLM
+    generating search parameters. The page feature weights default to 0, so results are re-ranked on relevance only
+    until they are tuned.
+    """
+    relevance_weight: float = pydantic.Field(
+        default=1.0,
+        ge=0.0,
+        description="Weight of the relevance of search results to the query."
+    )
+    inbound_links_weight: float = pydantic.Field(
+        default=0.0,
+        ge=0.0,
+        description="Weight of the number of pages linking to a search result's page. "
+                    "Pages that many other pages link to are usually authoritative."
+    )
+    recency_weight: float = pydantic.Field(
+        default=0.0,
+        ge=0.0,
+        description="Weight of how recently a search result's page was updated."
+    )
+    path_depth_weight: float = pydantic.Field(
+        default=0.0,
+        ge=0.0,
+        description="Weight of how shallow a search result's page is in its site. "
+                    "Shallower pages are usually overviews, deeper pages are usually specific."
+    )
+
+
+RE_RANKING_WEIGHT_NAMES = tuple(ReRankingWeights.__fields__)
@@ -0,0 +1,112 @@
+import dataclasses
+
+import src.libs.search.weaviate_search_engine as weaviate_search_engine
+
+
+# Maximum number of characters two consecutive chunks of a page can overlap by (the text splitter's chunk overlap)
+MAX_CHUNK_OVERLAP = 400
+# Shorter overlaps are taken as a coincidence rather than text repeated by the splitter
+MIN_CHUNK_OVERLAP = 20
+# Separator of the texts of merged chunks that don't overlap
+CHUNK_SEPARATOR = "\n"
+
+
+def source_key(source: weaviate_search_engine.SearchResult) -> tuple:
+    """Identity of a source: its page and chunk index, or its text for sources that aren't chunks of a page"""
+    return source.url, source.index if source.index is not None else source.text
+
+
+class SourceAggregator:
+    """Collects the sources found for a query plan, deduplicating them in linear time.
+
+    Sources are identified by their page URL and chunk index. When the same chunk is found several times,
+    it is kept once, at the position it was first found, with the best score it was found with.
+    """
+
+    def __init__(self):
+        self._sources: dict[tuple, weaviate_search_engine.SearchResult] = {}
+
+    def add(self, sources: list[weaviate_search_engine.SearchResult]):
+        for source in sources:
+            key = source_key(source)
+            existing_source = self._sources.get(key)
+            if existing_source is None:
+                self._sources[key] = source
+            elif source.score is not None and (existing_source.score is None or source.score > existing_source.score):
+                self._sources[key] = dataclasses.replace(existing_source, score=source.score)
+
+    @property
+    def sources(self) -> list[weaviate_search_engine.SearchResult]:
+        """Distinct sources, in the order they were first found"""
+        return list(self._sources.values())
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+
+def merge_adjacent_chunks(sources: list[weaviate_search_engine.SearchResult]) -> list[weaviate_search_engine.SearchResult]:
+    """Deduplicate sources and merge the chunks of a page with consecutive indexes into a single source.
+
+    Each merged source takes the position of its best ranked chunk, the best score of its chunks and the index of its
+    first chunk. The overlap the text splitter leaves between consecutive chunks is only kept once.
+
+    Args:
+        sources: Ranked sources, most relevant first
+
+    Returns:
+        Ranked sources with adjacent chunks merged
+    """
+    aggregator = SourceAggregator()
+    aggregator.add(sources)
+    distinct_sources = aggregator.sources
+
+    # Group the chunks of each page into runs of consecutive indexes
+    rank_of_source = {id(source): rank for rank, source in enumerate(distinct_sources)}
+    chunks_by_url: dict[str, list[weaviate_search_engine.SearchResult]] = {}
+    merged_sources = []
+    for source in distinct_sources:
+        if source.index is None:
+            merged_sources.append((rank_of_source[id(source)], source))
+        else:
+            chunks_by_url.setdefault(source.url, []).append(source)
+
+    for chunks in chunks_by_url.values():
+        chunks.sort(key=lambda chunk: chunk.index)
+        runs = [[chunks[0]]]
+        for chunk in chunks[1:]:
+            if chunk.index == runs[-1][-1].index + 1:
+                runs[-1].append(chunk)
+            else:
+                runs.append([chunk])
+
+        for run in runs:
+            best_rank = min(rank_of_source[id(chunk)] for chunk in run)
+            merged_sources.append((best_rank, _merge_run(run) if len(run) > 1 else run[0]))
+
+    return [source for _, source in sorted(merged_sources, key=lambda ranked_source: ranked_source[0])]
+
+
+def _merge_run(chunks: list[weaviate_search_engine.SearchResult]) -> weaviate_search_engine.SearchResult:
+    """Merge chunks of a page with consecutive indexes, in index order"""
+    text = chunks[0].text
+    for chunk in chunks[1:]:
+        text = _join_overlapping(text, chunk.text)
+
+    scores = [chunk.score for chunk in chunks if chunk.score is not None]
+    num_tokens = [chunk.num_tokens for chunk in chunks]
+    return dataclasses.replace(
+        chunks[0],
+        text=text,
+        score=max(scores) if scores else None,
+        # Upper bound of the merged text's count: overlaps are removed, and each join adds at most a separator token
+        num_tokens=sum(num_tokens) + len(chunks) - 1 if None not in num_tokens else None
+    )
+
+
+def _join_overlapping(text: str, next_text: str) -> str:
+    """Join two consecutive chunks, removing the longest prefix of the second that the first ends with"""
+    for overlap in range(min(MAX_CHUNK_OVERLAP, len(text), len(next_text)), MIN_CHUNK_OVERLAP - 1, -1):
+        if text.endswith(next_text[:overlap]):
+            return text + next_text[overlap:]
+
+    return text + CHUNK_SEPARATOR + next_text
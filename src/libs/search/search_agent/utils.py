@@ -1,12 +1,21 @@
+import asyncio
 import json
+import time
 
+import langchain.callbacks.base
 import langchain.chat_models
+import langchain.schema
 import llama_index.llms.openai_utils as openai_utils
 import pydantic
 import tenacity
 
 import src.libs.search.search_agent.exceptions as exceptions
+import src.libs.search.search_agent.llm_cache as llm_cache
+import src.libs.search.search_agent.llm_governor as llm_governor
+import src.libs.search.search_agent.llm_hedging as llm_hedging
+import src.libs.storage.tokenization as tokenization
 import src.libs.logging as logging
+import src.libs.tracing as tracing
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +27,118 @@ llm_schema_gen_retry_config = tenacity.retry(
 )
 
 
+async def apredict_messages(
+    llm: langchain.chat_models.ChatOpenAI,
+    messages: list[langchain.schema.BaseMessage],
+    **kwargs
+) -> langchain.schema.BaseMessage:
+    """Call ChatOpenAI.apredict_messages once the process wide LLM governor gives the request a slot.
+
+    Every LLM request should go through this function, so the number of requests in flight is capped across users.
+    When the LLM response cache is enabled, the responses of deterministic LLMs are served from it without a request.
+    When hedging is enabled, a duplicate request is fired for the calls slower than usual, except for streamed calls
+    whose tokens would be received twice. Each call is recorded as an "llm" span, with its queue wait and token counts.
+
+    Args:
+        llm: The LLM to call
+        messages: The prompt messages
+        kwargs: Any other argument of ChatOpenAI.apredict_messages (functions, function_call, callbacks...)
+
+    Returns:
+        The LLM's response message
+    """
+    with tracing.span("llm", model=llm.model_name) as llm_span:
+        loop = asyncio.get_running_loop()
+        cache = llm_cache.get_cache()
+        cache_key = None
+        if cache is not None and cache.is_cacheable(llm):
+            cache_key = llm_cache.LLMResponseCache.build_key(llm, messages, **kwargs)
+            cached_response = await loop.run_in_executor(None, cache.get, cache_key)
+            if cached_response is not None:
+                llm_span.set_attributes(cached=True)
+                # Streaming callers still receive the answer, as a single token
+                for callback in kwargs.get("callbacks") or []:
+                    if isinstance(callback, langchain.callbacks.base.AsyncCallbackHandler) and cached_response.content:
+                        await callback.on_llm_new_token(cached_response.content)
+                return cached_response
+
+        governor = llm_governor.get_governor()
+        # The token usage is only needed for the span of a traced call
+        token_usage_handler = TokenUsageCallbackHandler() if llm_span.trace_id is not None else None
+
+        async def call() -> langchain.schema.BaseMessage:
+            call_kwargs = kwargs
+            if token_usage_handler is not None:
+                call_kwargs = {**kwargs, "callbacks": [*(kwargs.get("callbacks") or []), token_usage_handler]}
+            queue_start_time = time.monotonic()
+            async with governor.slot():
+                llm_span.set_attributes(cached=False, queue_wait=round(time.monotonic() - queue_start_time, 4))
+                return await llm.apredict_messages(messages=messages, **call_kwargs)
+
+        hedging_policy = llm_hedging.get_policy()
+        if hedging_policy is not None and not llm.streaming and not kwargs.get("callbacks"):
+            response = await hedging_policy.run(
+                key=hedging_policy.build_key(llm, messages),
+                call=call,
+                # A duplicate request waiting for a slot would only add to the load of a saturated LLM
+                may_hedge=lambda: governor.num_in_flight < governor.max_in_flight
+            )
+        else:
+            response = await call()
+
+        if token_usage_handler is not None and token_usage_handler.token_usage:
+            llm_span.add_tokens(
+                prompt_tokens=token_usage_handler.token_usage["prompt_tokens"],
+                completion_tokens=token_usage_handler.token_usage["completion_tokens"]
+            )
+        elif token_usage_handler is not None:
+            # Tokenizing the prompt is CPU bound, so it is run in the default loop's executor
+            llm_span.add_tokens(*await loop.run_in_executor(None, _count_tokens, llm, messages, response))
+
+        if cache_key is not None and _is_well_formed(response):
+            await loop.run_in_executor(None, cache.set, cache_key, response)
+
+        return response
+
+
+class TokenUsageCallbackHandler(langchain.callbacks.base.AsyncCallbackHandler):
+    """Keeps the token usage OpenAI reports for an LLM call, streamed calls don't report it"""
+    def __init__(self):
+        self.token_usage: dict | None = None
+
+    async def on_llm_end(self, response: langchain.schema.LLMResult, **kwargs):
+        self.token_usage = (response.llm_output or {}).get("token_usage") or None
+
+
+def _count_tokens(
+    llm: langchain.chat_models.ChatOpenAI,
+    messages: list[langchain.schema.BaseMessage],
+    response: langchain.schema.BaseMessage
+) -> tuple[int, int]:
+    """Estimate the (prompt, completion) tokens of an LLM call with the model's tokenizer, streamed responses don't
+    report their usage. The function definitions of the call aren't counted."""
+    function_call = response.additional_kwargs.get("function_call") or {}
+    return (
+        tokenization.count_message_tokens([message.content for message in messages], model_name=llm.model_name),
+        tokenization.count_tokens(
+            response.content + function_call.get("name", "") + function_call.get("arguments", ""),
+            model_name=llm.model_name
+        )
+    )
+
+
+def _is_well_formed(response: langchain.schema.BaseMessage) -> bool:
+    """Check that a function call response has JSON arguments, so a malformed response isn't cached and retried"""
+    function_call = response.additional_kwargs.get("function_call")
+    if function_call is None:
+        return True
+    try:
+        json.loads(function_call.get("arguments", ""))
+        return True
+    except json.JSONDecodeError:
+        return False
+
+
 def get_llm_to_use(
     prompt_msgs: list[langchain.prompts.base.BaseMessage],
     llm: langchain.chat_models.ChatOpenAI,
@@ -25,7 +146,10 @@ def get_llm_to_use(
     max_answer_tokens: int,
 ) -> langchain.chat_models.ChatOpenAI:
 
-    num_tokens_in_prompt = llm.get_num_tokens_from_messages(prompt_msgs)
+    num_tokens_in_prompt = tokenization.count_message_tokens(
+        [prompt_msg.content for prompt_msg in prompt_msgs],
+        model_name=llm.model_name
+    )
     llm_max_tokens = openai_utils.openai_modelname_to_contextsize(llm.model_name)
     fallback_llm_max_tokens = openai_utils.openai_modelname_to_contextsize(fallback_llm.model_name)
 
@@ -45,4 +169,4 @@ def get_llm_to_use(
         )
         llm_to_use = fallback_llm
 
-    return llm_to_use
\ No newline at end of file
+    return llm_to_use
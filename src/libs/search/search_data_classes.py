@@ -25,7 +25,16 @@ class SearchResult:
     text: str
     url: str
     score: float | None = None
+    # Index of the chunk in its page, None for sources that aren't chunks of a page
+    index: int | None = None
     source_info: SourceInfo | None = None
+    # Number of tokens in the text counted at ingestion, None for objects ingested before token counts were stored
+    num_tokens: int | None = None
+    # Query independent features of the source's page, None for objects ingested before they were stored
+    num_inbound_links: int | None = None
+    # RFC 3339 date the source's page was last modified
+    last_modified: str | None = None
+    path_depth: int | None = None
 
 
 @dataclasses.dataclass
@@ -1,19 +1,30 @@
+import collections
+import threading
 import typing
 
 import llama_index
 import llama_index.data_structs
 import llama_index.indices.base_retriever as base_retriever
+import numpy as np
 import weaviate.gql.get
 
 from src.libs.search import search_data_classes as search_data_classes
+from src.libs.search import local_replica as local_replica
+from src.libs.search.local_replica import fusion as fusion
 from src.libs.storage import storage_data_classes as storage_data_classes
 from src.libs.storage import weaviate_store
 import src.libs.logging as logging
+import src.libs.tracing as tracing
 
 
 logger = logging.getLogger(__name__)
 
 
+# Number of query embeddings kept in memory, so the FAQ lookup, the query router and searches of the same
+# query share a single embedding request
+QUERY_VECTOR_CACHE_SIZE = 1024
+
+
 # Aliases
 WeaviateObject = storage_data_classes.WeaviateObject
 TextContent = storage_data_classes.TextContent
@@ -29,10 +40,28 @@ class WeaviateSearchEngine(base_retriever.BaseRetriever):
 
     This class implements the Llama Index retriever interface, so it can be plugged into
     the framework and work with other modules like QueryEngine's.
+
+    Args:
+        weaviate_store: Store connected to the Weaviate instance to search
+        local_replica: Optional in-process replica of the TextContent index. When provided, searches are
+            answered locally unless the replica partition for the university is stale.
+        rescore_limit: Number of candidates semantic searches fetch from a compressed (PQ/BQ) index. The
+            candidates are returned with their full precision vectors and rescored exactly before the top_k are
+            kept, recovering the recall lost to quantization. Keep it small, every candidate's vector is sent
+            over the wire. Defaults to None, no rescoring.
     """
 
-    def __init__(self, weaviate_store: weaviate_store.WeaviateStore):
+    def __init__(
+            self,
+            weaviate_store: weaviate_store.WeaviateStore,
+            local_replica: local_replica.LocalReplica | None = None,
+            rescore_limit: int | None = None
+    ):
         self._weaviate_store = weaviate_store
+        self._local_replica = local_replica
+        self._rescore_limit = rescore_limit
+        self._query_vector_cache: collections.OrderedDict[str, list[float]] = collections.OrderedDict()
+        self._query_vector_cache_lock = threading.Lock()
 
     def _retrieve(self, query_bundle: llama_index.QueryBundle) -> list[llama_index.schema.NodeWithScore]:
         """This function is required to implement the Llama Index Retriever interface"""
@@ -56,7 +85,8 @@ class WeaviateSearchEngine(base_retriever.BaseRetriever):
             beta: float = 0.05,
             personalized_info_vector: list[float] = None,
             re_rank: bool = False,
-            filters: dict = None
+            filters: dict = None,
+            fusion_type: weaviate.gql.get.HybridFusion = fusion.DEFAULT_FUSION_TYPE
     ) -> list[SearchResult]:
         """Search for most relevant information to the query
 
@@ -71,12 +101,31 @@ class WeaviateSearchEngine(base_retriever.BaseRetriever):
             personalized_info_vector: The centroid vector of the users personalized information
             re_rank: Re-rank results using Cohere API
             filters: Additional filters in the Weaviate format: https://weaviate.io/developers/weaviate/search/filters
+            fusion_type: Only relevant for hybrid mode searches, the algorithm used to fuse keyword and vector results
 query = query.with_autocut(1)
         Returns:
             List of SearchResult objects representing the top_k results returned by the search
         """
         logger.info("Searching for query: " + query_str)
         query_str = query_str.replace('\n', ' ')
+
+        if self._can_search_locally(re_rank=re_rank, filters=filters):
+            return self._search_locally(
+                query_str=query_str,
+                mode=mode,
+                top_k=top_k,
+                alpha=alpha,
+                beta=beta,
+                personalized_info_vector=personalized_info_vector,
+                filters=filters,
+                fusion_type=fusion_type
+            )
+
+        # Rescored searches are embedded here, so candidates are rescored against the vector they were searched with
+        query_vector = None
+        if self._should_rescore(mode=mode, re_rank=re_rank):
+            query_vector = self.embed_query(query_str)
+
         # Build the core search query
         query = self._build_search_query(
             query_str=query_str,
@@ -86,11 +135,16 @@ query = query.with_autocut(1)
             beta=beta,
             personalized_info_vector=personalized_info_vector,
             re_rank=re_rank,
-            filters=filters
+            filters=filters,
+            fusion_type=fusion_type,
+            query_vector=query_vector
         )
+        if query_vector:
+            query = self._with_rescoring(query=query, top_k=top_k)
 
         # Execute the query
-        response = query.do()
+        with tracing.span("graphql", num_queries=1, re_rank=re_rank):
+            response = query.do()
 
         try:
             raw_results = response["data"]["Get"][
@@ -99,31 +153,99 @@ query = query.with_autocut(1)
         except KeyError:
             logger.error(response["data"]["Get"])
             raise
-        search_results = []
-        for raw_result in raw_results:
-            if re_rank:
-                score = raw_result["_additional"]["rerank"][0]["score"]
-            elif mode == "semantic":
-                score = raw_result["_additional"]["certainty"]
-            else:
-                score = float(raw_result["_additional"]["score"])
 
-            url = raw_result["contentOf"][0]["url"]
-            search_result = SearchResult(
-                text=raw_result["text"],
-                url=url,
-                score=score
+        if query_vector:
+            raw_results = self._rescore(raw_results=raw_results, query_vector=query_vector, top_k=top_k)
+
+        return self._parse_search_results(raw_results=raw_results, mode=mode, re_rank=re_rank)
+
+    def batch_search(self, queries: list[tuple[str, dict]]) -> list[list[SearchResult]]:
+        """Run several searches with a single GraphQL request.
+
+        Each search is added to the request as its own aliased Get clause, so they are all resolved
+        (including Cohere re-ranking) in one round trip to Weaviate.
+
+        Args:
+            queries: List of (query_str, search_params) pairs, where search_params are any of the keyword
+                arguments accepted by search() (mode, top_k, alpha, beta, personalized_info_vector, re_rank, filters)
+
+        Returns:
+            List of search results for each query, in the same order as the queries
+        """
+        if not queries:
+            return []
+
+        logger.info(f"Batch searching for {len(queries)} queries")
+        batched_search_results: list[list[SearchResult] | None] = [None] * len(queries)
+        aliases = {}
+        query_vectors = {}
+        get_builders = []
+        for idx, (query_str, search_params) in enumerate(queries):
+            query_str = query_str.replace('\n', ' ')
+            if self._can_search_locally(
+                re_rank=search_params.get("re_rank", False),
+                filters=search_params.get("filters")
+            ):
+                batched_search_results[idx] = self._search_locally(
+                    query_str=query_str,
+                    **{param: value for param, value in search_params.items() if param != "re_rank"}
+                )
+                continue
+
+            alias = f"query{idx}"
+            if self._should_rescore(mode=search_params.get("mode", "hybrid"), re_rank=search_params.get("re_rank", False)):
+                query_vectors[idx] = self.embed_query(query_str)
+                query = self._build_search_query(query_str=query_str, query_vector=query_vectors[idx], **search_params)
+                query = self._with_rescoring(query=query, top_k=search_params.get("top_k", 3))
+            else:
+                query = self._build_search_query(query_str=query_str, **search_params)
+            get_builders.append(query.with_alias(alias))
+            aliases[idx] = alias
+
+        if not get_builders:
+            return batched_search_results
+
+        # Execute all the remaining queries in a single request
+        with tracing.span(
+                "graphql",
+                num_queries=len(get_builders),
+                re_rank=any(search_params.get("re_rank", False) for _, search_params in queries)
+        ):
+            response = self._weaviate_store.client.query.multi_get(get_builders).do()
+
+        for idx, alias in aliases.items():
+            try:
+                raw_results = response["data"]["Get"][alias]
+            except KeyError:
+                logger.error(response)
+                raise
+            search_params = queries[idx][1]
+            if idx in query_vectors:
+                raw_results = self._rescore(
+                    raw_results=raw_results or [],
+                    query_vector=query_vectors[idx],
+                    top_k=search_params.get("top_k", 3)
+                )
+            batched_search_results[idx] = self._parse_search_results(
+                raw_results=raw_results or [],
+                mode=search_params.get("mode", "hybrid"),
+                re_rank=search_params.get("re_rank", False)
             )
-            search_results.append(search_result)
 
-        return search_results
+        return batched_search_results
 
     def ask(
             self,
             ask_str: str,
             mode: typing.Literal["semantic", "hybrid", "keyword"] = "hybrid",
             top_k: int = 3,
-            filters: dict = None
+            alpha: float = 0.75,
+            beta: float = 0.05,
+            personalized_info_vector: list[float] = None,
+            re_rank: bool = False,
+            filters: dict = None,
+            fusion_type: weaviate.gql.get.HybridFusion = fusion.DEFAULT_FUSION_TYPE,
+            grouped_task: str | None = None
     ) -> Answer:
         """Answer a question by passing search results + question to LLM.
 
@@ -134,40 +256,56 @@ query = query.with_autocut(1)
             mode: Either "semantic", "keyword" or "hybrid". If "semantic", the search will be a pure vector search.
                 If "keyword", it will be a keyword search.
                 If "hybrid", both vector and keyword search will be used together.
-            top_k: Number of most relevant results to return
+            top_k: Number of most relevant results to return, all of them are passed to the LLM
+            alpha: Only relevant for hybrid mode searches: https://weaviate.io/developers/weaviate/search/hybrid#weight-keyword-vs-vector-results
+            beta: The weight of the personalized info vector
+            personalized_info_vector: The centroid vector of the users personalized information
+            re_rank: Re-rank results using Cohere API
             filters: Additional filters in the Weaviate format: https://weaviate.io/developers/weaviate/search/filters
+            fusion_type: Only relevant for hybrid mode searches, the algorithm used to fuse keyword and vector results
+            grouped_task: Prompt the text of the search results is appended to. Defaults to a prompt answering
+                ask_str based only on the search results.
 
         Returns:
             Answer object which contains the answer and list of SearchResult objects representing the top_k results returned by the search
         """
+        ask_str = ask_str.replace('\n', ' ')
+
         # Build the core search query
         query = self._build_search_query(
             query_str=ask_str,
             mode=mode,
             top_k=top_k,
-            filters=filters
+            alpha=alpha,
+            beta=beta,
+            personalized_info_vector=personalized_info_vector,
+            re_rank=re_rank,
+            filters=filters,
+            fusion_type=fusion_type
         )
 
         # Augment the search query to generate the answer by grouping all the text properties
         # of search results into a single prompt.
         query = query.with_generate(
-            grouped_task="You are a helpful, knowledgeable and confident university chatbot. "
-                         "Your task is to respond to the student's question with a helpful "
-                         "and accurate answer based only on the information contained in context. "
-                         "The context is only visible to you, all the student will see is your answer.\n"
-                         f"Question: {ask_str}\n"
-                         "Context: ",
+            grouped_task=grouped_task or (
+                "You are a helpful, knowledgeable and confident university chatbot. "
+                "Your task is to respond to the student's question with a helpful "
+                "and accurate answer based only on the information contained in context. "
+                "The context is only visible to you, all the student will see is your answer.\n"
+                f"Question: {ask_str}\n"
+                "Context: "
+            ),
             grouped_properties=["text"]
         )
 
         # Execute the query
-        response = query.do()
+        with tracing.span("graphql", num_queries=1, re_rank=re_rank, generate=True):
+            response = query.do()
 
         # Parse into search results and answer
         raw_results = response["data"]["Get"][
             TextContent.weaviate_class_name(namespace=self.namespace)
         ]
-        search_results = []
         answer_str = ""
         for raw_result in raw_results:
             if raw_result["_additional"].get("generate"):
@@ -175,21 +313,43 @@ query = query.with_autocut(1)
                 error = raw_result["_additional"]["generate"]["error"]
                 if error:
                     logger.error(f"Error generating an answer: {error}")
-            search_result = SearchResult(
-                text=raw_result["text"],
-                url=raw_result["contentOf"][0]["url"],
-                score=(
-                    raw_result["_additional"]["distance"]
-                    if mode == "semantic"
-                    else float(raw_result["_additional"]["score"])
-                )
-            )
-            search_results.append(search_result)
+        search_results = self._parse_search_results(raw_results=raw_results, mode=mode, re_rank=re_rank)
 
         answer = Answer(answer=answer_str, search_results=search_results)
 
         return answer
 
+    def search_faq(self, query_str: str, university: str, min_certainty: float) -> Answer | None:
+        """Look up a pre-generated answer to the question in the FAQ index
+
+        Args:
+            query_str: The question to answer
+            university: The university the question is asked about
+            min_certainty: Certainty (between 0 and 1) the nearest FAQ question must reach to be considered the
+                same question as query_str
+
+        Returns:
+            Answer object with the stored answer and sources, None if no FAQ question is near enough
+        """
+        query_vector = self.embed_query(query_str.replace('\n', ' '))
+        nearest_faq_entries = self._weaviate_store.search_faq(question_vector=query_vector, university=university)
+        if not nearest_faq_entries:
+            return None
+
+        faq_entry, certainty = nearest_faq_entries[0]
+        if certainty < min_certainty:
+            logger.info(f"Nearest FAQ question \"{faq_entry.question}\" has certainty {round(certainty, 3)}, too low to serve")
+            return None
+
+        logger.info(f"Serving FAQ answer of \"{faq_entry.question}\" with certainty {round(certainty, 3)}")
+        return Answer(
+            answer=faq_entry.answer,
+            search_results=[
+                SearchResult(text=source["text"], url=source["url"], score=source.get("score"))
+                for source in faq_entry.sources
+            ]
+        )
+
     def summarize(
             self,
             query_str: str,
@@ -231,7 +391,8 @@ query = query.with_autocut(1)
         )
 
         # Execute the query
-        response = query.do()
+        with tracing.span("graphql", num_queries=1, generate=True):
+            response = query.do()
 
         # Parse into search results and answer
         raw_results = response["data"]["Get"][
@@ -253,7 +414,12 @@ query = query.with_autocut(1)
                     raw_result["_additional"]["distance"]
                     if mode == "semantic"
                     else float(raw_result["_additional"]["score"])
-                )
+                ),
+                index=raw_result.get("index"),
+                num_tokens=raw_result.get("numTokens"),
+                num_inbound_links=raw_result.get("numInboundLinks"),
+                last_modified=raw_result.get("lastModified"),
+                path_depth=raw_result.get("pathDepth")
             )
             search_results.append(search_result)
 
@@ -261,6 +427,44 @@ query = query.with_autocut(1)
 
         return summarization
 
+    def embed_query(self, query_str: str) -> list[float]:
+        """Get the embedding of a query, recently embedded queries are not embedded again
+
+        Args:
+            query_str: The query to embed
+
+        Returns:
+            The embedding of the query
+        """
+        with self._query_vector_cache_lock:
+            if query_str in self._query_vector_cache:
+                self._query_vector_cache.move_to_end(query_str)
+                return self._query_vector_cache[query_str]
+
+        with tracing.span("embedding"):
+            query_vector = self._weaviate_store.create_embedding(query_str)[0]
+
+        with self._query_vector_cache_lock:
+            self._query_vector_cache[query_str] = query_vector
+            if len(self._query_vector_cache) > QUERY_VECTOR_CACHE_SIZE:
+                self._query_vector_cache.popitem(last=False)
+
+        return query_vector
+
+    def cached_query_vector(self, query_str: str) -> list[float] | None:
+        """Get the embedding of a query if it was recently embedded, without embedding it
+
+        Args:
+            query_str: The query to get the embedding of
+
+        Returns:
+            The embedding of the query, None if it isn't cached
+        """
+        with self._query_vector_cache_lock:
+            if query_str in self._query_vector_cache:
+                self._query_vector_cache.move_to_end(query_str)
+            return self._query_vector_cache.get(query_str)
+
     @property
     def namespace(self):
         return self._weaviate_store.namespace
@@ -275,6 +479,8 @@ query = query.with_autocut(1)
             personalized_info_vector: list[float] = None,
             re_rank: bool = False,
             filters: dict = None,
+            fusion_type: weaviate.gql.get.HybridFusion = fusion.DEFAULT_FUSION_TYPE,
+            query_vector: list[float] | None = None
     ) -> weaviate.gql.get.GetBuilder:
         """Build a search query for most relevant information to the query
 
@@ -289,15 +495,29 @@ query = query.with_autocut(1)
             personalized_info_vector: The centroid vector of the users personalized information
             re_rank: Re-rank results using Cohere API
             filters: Additional filters in the Weaviate format: https://weaviate.io/developers/weaviate/search/filters
+            fusion_type: Only relevant for hybrid mode searches, the algorithm used to fuse keyword and vector results
+            query_vector: Only relevant for semantic and non-personalized hybrid mode searches, the embedding of
+                query_str. If not provided, the cached embedding of query_str is used, or else Weaviate vectorizes
+                the query.
 
         Returns:
             Weaviate QueryBuilder object
         """
 
+        if query_vector is None and mode != "keyword" and not (mode == "hybrid" and personalized_info_vector):
+            if self._weaviate_store.embedding_projection:
+                # Weaviate's vectorizer embeds queries with the full ada dimensions, so queries against an index of
+                # projected embeddings are embedded (and projected) here
+                query_vector = self.embed_query(query_str)
+            else:
+                # Queries embedded earlier in the request (e.g. by the query router) aren't embedded again by
+                # Weaviate's vectorizer, the others are still embedded by it
+                query_vector = self.cached_query_vector(query_str)
+
         query = (
             self._weaviate_store.client.query
             .get(TextContent.weaviate_class_name(namespace=self.namespace),
-                 ["index", "text", "contentOf { ... on Jonahs_weaviate_infodb_Webpage { url, webpage_id, mimeType, university } }"])
+                 ["index", "text", *self._weaviate_store.backfilled_text_content_properties, "contentOf { ... on Jonahs_weaviate_infodb_Webpage { url, webpage_id, mimeType, university } }"])
         )
 
         query = query.with_additional(properties=["id"])
@@ -308,14 +528,29 @@ query = query.with_autocut(1)
 
         # # Use the appropriate Weaviate search method
         if mode == "semantic":
-            query = query.with_near_text(content={"concepts": [query_str]})
+            if query_vector:
+                query = query.with_near_vector(content={"vector": query_vector})
+            else:
+                query = query.with_near_text(content={"concepts": [query_str]})
         elif mode == "hybrid":
             if not personalized_info_vector:
-                query = query.with_hybrid(query=query_str, properties=["text"], alpha=alpha)
+                query = query.with_hybrid(
+                    query=query_str,
+                    properties=["text"],
+                    alpha=alpha,
+                    vector=query_vector,
+                    fusion_type=fusion_type
+                )
                 query = query.with_autocut(1)
             else:
                 weighted_vector = self._build_weighted_vector(query_str=query_str, personalized_info_vector=personalized_info_vector, beta=beta)
-                query = query.with_hybrid(query=query_str, properties=["text"], alpha=alpha, vector=weighted_vector)
+                query = query.with_hybrid(
+                    query=query_str,
+                    properties=["text"],
+                    alpha=alpha,
+                    vector=weighted_vector,
+                    fusion_type=fusion_type
+                )
                 query = query.with_autocut(1)
         elif mode == "keyword":
             query = query.with_bm25(query=query_str, properties=["text"])
@@ -327,14 +562,27 @@ query = query.with_autocut(1)
                 ]
             )
 
-        # Check for university filter in filters
-        if filters and "university" in filters:
-            university_filter = {
-                "path": [
+        university = (filters or {}).get("university")
+        if self._weaviate_store.multi_tenant:
+            # Route searches of a multi-tenant store to the university's tenant, which only holds that
+            # university's objects, so no filter is needed
+            if not university:
+                raise ValueError("Searches of a multi-tenant store must filter on a university")
+            query = query.with_tenant(self._weaviate_store.tenant(university))
+        elif university:
+            # Once the university is denormalized onto every TextContent object, we filter on it directly instead of
+            # on the contentOf cross-reference (which requires a join per candidate). Before the facets backfill,
+            # older objects don't have it and would be missed.
+            if self._weaviate_store.text_content_has_facets:
+                university_path = ["university"]
+            else:
+                university_path = [
                     "contentOf",
-                    "Jonahs_weaviate_infodb_Webpage",
+                    storage_data_classes.Webpage.weaviate_class_name(namespace=self.namespace),
                     "university"
-                ],
+                ]
+            university_filter = {
+                "path": university_path,
                 "operator": "Equal",
                 "valueText":  filters["university"]
             }
@@ -343,6 +591,159 @@ query = query.with_autocut(1)
 
         return query
 
+    def _should_rescore(self, mode: typing.Literal["semantic", "hybrid", "keyword"], re_rank: bool) -> bool:
+        """Check if a search should be rescored against full precision vectors
+
+        Only pure vector searches are rescored. Hybrid scores are fused from ranks computed in Weaviate, and
+        Cohere re-ranking replaces the vector scores altogether.
+        """
+        return bool(self._rescore_limit) and mode == "semantic" and not re_rank
+
+    def _with_rescoring(self, query: weaviate.gql.get.GetBuilder, top_k: int) -> weaviate.gql.get.GetBuilder:
+        """Over-fetch the candidates of a semantic search query, with their full precision vectors"""
+        return (
+            query
+            .with_limit(limit=max(self._rescore_limit, top_k))
+            .with_additional(properties=["vector"])
+        )
+
+    @staticmethod
+    @tracing.traced("rescore")
+    def _rescore(raw_results: list[dict], query_vector: list[float], top_k: int) -> list[dict]:
+        """Re-order over-fetched candidates by their exact cosine similarity to the query vector
+
+        Args:
+            raw_results: The TextContent objects returned for the query, including their vectors
+            query_vector: The vector the query was searched with
+            top_k: Number of most relevant results to keep
+
+        Returns:
+            The top_k raw results, with their certainty replaced by the exact certainty
+        """
+        if not raw_results:
+            return raw_results
+
+        vectors = np.array([raw_result["_additional"]["vector"] for raw_result in raw_results], dtype=np.float32)
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        similarities = (vectors @ query_vector) / (
+            np.maximum(np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector), 1e-12)
+        )
+
+        rescored_results = []
+        for idx in np.argsort(-similarities, kind="stable")[:top_k]:
+            raw_result = raw_results[idx]
+            raw_result["_additional"]["certainty"] = float((1 + similarities[idx]) / 2)
+            rescored_results.append(raw_result)
+
+        return rescored_results
+
+    def _can_search_locally(self, re_rank: bool, filters: dict | None) -> bool:
+        """Check if a search can be answered by the local replica instead of Weaviate
+
+        Only searches for a single university, without Cohere re-ranking, are supported locally.
+        """
+        if self._local_replica is None or re_rank:
+            return False
+        if not filters or set(filters) != {"university"}:
+            return False
+        if not self._local_replica.is_fresh(filters["university"]):
+            logger.info(f"Local replica is stale for {filters['university']}, falling back to Weaviate")
+            return False
+
+        return True
+
+    @tracing.traced("local_search")
+    def _search_locally(
+            self,
+            query_str: str,
+            filters: dict,
+            mode: typing.Literal["semantic", "hybrid", "keyword"] = "hybrid",
+            top_k: int = 3,
+            alpha: float = 0.75,
+            beta: float = 0.05,
+            personalized_info_vector: list[float] = None,
+            fusion_type: weaviate.gql.get.HybridFusion = fusion.DEFAULT_FUSION_TYPE
+    ) -> list[SearchResult]:
+        """Search against the local replica, with the same semantics as the query built by _build_search_query()
+
+        Args:
+            query_str: The search query
+            filters: Filters containing the university to search in
+            mode: Either "semantic", "keyword" or "hybrid"
+            top_k: Number of most relevant results to return
+            alpha: Only relevant for hybrid mode searches, the weight of vector vs keyword results
+            beta: The weight of the personalized info vector
+            personalized_info_vector: The centroid vector of the users personalized information
+            fusion_type: Only relevant for hybrid mode searches, the algorithm used to fuse keyword and vector results
+
+        Returns:
+            List of SearchResult objects representing the top_k results returned by the search
+        """
+        query_vector = None
+        if mode == "semantic":
+            query_vector = self.embed_query(query_str)
+        elif mode == "hybrid":
+            if personalized_info_vector:
+                query_vector = self._build_weighted_vector(
+                    query_str=query_str,
+                    personalized_info_vector=personalized_info_vector,
+                    beta=beta
+                )
+            else:
+                query_vector = self.embed_query(query_str)
+
+        return self._local_replica.search(
+            university=filters["university"],
+            mode=mode,
+            query_str=query_str,
+            query_vector=query_vector,
+            top_k=top_k,
+            alpha=alpha,
+            fusion_type=fusion_type,
+            # Hybrid searches against Weaviate are always autocut
+            autocut=1 if mode == "hybrid" else None
+        )
+
+    @staticmethod
+    def _parse_search_results(
+            raw_results: list[dict],
+            mode: typing.Literal["semantic", "hybrid", "keyword"],
+            re_rank: bool
+    ) -> list[SearchResult]:
+        """Convert the raw TextContent objects returned by a Weaviate Get query into SearchResult objects
+
+        Args:
+            raw_results: The TextContent objects returned for the query
+            mode: The search mode the query was run with, which determines where the score is read from
+            re_rank: Whether the query was re-ranked using Cohere API
+
+        Returns:
+            List of SearchResult objects
+        """
+        search_results = []
+        for raw_result in raw_results:
+            if re_rank:
+                score = raw_result["_additional"]["rerank"][0]["score"]
+            elif mode == "semantic":
+                score = raw_result["_additional"]["certainty"]
+            else:
+                score = float(raw_result["_additional"]["score"])
+
+            url = raw_result["contentOf"][0]["url"]
+            search_result = SearchResult(
+                text=raw_result["text"],
+                url=url,
+                score=score,
+                index=raw_result.get("index"),
+                num_tokens=raw_result.get("numTokens"),
+                num_inbound_links=raw_result.get("numInboundLinks"),
+                last_modified=raw_result.get("lastModified"),
+                path_depth=raw_result.get("pathDepth")
+            )
+            search_results.append(search_result)
+
+        return search_results
+
     def _build_weighted_vector(self, query_str: str, personalized_info_vector: list[float] = None, beta: float = 0.01):
         """
         Build a weighted vector from the centroid vector and the query string.
@@ -353,6 +754,8 @@ query = query.with_autocut(1)
             beta: The weight of the personalized info vector
         """
         # personalized_info_vector = self._weaviate_store.create_embedding("I am a student at Questrom school of business")[0]
-        query_vector = self._weaviate_store.create_embedding(query_str)[0]
+        query_vector = self.embed_query(query_str)
+        # Profile vectors stored before the embedding projection was enabled still have the full dimensions
+        personalized_info_vector = self._weaviate_store.project_embedding(personalized_info_vector)
         weighted_vector = [(1 - beta) * query_vector[i] + beta * personalized_info_vector[i] for i in range(len(query_vector))]
         return weighted_vector
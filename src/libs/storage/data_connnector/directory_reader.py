@@ -6,6 +6,7 @@ import asyncio
 from bs4 import BeautifulSoup
 
 import src.libs.storage.data_connnector.index_data_classes as index_data_classes
+import src.libs.storage.page_features as page_features
 import src.libs.storage.storage_data_classes as storage_data_classes
 import src.libs.logging as logging
 
@@ -93,4 +94,13 @@ class DirectoryReader:
             )
             webpages.append(webpage)
 
+        # Pages that don't declare when they were last modified are left undated, the file mtime is when they were
+        # crawled rather than updated. The re-ranker gives undated pages the mean recency of the other results.
+        features = page_features.compute_page_features(
+            html_contents={webpage.url: webpage.html_content for webpage in webpages}
+        )
+        for webpage in webpages:
+            webpage.num_inbound_links = features[webpage.url].num_inbound_links
+            webpage.last_modified = features[webpage.url].last_modified
+
         return WebpageIndex(webpages=webpages)
@@ -0,0 +1,95 @@
+import typing
+
+import numpy as np
+
+import src.libs.logging as logging
+
+
+logger = logging.getLogger(__name__)
+
+
+# Number of vectors the projection is fitted on
+MAX_FIT_SAMPLE_SIZE = 50_000
+
+
+class EmbeddingProjection:
+    """Linear projection of embeddings onto fewer dimensions, fitted once on a sample of the corpus.
+
+    Embeddings are centered on the corpus mean, multiplied by the projection matrix and re-normalized, so cosine
+    similarities between projected embeddings approximate the similarities between the original embeddings. The
+    projection is a (output_dim, input_dim) matrix plus the mean, which is persisted as a small .npz file.
+
+    Args:
+        components: Matrix of shape (output_dim, input_dim) with orthonormal rows
+        mean: Array of shape (input_dim,) with the mean of the embeddings the projection was fitted on
+    """
+
+    def __init__(self, components: np.ndarray, mean: np.ndarray):
+        self._components = components.astype(np.float32)
+        self._mean = mean.astype(np.float32)
+
+    @property
+    def input_dim(self) -> int:
+        return self._components.shape[1]
+
+    @property
+    def output_dim(self) -> int:
+        return self._components.shape[0]
+
+    @classmethod
+    def fit(
+        cls,
+        vectors: np.ndarray,
+        output_dim: int,
+        method: typing.Literal["pca", "random"] = "pca",
+        seed: int = 0
+    ) -> "EmbeddingProjection":
+        """Fit a projection on a sample of corpus embeddings.
+
+        Args:
+            vectors: Matrix of shape (num_vectors, input_dim) of corpus embeddings
+            output_dim: Number of dimensions to project onto
+            method: "pca" projects onto the directions of highest variance of the corpus, "random" onto random
+                orthonormal directions (cheaper to fit, but loses more recall at the same dimension)
+            seed: Random seed used for sampling and random projections
+
+        Returns:
+            The fitted projection
+        """
+        rng = np.random.default_rng(seed)
+        if len(vectors) > MAX_FIT_SAMPLE_SIZE:
+            vectors = vectors[np.sort(rng.choice(len(vectors), size=MAX_FIT_SAMPLE_SIZE, replace=False))]
+        vectors = np.asarray(vectors, dtype=np.float64)
+        mean = vectors.mean(axis=0)
+
+        if method == "pca":
+            centered_vectors = vectors - mean
+            covariance = centered_vectors.T @ centered_vectors / len(centered_vectors)
+            # eigh returns eigenvalues in ascending order, keep the eigenvectors of the largest ones
+            eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+            components = eigenvectors[:, ::-1][:, :output_dim].T
+            explained_variance = eigenvalues[::-1][:output_dim].sum() / eigenvalues.sum()
+            logger.info(
+                f"PCA projection onto {output_dim} dimensions explains "
+                f"{round(float(explained_variance), 3)} of the variance"
+            )
+        else:
+            # Orthonormalize gaussian directions, which preserves distances better than raw gaussian projections
+            gaussian = rng.normal(size=(vectors.shape[1], output_dim))
+            components = np.linalg.qr(gaussian)[0].T
+
+        return cls(components=components, mean=mean)
+
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        """Project a matrix of shape (num_vectors, input_dim) onto (num_vectors, output_dim) unit vectors"""
+        projected = (np.asarray(vectors, dtype=np.float32) - self._mean) @ self._components.T
+        norms = np.linalg.norm(projected, axis=1, keepdims=True)
+        return projected / np.where(norms == 0, 1, norms)
+
+    def save(self, path: str):
+        np.savez(path, components=self._components, mean=self._mean)
+
+    @classmethod
+    def load(cls, path: str) -> "EmbeddingProjection":
+        with np.load(path) as projection_arrays:
+            return cls(components=projection_arrays["components"], mean=projection_arrays["mean"])
@@ -1,11 +1,13 @@
 import concurrent.futures
 
+import numpy as np
 import openai
 import tenacity
 import tqdm
 import tqdm.asyncio
 
 import src.libs.storage.storage_data_classes as data_classes
+import src.libs.storage.embedding_projection as embedding_projection
 import src.libs.logging as logging
 
 
@@ -75,11 +77,52 @@ openai_retry_config = tenacity.retry(
 )
 
 
+# Dimension of text-embedding-ada-002 embeddings
+ADA_EMBEDDING_DIM = 1536
+
+
 class EmbeddingsClient:
-    def __init__(self, openai_api_key: str, batch_size: int = 10, model_name: str = "text-embedding-ada-002"):
+    """Client creating embeddings with the OpenAI Embedding API.
+
+    Args:
+        openai_api_key: OpenAI API key
+        batch_size: Number of texts embedded per API request
+        model_name: OpenAI embedding model
+        projection: Optional projection onto fewer dimensions. When provided, every embedding the client
+            creates is projected, so chunk, query and profile vectors all live in the same reduced space.
+    """
+
+    def __init__(
+        self,
+        openai_api_key: str,
+        batch_size: int = 10,
+        model_name: str = "text-embedding-ada-002",
+        projection: embedding_projection.EmbeddingProjection | None = None
+    ):
         self._openai_api_key = openai_api_key
         self._batch_size = batch_size
         self._model_name = model_name
+        self.projection = projection
+
+    @property
+    def dim(self) -> int:
+        """Dimension of the embeddings created by the client"""
+        return self.projection.output_dim if self.projection else ADA_EMBEDDING_DIM
+
+    def project_embedding(self, embedding: list[float]) -> list[float]:
+        """Project an embedding created without the projection (e.g. stored before it was enabled).
+        Embeddings that are already projected are returned unchanged.
+        """
+        if not self.projection or len(embedding) != self.projection.input_dim:
+            return embedding
+
+        return self._project(embeddings=[embedding])[0]
+
+    def _project(self, embeddings: list[list[float]]) -> list[list[float]]:
+        if not self.projection or not embeddings:
+            return embeddings
+
+        return self.projection.project(np.array(embeddings, dtype=np.float32)).tolist()
 
     @openai_retry_config
     def _create_embeddings(self, texts: list[str]) -> list[list[float]]:
@@ -96,7 +139,7 @@ class EmbeddingsClient:
                 return []
 
         embeddings = [data["embedding"] for data in resp["data"]]
-        return embeddings
+        return self._project(embeddings=embeddings)
 
     @openai_retry_config
     async def _acreate_embeddings(self, texts: list[str]) -> list[list[float]]:
@@ -110,7 +153,7 @@ class EmbeddingsClient:
             logger.warning(f"Error creating embedding: {texts}")
             return []
         embeddings = [data["embedding"] for data in resp["data"]]
-        return embeddings
+        return self._project(embeddings=embeddings)
 
     @classmethod
     def _get_texts_to_embed(cls, weaviate_object: data_classes.Webpage) -> list[str]:
@@ -182,6 +225,14 @@ class EmbeddingsClient:
             for text_content, embedding in zip(weaviate_object.text_contents, embeddings):
                 text_content.vector = embedding
 
+    def create_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """Create the embeddings of a list of texts, batched up using OpenAI Embedding API"""
+        embeddings = []
+        for i in range(0, len(texts), self._batch_size):
+            embeddings.extend(self._create_embeddings(texts=texts[i: i + self._batch_size]))
+
+        return embeddings
+
     @openai_retry_config
     def create_embedding(self, text: str) -> list[list[float]]:
         """Create embedding using OpenAI Embedding API"""
@@ -197,4 +248,4 @@ class EmbeddingsClient:
                 return []
 
         embeddings = [data["embedding"] for data in resp["data"]]
-        return embeddings
+        return self._project(embeddings=embeddings)
@@ -0,0 +1,152 @@
+import collections
+import dataclasses
+import datetime
+import email.utils
+import urllib.parse
+
+from bs4 import BeautifulSoup
+
+
+# Meta tags pages declare their last modification date in, by order of preference
+LAST_MODIFIED_META_NAMES = (
+    "article:modified_time",
+    "og:updated_time",
+    "last-modified",
+    "dcterms.modified",
+    "dc.date.modified",
+)
+
+
+@dataclasses.dataclass
+class PageFeatures:
+    """Query independent features of a webpage, used to re-rank its TextContent objects"""
+    # Number of distinct pages of the crawl linking to the page
+    num_inbound_links: int
+    # RFC 3339 date the page was last modified, None if unknown
+    last_modified: str | None
+    # Number of segments in the path of the page's URL, 0 for the home page of a site
+    path_depth: int
+
+
+def normalize_url(url: str) -> str:
+    """Key identifying the page a URL points to, so links to it can be matched whatever form they are written in.
+
+    The scheme, a leading "www.", the query string, the fragment and trailing slashes are ignored.
+    """
+    parsed_url = urllib.parse.urlparse(url if "//" in url else f"//{url}")
+    netloc = parsed_url.netloc.lower().removeprefix("www.")
+    return f"{netloc}{parsed_url.path.rstrip('/')}"
+
+
+def path_depth(url: str) -> int:
+    """Number of segments in the path of a URL, e.g. 2 for www.bu.edu/academics/cas/"""
+    parsed_url = urllib.parse.urlparse(url if "//" in url else f"//{url}")
+    return len([segment for segment in parsed_url.path.split("/") if segment])
+
+
+def extract_link_targets(url: str, html_content: str) -> set[str]:
+    """Normalized URLs of the pages a page links to, excluding itself
+
+    Args:
+        url: URL of the page, relative links are resolved against it
+        html_content: HTML of the page
+
+    Returns:
+        Set of normalized URLs
+    """
+    base_url = url if "//" in url else f"https://{url}"
+    page_key = normalize_url(url)
+    link_targets = set()
+    for anchor in BeautifulSoup(html_content, "html.parser").find_all("a", href=True):
+        target_url = urllib.parse.urljoin(base_url, anchor["href"].strip())
+        if urllib.parse.urlparse(target_url).scheme not in ("http", "https"):
+            continue
+        target_key = normalize_url(target_url)
+        if target_key != page_key:
+            link_targets.add(target_key)
+
+    return link_targets
+
+
+def count_inbound_links(link_targets_by_url: dict[str, set[str]]) -> collections.Counter:
+    """Count the distinct pages linking to each page of a crawl
+
+    Args:
+        link_targets_by_url: Normalized link targets of each page of the crawl, see extract_link_targets()
+
+    Returns:
+        Counter of inbound links by normalized URL
+    """
+    num_inbound_links = collections.Counter()
+    for link_targets in link_targets_by_url.values():
+        num_inbound_links.update(link_targets)
+
+    return num_inbound_links
+
+
+def extract_last_modified(html_content: str) -> str | None:
+    """Last modification date a page declares in its meta tags, as an RFC 3339 date in UTC
+
+    Args:
+        html_content: HTML of the page
+
+    Returns:
+        The date, None if the page doesn't declare a valid one
+    """
+    dates = {}
+    for meta in BeautifulSoup(html_content, "html.parser").find_all("meta", content=True):
+        name = (meta.get("property") or meta.get("name") or meta.get("http-equiv") or "").lower()
+        if name in LAST_MODIFIED_META_NAMES and name not in dates:
+            dates[name] = meta["content"]
+
+    for name in LAST_MODIFIED_META_NAMES:
+        if name in dates:
+            last_modified = _parse_date(dates[name])
+            if last_modified:
+                return to_rfc3339(last_modified)
+
+    return None
+
+
+def compute_page_features(html_contents: dict[str, str]) -> dict[str, PageFeatures]:
+    """Compute the features of the pages of a crawl. Inbound links are only counted between the given pages.
+
+    Args:
+        html_contents: HTML of each page, by URL
+
+    Returns:
+        Features of each page, by URL
+    """
+    num_inbound_links = count_inbound_links({
+        url: extract_link_targets(url=url, html_content=html_content) for url, html_content in html_contents.items()
+    })
+
+    return {
+        url: PageFeatures(
+            num_inbound_links=num_inbound_links[normalize_url(url)],
+            last_modified=extract_last_modified(html_content),
+            path_depth=path_depth(url)
+        )
+        for url, html_content in html_contents.items()
+    }
+
+
+def to_rfc3339(date: datetime.datetime) -> str:
+    """Format a date the way Weaviate date properties are stored, naive dates are taken to be in UTC"""
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return date.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _parse_date(date_str: str) -> datetime.datetime | None:
+    """Parse an ISO 8601 date (as used by Open Graph and Dublin Core) or an HTTP date (as used by Last-Modified)"""
+    date_str = date_str.strip()
+    try:
+        return datetime.datetime.fromisoformat(date_str)
+    except ValueError:
+        pass
+
+    try:
+        return email.utils.parsedate_to_datetime(date_str)
+    except (TypeError, ValueError):
+        return None
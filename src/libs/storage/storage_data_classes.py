@@ -1,8 +1,16 @@
 import dataclasses
 import enum
 import hashlib
+import json
+import urllib.parse
 import uuid
 
+import src.libs.storage.page_features as page_features
+import src.libs.storage.tokenization as tokenization
+
+# Maximum number of PQ segments of a compressed vector, each segment is held as a one byte code
+MAX_PQ_SEGMENTS = 256
+
 
 class MimeType(str, enum.Enum):
     TEXT = "text/plain"
@@ -10,6 +18,12 @@ class MimeType(str, enum.Enum):
     HTML = "text/html"
 
 
+class VectorCompression(str, enum.Enum):
+    """Quantization of the vectors held in memory by a class's HNSW index"""
+    PQ = "pq"
+    BQ = "bq"
+
+
 class WeaviateObject:
     @classmethod
     def weaviate_class_name(cls, namespace: str):
@@ -27,6 +41,11 @@ class TextContent(WeaviateObject):
     vector: list[float] | None = None
     metadata: dict = dataclasses.field(default_factory=dict)
 
+    # Description of the class once every object holds the facets of its webpage, so searches can filter on them
+    FACETED_DESCRIPTION = "Text of a webpage, with the facets of the webpage"
+    # Properties added after the first classes were created, older classes only have them once they are backfilled
+    BACKFILLED_PROPERTY_NAMES = ("numTokens", "numInboundLinks", "lastModified", "pathDepth")
+
     def __lt__(self, other):
         # To enable sorting
         return self.index < other.index
@@ -36,11 +55,22 @@ class TextContent(WeaviateObject):
         return "\n".join(f'{k}: {v}' for k, v in self.metadata.items())
 
     @classmethod
-    def weaviate_class_schema(cls, namespace: str):
+    def weaviate_class_schema(
+        cls,
+        namespace: str,
+        vector_compression: VectorCompression | None = None,
+        dim: int = 1536
+    ):
         # TODO: Automate the generation of this based on dataclass
         return {
             "class": cls.weaviate_class_name(namespace=namespace),
+            # Objects of a new class are inserted with the facets of their webpage
+            "description": cls.FACETED_DESCRIPTION,
             "vectorizer": "text2vec-openai",
+            **(
+                {"vectorIndexConfig": cls.weaviate_vector_index_config(vector_compression=vector_compression, dim=dim)}
+                if vector_compression else {}
+            ),
             "moduleConfig": {
                 "text2vec-openai": {
                     "model": "ada",
@@ -61,6 +91,29 @@ class TextContent(WeaviateObject):
                     "name": "index",
                     "dataType": ["int"],
                 },
+                # Number of tokens in the text, so prompt sizes can be computed without re-tokenizing search results
+                {
+                    "name": "numTokens",
+                    "dataType": ["int"],
+                },
+                # Facets of the webpage the text is content of, denormalized so searches can filter on them
+                # directly instead of filtering on the contentOf cross-reference
+                *[
+                    {
+                        "name": facet_name,
+                        "dataType": ["text"],
+                        "tokenization": "field",
+                        "moduleConfig": {
+                            "text2vec-openai": {
+                                "skip": True
+                            }
+                        }
+                    }
+                    for facet_name in Webpage.FACET_NAMES
+                ],
+                # Query independent features of the webpage the text is content of, denormalized so search results
+                # can be re-ranked on them without resolving the contentOf cross-reference
+                *Webpage.RANKING_FEATURE_PROPERTIES,
                 {
                     "name": "contentOf",
                     "dataType": [
@@ -70,21 +123,84 @@ class TextContent(WeaviateObject):
             ]
         }
 
-    def to_weaviate_object(self) -> dict:
+    @staticmethod
+    def weaviate_vector_index_config(vector_compression: VectorCompression, dim: int = 1536) -> dict:
+        """HNSW index config that compresses the in-memory vectors. Full precision vectors are still kept with the
+        objects on disk, so they can be used to rescore compressed search results.
+
+        Args:
+            vector_compression: Either product quantization (PQ) or binary quantization (BQ)
+            dim: Dimension of the vectors, the number of PQ segments is the largest divisor of it up to 256
+
+        Returns:
+            The vectorIndexConfig of the class
+        """
+        if vector_compression == VectorCompression.PQ:
+            # As many segments as possible, up to 256, so each vector is held as one byte codes instead of 4 bytes
+            # per dimension (256 codes of 6 dimensions for ada's 1536 dimensions). Weaviate requires the number of
+            # segments to divide the dimension, which projected vectors can have any value of.
+            segments = max(segments for segments in range(1, min(dim, MAX_PQ_SEGMENTS) + 1) if dim % segments == 0)
+            return {
+                "pq": {
+                    "enabled": True,
+                    "segments": segments,
+                    "centroids": 256,
+                    "trainingLimit": 100_000
+                }
+            }
+
+        # One bit per dimension, requires Weaviate 1.24+
         return {
-            "text": f"{self.metadata_str}\n{self.text}" if self.metadata else self.text,
-            "index": self.index
+            "bq": {
+                "enabled": True
+            }
+        }
+
+    def to_weaviate_object(
+            self,
+            webpage_facets: dict | None = None,
+            webpage_ranking_features: dict | None = None
+    ) -> dict:
+        text = f"{self.metadata_str}\n{self.text}" if self.metadata else self.text
+        return {
+            "text": text,
+            "index": self.index,
+            "numTokens": tokenization.count_tokens(text),
+            **(webpage_facets or {}),
+            **(webpage_ranking_features or {})
         }
 
 
 @dataclasses.dataclass
 class Webpage(WeaviateObject):
+    # Page level properties that are copied onto each of the page's TextContent objects
+    FACET_NAMES = ("university", "urlDomain", "mimeType")
+    # Query independent page features that are copied onto each of the page's TextContent objects for re-ranking
+    RANKING_FEATURE_PROPERTIES = (
+        {
+            "name": "numInboundLinks",
+            "dataType": ["int"],
+        },
+        {
+            "name": "lastModified",
+            "dataType": ["date"],
+        },
+        {
+            "name": "pathDepth",
+            "dataType": ["int"],
+        },
+    )
+
     id: str
     url: str
     university: str
     mime_type: MimeType
     html_content: str
     text_contents: list[TextContent]
+    # Number of distinct pages of the crawl linking to the page
+    num_inbound_links: int = 0
+    # RFC 3339 date the page was last modified, None if unknown
+    last_modified: str | None = None
 
     @classmethod
     def weaviate_class_schema(cls, namespace: str):
@@ -122,6 +238,7 @@ class Webpage(WeaviateObject):
                     "name": "html_content",
                     "dataType": ["text"],
                 },
+                *cls.RANKING_FEATURE_PROPERTIES,
                 {
                     "name": "textContents",
                     "dataType": [TextContent.weaviate_class_name(namespace=namespace)],
@@ -134,6 +251,42 @@ class Webpage(WeaviateObject):
         hex_string = hashlib.md5(self.id.encode()).hexdigest()
         return uuid.UUID(hex=hex_string)
 
+    @property
+    def facets(self) -> dict:
+        """The page level properties that are denormalized onto the page's TextContent objects"""
+        return self.build_facets(url=self.url, university=self.university, mime_type=self.mime_type)
+
+    @staticmethod
+    def build_facets(url: str, university: str, mime_type: str | None) -> dict:
+        parsed_url = urllib.parse.urlparse(url if "//" in url else f"//{url}")
+        return {
+            "university": university,
+            "urlDomain": parsed_url.netloc.lower(),
+            "mimeType": mime_type,
+        }
+
+    @property
+    def ranking_features(self) -> dict:
+        """The page features that are denormalized onto the page's TextContent objects"""
+        return self.build_ranking_features(
+            page_features.PageFeatures(
+                num_inbound_links=self.num_inbound_links,
+                last_modified=self.last_modified,
+                path_depth=page_features.path_depth(self.url)
+            )
+        )
+
+    @staticmethod
+    def build_ranking_features(features: page_features.PageFeatures) -> dict:
+        ranking_features = {
+            "numInboundLinks": features.num_inbound_links,
+            "pathDepth": features.path_depth,
+        }
+        # Unknown dates are left unset rather than stored as null
+        if features.last_modified:
+            ranking_features["lastModified"] = features.last_modified
+        return ranking_features
+
     def to_weaviate_object(self) -> dict:
         # Handle converting datetime values as necessary
 
@@ -143,8 +296,89 @@ class Webpage(WeaviateObject):
             "university": self.university,
             "mimeType": self.mime_type,
             "html_content": self.html_content,
+            **self.ranking_features
+        }
+
+
+@dataclasses.dataclass
+class FaqEntry(WeaviateObject):
+    """Canonical question of a university with a pre-generated answer, served without searching or generating.
+
+    The entry is stored with the embedding of its question, so incoming questions are matched against it with a
+    nearest neighbour lookup. Sources are stored as a JSON list of {"url", "text", "score"} objects.
+    """
+    question: str
+    answer: str
+    university: str
+    sources: list[dict] = dataclasses.field(default_factory=list)
+    # Number of distinct users who asked the canonical question, or a rephrasing of it, in the chat logs
+    hit_count: int = 0
+    created_time: str | None = None
+    vector: list[float] | None = None
+
+    @classmethod
+    def weaviate_class_schema(cls, namespace: str):
+        return {
+            "class": cls.weaviate_class_name(namespace=namespace),
+            # Question embeddings are created by the EmbeddingsClient, so they match the (optionally projected)
+            # query embeddings they are compared with
+            "vectorizer": "none",
+            "properties": [
+                {
+                    "name": "question",
+                    "dataType": ["text"],
+                },
+                {
+                    "name": "answer",
+                    "dataType": ["text"],
+                },
+                {
+                    "name": "university",
+                    "dataType": ["text"],
+                    "tokenization": "field",
+                },
+                {
+                    "name": "sources",
+                    "dataType": ["text"],
+                },
+                {
+                    "name": "hitCount",
+                    "dataType": ["int"],
+                },
+                {
+                    "name": "created_time",
+                    "dataType": ["date"],
+                }
+            ]
         }
 
+    @property
+    def weaviate_id(self):
+        # Re-generating the answer of a question overwrites its previous entry
+        hex_string = hashlib.md5(f"{self.university}:{self.question.lower()}".encode()).hexdigest()
+        return uuid.UUID(hex=hex_string)
+
+    def to_weaviate_object(self) -> dict:
+        return {
+            "question": self.question,
+            "answer": self.answer,
+            "university": self.university,
+            "sources": json.dumps(self.sources),
+            "hitCount": self.hit_count,
+            "created_time": self.created_time,
+        }
+
+    @classmethod
+    def from_weaviate_object(cls, weaviate_object: dict) -> "FaqEntry":
+        return cls(
+            question=weaviate_object["question"],
+            answer=weaviate_object["answer"],
+            university=weaviate_object["university"],
+            sources=json.loads(weaviate_object.get("sources") or "[]"),
+            hit_count=weaviate_object.get("hitCount") or 0,
+            created_time=weaviate_object.get("created_time"),
+        )
+
 
 @dataclasses.dataclass
 class CrossReference:
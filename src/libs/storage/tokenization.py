@@ -0,0 +1,55 @@
+import functools
+
+import tiktoken
+
+
+# Encoding of the OpenAI chat models (gpt-3.5-turbo and gpt-4), the token counts stored at ingestion are counted with it
+INGESTION_ENCODING_NAME = "cl100k_base"
+
+# Tokens the chat format adds around each message (including its role) and to prime the reply, see
+# https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model_name: str | None = None) -> tiktoken.Encoding:
+    """Get the tiktoken encoding of an OpenAI model, built once per process
+
+    Args:
+        model_name: Name of the OpenAI model, defaults to the encoding counts are stored with at ingestion
+
+    Returns:
+        The tiktoken encoding
+    """
+    if model_name is None:
+        return tiktoken.get_encoding(INGESTION_ENCODING_NAME)
+
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding(INGESTION_ENCODING_NAME)
+
+
+def has_ingestion_encoding(model_name: str) -> bool:
+    """Check if the token counts stored at ingestion are valid for a model"""
+    return get_encoding(model_name).name == INGESTION_ENCODING_NAME
+
+
+def count_tokens(text: str, model_name: str | None = None) -> int:
+    """Number of tokens in a text"""
+    return len(get_encoding(model_name).encode(text, disallowed_special=()))
+
+
+def count_message_tokens(message_texts: list[str], model_name: str | None = None) -> int:
+    """Number of tokens of a chat prompt made of messages with the given contents"""
+    return (
+        sum(count_tokens(message_text, model_name=model_name) + TOKENS_PER_MESSAGE for message_text in message_texts)
+        + TOKENS_PER_REPLY
+    )
+
+
+def truncate_tokens(text: str, num_tokens: int, model_name: str | None = None) -> str:
+    """First num_tokens tokens of a text"""
+    encoding = get_encoding(model_name)
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max(num_tokens, 0)])
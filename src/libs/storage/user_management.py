@@ -3,6 +3,7 @@ import datetime
 from datetime import datetime as dt
 
 import src.libs.logging as logging
+import src.libs.tracing as tracing
 import src.libs.storage.user_data_classes as data_classes
 
 logger = logging.getLogger(__name__)
@@ -137,6 +138,7 @@ class UserDatabaseManager:
         except:
             pass
 
+    @tracing.traced("user_db.user_exists")
     def user_exists(self, gmail: str) -> bool:
         """Check if a Webpage object exists in Weaviate
 
@@ -155,6 +157,7 @@ class UserDatabaseManager:
 
         return False
 
+    @tracing.traced("user_db.create_user")
     def create_user(self, user: User) -> bool:
         """
         Create a User in Weaviate and initialize a Conversation and ProfileInformation object for them
@@ -211,6 +214,7 @@ class UserDatabaseManager:
 
         return True
 
+    @tracing.traced("user_db.insert_message")
     def insert_message(self, user_message: UserMessage, bot_message: BotMessage, gmail: str):
         user_message_uuid = ""
         bot_message_uuid = ""
@@ -296,10 +300,12 @@ class UserDatabaseManager:
 
         return bot_message_uuid
 
+    @tracing.traced("user_db.insert_bad_query")
     def insert_bad_query(self, query_str: str, gmail: str):
         pass
         # TODO
 
+    @tracing.traced("user_db.insert_liked")
     def insert_liked(self, liked: bool, bot_message_id: str):
         try:
             current_liked_state = self._get_current_liked_state(bot_message_id=bot_message_id)
@@ -343,6 +349,7 @@ class UserDatabaseManager:
     #     #     return "Couldn't do it"
     #     return "True"
 
+    @tracing.traced("user_db.get_messages_for_user")
     def get_messages_for_user(self, gmail: str):
         """
         Get the messages for a user based on their Gmail
@@ -395,6 +402,54 @@ class UserDatabaseManager:
             logger.warning(f"No User object found with the Gmail: {gmail}")
             return message_list
 
+    def get_user_queries(self, batch_size: int = 500) -> list[tuple[str, str]]:
+        """
+        Get every query sent by any user, e.g. to find the most commonly asked questions
+
+        Args:
+            batch_size: Number of messages fetched per cursor page
+
+        Returns:
+            A list of (query, gmail of the user who sent it) pairs
+        """
+        user_message_class_name = UserMessage.weaviate_class_name(namespace=self.namespace)
+        conversation_class_name = Conversation.weaviate_class_name(namespace=self.namespace)
+        user_class_name = User.weaviate_class_name(namespace=self.namespace)
+
+        user_queries = []
+        cursor = None
+        while True:
+            query = (
+                self.client.query
+                .get(user_message_class_name, [
+                    "query_str",
+                    f"hasConversation {{ ... on {conversation_class_name} {{ hasUser {{ ... on {user_class_name} {{ gmail }} }} }} }}"
+                ])
+                .with_additional(["id"])
+                .with_limit(batch_size)
+            )
+            if cursor:
+                query = query.with_after(cursor)
+            messages = query.do()["data"]["Get"][user_message_class_name]
+            if not messages:
+                break
+
+            for message in messages:
+                try:
+                    gmail = message["hasConversation"][0]["hasUser"][0]["gmail"]
+                except (KeyError, IndexError, TypeError):
+                    # Messages of deleted conversations or users
+                    continue
+                if message.get("query_str"):
+                    user_queries.append((message["query_str"], gmail))
+
+            cursor = messages[-1]["_additional"]["id"]
+
+        logger.info(f"Got {len(user_queries)} user queries")
+
+        return user_queries
+
+    @tracing.traced("user_db.num_user_messages_24hrs")
     def num_user_messages_24hrs(self, gmail: str):
         """
         Get the number of messages for a user based on their Gmail
@@ -429,6 +484,7 @@ class UserDatabaseManager:
             logger.warning(f"No User object found with the Gmail: {gmail}")
             return num_user_messages
 
+    @tracing.traced("user_db.clear_conversation")
     def clear_conversation(self, gmail: str):
         """
         Clear the conversation for a user based on their Gmail
@@ -468,6 +524,7 @@ class UserDatabaseManager:
         logger.info(results['data']['Get'][User.weaviate_class_name(namespace=self.namespace)][0]['hasConversation'][0][
                         'messages'])
 
+    @tracing.traced("user_db.insert_profile_info")
     def insert_profile_info(self, gmail: str, profile_info_lst: [ProfileInformation]):
         """
         Insert profile information for a user based on their Gmail
@@ -519,6 +576,7 @@ class UserDatabaseManager:
         except Exception as e:
             logger.error(f"Error adding profile information: {e}")
 
+    @tracing.traced("user_db.get_profile_info_for_user")
     def get_profile_info_for_user(self, gmail: str):
         """
         Get the profile information for a user based on their Gmail
@@ -552,6 +610,7 @@ class UserDatabaseManager:
 
             return profile_info_dict
 
+    @tracing.traced("user_db.delete_profile_info_for_user")
     def delete_profile_info_for_user(self, gmail: str):
         """
         Delete the profile information for a user based on their Gmail
@@ -584,6 +643,7 @@ class UserDatabaseManager:
         except Exception as e:
             logger.error(f"Error clearing profile information: {e}")
 
+    @tracing.traced("user_db.get_profile_info_vector_for_user")
     def get_profile_info_vector_for_user(self, gmail: str):
         """
         Get the profile information vector for a user based on their Gmail
@@ -616,6 +676,7 @@ class UserDatabaseManager:
         else:
             return profile_info_object
 
+    @tracing.traced("user_db.update_profile_info_vector")
     def update_profile_info_vector(self, gmail: str, profile_info_vect: list[float]):
         """
         Update the profile information vector for a user based on their Gmail
@@ -9,6 +9,9 @@ import weaviate
 
 import src.libs.storage.storage_data_classes as data_classes
 import src.libs.storage.embeddings as embeddings
+import src.libs.storage.embedding_projection as embedding_projection
+import src.libs.storage.page_features as page_features
+import src.libs.storage.tokenization as tokenization
 import src.libs.logging as logging
 from datetime import datetime, timezone, timedelta
 
@@ -21,6 +24,15 @@ WeaviateObject = data_classes.WeaviateObject
 TextContent = data_classes.TextContent
 Webpage = data_classes.Webpage
 CrossReference = data_classes.CrossReference
+VectorCompression = data_classes.VectorCompression
+FaqEntry = data_classes.FaqEntry
+
+# Seconds whether the TextContent objects hold the facets of their webpage is cached for, so searches pick up a
+# facets backfill run by another process
+FACETS_FLAG_TTL_SECONDS = 300
+# Seconds the backfilled properties of the TextContent class are cached for, so searches pick up a backfill run by
+# another process
+SCHEMA_PROPERTIES_TTL_SECONDS = 300
 
 
 class RetryableBatch(weaviate.batch.Batch):
@@ -44,7 +56,10 @@ class WeaviateStore:
         api_key: str,
         openai_api_key: str,
         cohere_api_key: str,
-        namespace: str | None = None
+        namespace: str | None = None,
+        multi_tenant: bool = False,
+        vector_compression: VectorCompression | None = None,
+        embedding_projection: embedding_projection.EmbeddingProjection | None = None
     ):
         weaviate.client.Batch = RetryableBatch
         self.client = weaviate.Client(
@@ -62,15 +77,31 @@ class WeaviateStore:
             connection_error_retries=5
         )
         self.namespace = namespace
-
-        self._embeddings_client = embeddings.EmbeddingsClient(openai_api_key=openai_api_key)
+        # When True, each university's objects are stored in its own tenant of every class, so each university
+        # has its own vector index instead of sharing one that queries have to filter down to a single university
+        self.multi_tenant = multi_tenant
+        # Quantization of the TextContent vectors held in memory by Weaviate's HNSW index
+        self.vector_compression = vector_compression
+
+        # With a projection, every embedding (chunks at ingestion, queries and profiles) is reduced to fewer dimensions
+        self._embeddings_client = embeddings.EmbeddingsClient(
+            openai_api_key=openai_api_key,
+            projection=embedding_projection
+        )
         self.open_api_key = openai_api_key
-
-    def create_schema(self, delete_if_exists: bool = False):
+        # Cached text_content_has_facets value, and the time.monotonic() value it was read at
+        self._text_content_has_facets: bool | None = None
+        self._text_content_has_facets_time = 0.0
+        # Cached backfilled_text_content_properties value, and the time.monotonic() value it was read at
+        self._backfilled_text_content_properties: list[str] | None = None
+        self._backfilled_text_content_properties_time = 0.0
+
+    def create_schema(self, delete_if_exists: bool = False, universities: list[str] | None = None):
         """Create all classes in Weaviate schema
 
         Args:
             delete_if_exists: If class already exists and this is True, re-create it. If False, do nothing.
+            universities: Only relevant for multi-tenant stores, the universities to create tenants for
         """
         weaviate_classes = [TextContent, Webpage]
 
@@ -84,18 +115,100 @@ class WeaviateStore:
                     raise Exception(f"Can't create schema because {weaviate_class_name} already exists. "
                                     f"Set delete_if_exists=True to re-create the schema.")
 
-        self.client.schema.create({
-            "classes": [
-                weaviate_class.weaviate_class_schema(namespace=self.namespace)
-                for weaviate_class in weaviate_classes
-            ]
-        })
+        weaviate_class_schemas = [
+            TextContent.weaviate_class_schema(
+                namespace=self.namespace,
+                vector_compression=self.vector_compression,
+                dim=self._embeddings_client.dim
+            ),
+            Webpage.weaviate_class_schema(namespace=self.namespace)
+        ]
+        if self.multi_tenant:
+            for weaviate_class_schema in weaviate_class_schemas:
+                weaviate_class_schema["multiTenancyConfig"] = {"enabled": True}
+
+        self.client.schema.create({"classes": weaviate_class_schemas})
+
+        for university in universities or []:
+            self.add_university(university)
+
+    def enable_vector_compression(self):
+        """Compress the vectors of an existing TextContent class. With PQ, Weaviate trains the codebook on the
+        objects already in the class, so this should be run after the data has been ingested.
+        """
+        if not self.vector_compression:
+            raise Exception("Can't enable vector compression because vector_compression is not set")
+
+        text_content_class_name = TextContent.weaviate_class_name(namespace=self.namespace)
+        logger.info(f"Enabling {self.vector_compression.value} compression on {text_content_class_name}")
+        self.client.schema.update_config(
+            text_content_class_name,
+            {
+                "vectorIndexConfig": TextContent.weaviate_vector_index_config(
+                    vector_compression=self.vector_compression,
+                    dim=self._embeddings_client.dim
+                )
+            }
+        )
+
+    @property
+    def universities(self) -> list[str]:
+        """Universities that have a tenant in a multi-tenant store"""
+        if not self.multi_tenant:
+            raise Exception("Universities are only partitioned into tenants when multi_tenant=True")
+
+        tenants = self.client.schema.get_class_tenants(TextContent.weaviate_class_name(namespace=self.namespace))
+        return sorted(tenant.name for tenant in tenants)
+
+    def tenant(self, university: str) -> str | None:
+        """The tenant that holds the objects of a university, None if the store isn't multi-tenant"""
+        return university if self.multi_tenant else None
+
+    def add_university(self, university: str):
+        """Add a tenant for a university to every class of a multi-tenant store. The tenants of other universities
+        are not touched, so a new university can be ingested while the others keep serving searches.
+
+        Args:
+            university: The university to add, e.g. "BU"
+        """
+        if university in self.universities:
+            return
+
+        logger.info(f"Adding tenant for {university}")
+        for weaviate_class in [TextContent, Webpage]:
+            self.client.schema.add_class_tenants(
+                class_name=weaviate_class.weaviate_class_name(namespace=self.namespace),
+                tenants=[weaviate.Tenant(name=university)]
+            )
+
+    def remove_university(self, university: str):
+        """Delete the tenant of a university, and with it all of its objects, from every class of a multi-tenant
+        store. The tenants of other universities are not touched.
+
+        Args:
+            university: The university to remove, e.g. "BU"
+        """
+        if university not in self.universities:
+            logger.warning(f"{university} does not have a tenant in Weaviate")
+            return
+
+        logger.info(f"Removing tenant for {university}")
+        for weaviate_class in [TextContent, Webpage]:
+            self.client.schema.remove_class_tenants(
+                class_name=weaviate_class.weaviate_class_name(namespace=self.namespace),
+                tenants=[university]
+            )
 
     def insert_webpages(self, webpages: list[Webpage]):
         # We build a list of the webpages we've inserted to refresh at the end to create the centroid vectors
         webpages_to_refresh_centroid_vector = []
         webpages_that_failed = []
 
+        # Make sure every university being inserted has a tenant to insert into
+        if self.multi_tenant:
+            for university in sorted({webpage.university for webpage in webpages}):
+                self.add_university(university)
+
         # Insert all data objects and references that support batching with batch
         logger.info("Creating webpage objects in Weaviate")
         with self.client.batch as batch:
@@ -104,13 +217,15 @@ class WeaviateStore:
             time.sleep(0.5)
             for webpage in tqdm.tqdm(webpages, total=len(webpages), desc="webpages"):
                 time.sleep(0.4)
+                tenant = self.tenant(webpage.university)
                 # Add the webpage object
                 webpage_uuid = batch.add_data_object(
                     class_name=Webpage.weaviate_class_name(namespace=self.namespace),
                     uuid=webpage.weaviate_id,
                     data_object=webpage.to_weaviate_object(),
+                    tenant=tenant
                 )
-                webpages_to_refresh_centroid_vector.append(webpage_uuid)
+                webpages_to_refresh_centroid_vector.append((webpage_uuid, tenant))
                 webpages_that_failed.append(webpage_uuid)
 
                 try:
@@ -118,22 +233,28 @@ class WeaviateStore:
                     for text_content in webpage.text_contents:
                         text_content_uuid = batch.add_data_object(
                             class_name=TextContent.weaviate_class_name(namespace=self.namespace),
-                            data_object=text_content.to_weaviate_object(),
-                            vector=text_content.vector
+                            data_object=text_content.to_weaviate_object(
+                                webpage_facets=webpage.facets,
+                                webpage_ranking_features=webpage.ranking_features
+                            ),
+                            vector=text_content.vector,
+                            tenant=tenant
                         )
                         batch.add_reference(
                             from_object_class_name=TextContent.weaviate_class_name(namespace=self.namespace),
                             from_object_uuid=text_content_uuid,
                             from_property_name="contentOf",
                             to_object_class_name=Webpage.weaviate_class_name(namespace=self.namespace),
-                            to_object_uuid=webpage_uuid
+                            to_object_uuid=webpage_uuid,
+                            tenant=tenant
                         )
                         batch.add_reference(
                             from_object_class_name=Webpage.weaviate_class_name(namespace=self.namespace),
                             from_object_uuid=webpage_uuid,
                             from_property_name="textContents",
                             to_object_class_name=TextContent.weaviate_class_name(namespace=self.namespace),
-                            to_object_uuid=text_content_uuid
+                            to_object_uuid=text_content_uuid,
+                            tenant=tenant
                         )
                     webpages_that_failed.remove(webpage_uuid)
                 except:
@@ -144,7 +265,7 @@ class WeaviateStore:
         # Add the references from Webpage -> TextContent. These need to be added outside the batch because
         # ref2vec-centroid does not support batch updates
         logger.info("Refreshing centroid vectors")
-        for webpage_uuid in tqdm.tqdm(
+        for webpage_uuid, tenant in tqdm.tqdm(
             webpages_to_refresh_centroid_vector,
             total=len(webpages_to_refresh_centroid_vector),
             desc="Webpage -> TextContent centroid vectors"
@@ -153,10 +274,359 @@ class WeaviateStore:
             self.client.data_object.update(
                 class_name=Webpage.weaviate_class_name(namespace=self.namespace),
                 uuid=webpage_uuid,
-                data_object={"textContents": []}
+                data_object={"textContents": []},
+                tenant=tenant
             )
         logger.info("Refreshed centroid vectors")
 
+    @property
+    def text_content_has_facets(self) -> bool:
+        """Whether every TextContent object holds the facets of its webpage, so searches can filter on them instead of
+        on the contentOf cross-reference. True for classes created with the facets, and set by
+        backfill_text_content_facets() once it has copied them onto the older objects.
+        """
+        # Multi-tenant classes were introduced after the facets, so their objects always have them
+        if self.multi_tenant:
+            return True
+
+        now = time.monotonic()
+        if self._text_content_has_facets is None or now - self._text_content_has_facets_time > FACETS_FLAG_TTL_SECONDS:
+            try:
+                text_content_class = self.client.schema.get(TextContent.weaviate_class_name(namespace=self.namespace))
+                self._text_content_has_facets = text_content_class.get("description") == TextContent.FACETED_DESCRIPTION
+            except Exception as e:
+                logger.warning(f"Failed to check whether TextContent objects have facets: {e}")
+                self._text_content_has_facets = bool(self._text_content_has_facets)
+            self._text_content_has_facets_time = now
+
+        return self._text_content_has_facets
+
+    @property
+    def backfilled_text_content_properties(self) -> list[str]:
+        """The properties of TextContent.BACKFILLED_PROPERTY_NAMES the TextContent class has. Weaviate rejects queries
+        for properties missing from the schema, so searches only request these, the others are left as None.
+        """
+        now = time.monotonic()
+        if self._backfilled_text_content_properties is None \
+                or now - self._backfilled_text_content_properties_time > SCHEMA_PROPERTIES_TTL_SECONDS:
+            try:
+                text_content_class = self.client.schema.get(TextContent.weaviate_class_name(namespace=self.namespace))
+                existing_properties = {
+                    weaviate_property["name"] for weaviate_property in text_content_class["properties"]
+                }
+                self._backfilled_text_content_properties = [
+                    name for name in TextContent.BACKFILLED_PROPERTY_NAMES if name in existing_properties
+                ]
+            except Exception as e:
+                logger.warning(f"Failed to check which backfilled properties TextContent objects have: {e}")
+                self._backfilled_text_content_properties = self._backfilled_text_content_properties or []
+            self._backfilled_text_content_properties_time = now
+
+        return self._backfilled_text_content_properties
+
+    def backfill_text_content_facets(self, batch_size: int = 500) -> int:
+        """Copy the page level facets (university, URL domain and mime type) of each Webpage onto its TextContent
+        objects, for objects inserted before the facets were denormalized.
+
+        Args:
+            batch_size: Number of TextContent objects fetched per cursor page
+
+        Returns:
+            The number of TextContent objects updated
+        """
+        # Multi-tenant classes were introduced after the facets, so their objects always have them
+        if self.multi_tenant:
+            return 0
+
+        text_content_class_name = TextContent.weaviate_class_name(namespace=self.namespace)
+        webpage_class_name = Webpage.weaviate_class_name(namespace=self.namespace)
+
+        # Add the facet properties to the existing class schema
+        existing_properties = {
+            weaviate_property["name"]
+            for weaviate_property in self.client.schema.get(text_content_class_name)["properties"]
+        }
+        for weaviate_property in TextContent.weaviate_class_schema(namespace=self.namespace)["properties"]:
+            if weaviate_property["name"] in Webpage.FACET_NAMES and weaviate_property["name"] not in existing_properties:
+                self.client.schema.property.create(text_content_class_name, weaviate_property)
+
+        logger.info("Backfilling TextContent facets")
+        num_updated = 0
+        cursor = None
+        with tqdm.tqdm(desc="TextContent facets") as progress_bar:
+            while True:
+                query = (
+                    self.client.query
+                    .get(text_content_class_name,
+                         ["university", f"contentOf {{ ... on {webpage_class_name} {{ url, mimeType, university }} }}"])
+                    .with_additional(properties=["id"])
+                    .with_limit(batch_size)
+                )
+                if cursor:
+                    query = query.with_after(cursor)
+                text_contents = query.do()["data"]["Get"][text_content_class_name]
+                if not text_contents:
+                    break
+
+                for text_content in text_contents:
+                    progress_bar.update(1)
+                    if text_content.get("university") or not text_content.get("contentOf"):
+                        continue
+                    webpage = text_content["contentOf"][0]
+                    self.client.data_object.update(
+                        class_name=text_content_class_name,
+                        uuid=text_content["_additional"]["id"],
+                        data_object=Webpage.build_facets(
+                            url=webpage["url"],
+                            university=webpage["university"],
+                            mime_type=webpage.get("mimeType")
+                        )
+                    )
+                    num_updated += 1
+
+                cursor = text_contents[-1]["_additional"]["id"]
+
+        # Every object has the facets now, searches filter on them from here on (see text_content_has_facets)
+        self.client.schema.update_config(text_content_class_name, {"description": TextContent.FACETED_DESCRIPTION})
+        self._text_content_has_facets = True
+        logger.info(f"Backfilled facets on {num_updated} TextContent objects")
+
+        return num_updated
+
+    def backfill_text_content_num_tokens(self, batch_size: int = 500) -> int:
+        """Count the tokens of each TextContent object inserted before token counts were stored at ingestion.
+
+        Args:
+            batch_size: Number of TextContent objects fetched per cursor page
+
+        Returns:
+            The number of TextContent objects updated
+        """
+        text_content_class_name = TextContent.weaviate_class_name(namespace=self.namespace)
+
+        # Add the numTokens property to the existing class schema
+        existing_properties = {
+            weaviate_property["name"]
+            for weaviate_property in self.client.schema.get(text_content_class_name)["properties"]
+        }
+        if "numTokens" not in existing_properties:
+            self.client.schema.property.create(text_content_class_name, {"name": "numTokens", "dataType": ["int"]})
+            self._backfilled_text_content_properties = None
+
+        logger.info("Backfilling TextContent token counts")
+        num_updated = 0
+        tenants = self.universities if self.multi_tenant else [None]
+        with tqdm.tqdm(desc="TextContent token counts") as progress_bar:
+            for tenant in tenants:
+                cursor = None
+                while True:
+                    query = (
+                        self.client.query
+                        .get(text_content_class_name, ["text", "numTokens"])
+                        .with_additional(properties=["id"])
+                        .with_limit(batch_size)
+                    )
+                    if tenant:
+                        query = query.with_tenant(tenant)
+                    if cursor:
+                        query = query.with_after(cursor)
+                    text_contents = query.do()["data"]["Get"][text_content_class_name]
+                    if not text_contents:
+                        break
+
+                    for text_content in text_contents:
+                        progress_bar.update(1)
+                        if text_content.get("numTokens") is not None:
+                            continue
+                        self.client.data_object.update(
+                            class_name=text_content_class_name,
+                            uuid=text_content["_additional"]["id"],
+                            data_object={"numTokens": tokenization.count_tokens(text_content["text"])},
+                            tenant=tenant
+                        )
+                        num_updated += 1
+
+                    cursor = text_contents[-1]["_additional"]["id"]
+
+        logger.info(f"Backfilled token counts on {num_updated} TextContent objects")
+
+        return num_updated
+
+    def backfill_page_features(self, batch_size: int = 100) -> int:
+        """Compute the ranking features of every Webpage (inbound links, last modified date and path depth) from its
+        stored HTML, and copy them onto its TextContent objects.
+
+        Inbound links are counted over every page of a university, so this also refreshes the counts of pages
+        ingested in earlier batches than the pages linking to them.
+
+        Args:
+            batch_size: Number of Webpage and TextContent objects fetched per cursor page
+
+        Returns:
+            The number of TextContent objects updated
+        """
+        text_content_class_name = TextContent.weaviate_class_name(namespace=self.namespace)
+        webpage_class_name = Webpage.weaviate_class_name(namespace=self.namespace)
+
+        # Add the ranking feature properties to the existing class schemas
+        for class_name in (webpage_class_name, text_content_class_name):
+            existing_properties = {
+                weaviate_property["name"] for weaviate_property in self.client.schema.get(class_name)["properties"]
+            }
+            for weaviate_property in Webpage.RANKING_FEATURE_PROPERTIES:
+                if weaviate_property["name"] not in existing_properties:
+                    self.client.schema.property.create(class_name, dict(weaviate_property))
+        self._backfilled_text_content_properties = None
+
+        logger.info("Backfilling page features")
+        num_updated = 0
+        tenants = self.universities if self.multi_tenant else [None]
+        for tenant in tenants:
+            # First pass: extract the links and last modified date of every page, without holding their HTML
+            webpage_ids = {}
+            link_targets_by_url = {}
+            last_modified_by_url = {}
+            for webpage in tqdm.tqdm(
+                self._scan(class_name=webpage_class_name, properties=["url", "html_content"], tenant=tenant,
+                           batch_size=batch_size),
+                desc="Webpage links"
+            ):
+                url = webpage["url"]
+                webpage_ids[url] = webpage["_additional"]["id"]
+                html_content = webpage.get("html_content") or ""
+                link_targets_by_url[url] = page_features.extract_link_targets(url=url, html_content=html_content)
+                last_modified_by_url[url] = page_features.extract_last_modified(html_content)
+
+            num_inbound_links = page_features.count_inbound_links(link_targets_by_url)
+            ranking_features_by_url = {
+                url: Webpage.build_ranking_features(
+                    page_features.PageFeatures(
+                        num_inbound_links=num_inbound_links[page_features.normalize_url(url)],
+                        last_modified=last_modified_by_url[url],
+                        path_depth=page_features.path_depth(url)
+                    )
+                )
+                for url in webpage_ids
+            }
+            for url, webpage_id in tqdm.tqdm(webpage_ids.items(), desc="Webpage features"):
+                self.client.data_object.update(
+                    class_name=webpage_class_name,
+                    uuid=webpage_id,
+                    data_object=ranking_features_by_url[url],
+                    tenant=tenant
+                )
+
+            # Second pass: copy the features of each page onto its TextContent objects
+            for text_content in tqdm.tqdm(
+                self._scan(class_name=text_content_class_name,
+                           properties=[f"contentOf {{ ... on {webpage_class_name} {{ url }} }}"], tenant=tenant,
+                           batch_size=batch_size),
+                desc="TextContent features"
+            ):
+                if not text_content.get("contentOf"):
+                    continue
+                ranking_features = ranking_features_by_url.get(text_content["contentOf"][0]["url"])
+                if ranking_features is None:
+                    continue
+                self.client.data_object.update(
+                    class_name=text_content_class_name,
+                    uuid=text_content["_additional"]["id"],
+                    data_object=ranking_features,
+                    tenant=tenant
+                )
+                num_updated += 1
+
+        logger.info(f"Backfilled page features on {num_updated} TextContent objects")
+
+        return num_updated
+
+    def _scan(self, class_name: str, properties: list[str], tenant: str | None, batch_size: int):
+        """Iterate over every object of a class with a cursor, fetching the given properties and their id"""
+        cursor = None
+        while True:
+            query = (
+                self.client.query
+                .get(class_name, properties)
+                .with_additional(properties=["id"])
+                .with_limit(batch_size)
+            )
+            if tenant:
+                query = query.with_tenant(tenant)
+            if cursor:
+                query = query.with_after(cursor)
+            objects = query.do()["data"]["Get"][class_name]
+            if not objects:
+                break
+
+            yield from objects
+            cursor = objects[-1]["_additional"]["id"]
+
+    def create_faq_schema(self, delete_if_exists: bool = False):
+        """Create the FaqEntry class. It is kept apart from create_schema(), so the FAQ index can be rebuilt
+        without touching the ingested webpages.
+
+        Args:
+            delete_if_exists: If the class already exists and this is True, re-create it. If False, do nothing.
+        """
+        faq_entry_class_name = FaqEntry.weaviate_class_name(namespace=self.namespace)
+        if self.client.schema.exists(faq_entry_class_name):
+            if not delete_if_exists:
+                return
+            self.client.schema.delete_class(faq_entry_class_name)
+
+        self.client.schema.create_class(FaqEntry.weaviate_class_schema(namespace=self.namespace))
+
+    def insert_faq_entries(self, faq_entries: list[FaqEntry]):
+        """Insert FAQ entries with the embeddings of their questions. An entry with the same university and question
+        as an existing entry replaces it.
+
+        Args:
+            faq_entries: The entries to insert
+        """
+        faq_entries_without_vector = [faq_entry for faq_entry in faq_entries if faq_entry.vector is None]
+        if faq_entries_without_vector:
+            vectors = self._embeddings_client.create_embeddings(
+                [faq_entry.question for faq_entry in faq_entries_without_vector]
+            )
+            for faq_entry, vector in zip(faq_entries_without_vector, vectors):
+                faq_entry.vector = vector
+
+        logger.info(f"Inserting {len(faq_entries)} FAQ entries in Weaviate")
+        with self.client.batch as batch:
+            for faq_entry in faq_entries:
+                batch.add_data_object(
+                    class_name=FaqEntry.weaviate_class_name(namespace=self.namespace),
+                    uuid=faq_entry.weaviate_id,
+                    data_object=faq_entry.to_weaviate_object(),
+                    vector=faq_entry.vector
+                )
+
+    def search_faq(self, question_vector: list[float], university: str, limit: int = 1) -> list[tuple[FaqEntry, float]]:
+        """Find the FAQ entries of a university whose questions are nearest to a question
+
+        Args:
+            question_vector: Embedding of the question
+            university: The university the entries are answered for
+            limit: Number of entries to return
+
+        Returns:
+            List of (entry, certainty) pairs, most certain first
+        """
+        faq_entry_class_name = FaqEntry.weaviate_class_name(namespace=self.namespace)
+        response = (
+            self.client.query
+            .get(faq_entry_class_name, ["question", "answer", "university", "sources", "hitCount", "created_time"])
+            .with_near_vector({"vector": question_vector})
+            .with_where({"path": ["university"], "operator": "Equal", "valueText": university})
+            .with_additional(["certainty"])
+            .with_limit(limit)
+            .do()
+        )
+        return [
+            (FaqEntry.from_weaviate_object(faq_entry), faq_entry["_additional"]["certainty"])
+            for faq_entry in response["data"]["Get"][faq_entry_class_name]
+        ]
+
     def insert_references(self, references: list[CrossReference]):
         logger.info("Creating references in Weaviate")
         with self.client.batch as batch:
@@ -171,20 +641,25 @@ class WeaviateStore:
 
         logger.info("Created references in Weaviate")
 
-    def delete_webpage(self, url: str):
+    def delete_webpage(self, url: str, university: str | None = None):
         """Delete a Webpage object from Weaviate given its URL
 
         Args:
             url: The URL of the Webpage object to delete
+            university: The university the webpage belongs to, required for multi-tenant stores
         """
+        tenant = self.tenant(university) if university else None
+
         # We first get the Webpage object to find its uuid
         # The where filter is used to match the webpage url
-        webpage_result = (
+        webpage_query = (
             self.client.query
             .get(Webpage.weaviate_class_name(namespace=self.namespace), ["_additional { id }"])
             .with_where({"path": ["url"], "operator": "Equal", "valueText": url})
-            .do()
         )
+        if tenant:
+            webpage_query = webpage_query.with_tenant(tenant)
+        webpage_result = webpage_query.do()
 
         # Check if webpage exists
         if webpage_result['data']['Get']:
@@ -192,7 +667,7 @@ class WeaviateStore:
 
             # Before deleting the webpage object, we delete all the TextContent objects related to it
 
-            text_content_results = (
+            text_content_query = (
                 self.client.query
                 .get(TextContent.weaviate_class_name(namespace=self.namespace), ["_additional { id }"])
                 .with_where({
@@ -200,13 +675,16 @@ class WeaviateStore:
                     "operator": "Like",
                     "valueText": url
                 })
-                .do()
             )
+            if tenant:
+                text_content_query = text_content_query.with_tenant(tenant)
+            text_content_results = text_content_query.do()
             try:
                 for text_content in text_content_results['data']['Get']['Jonahs_weaviate_infodb_TextContent']:
                     self.client.data_object.delete(
                         class_name=TextContent.weaviate_class_name(namespace=self.namespace),
-                        uuid=text_content["_additional"]["id"]
+                        uuid=text_content["_additional"]["id"],
+                        tenant=tenant
                     )
             except Exception as e:
                 print(f"No text content found for webpage {url} or error {e}")
@@ -215,7 +693,8 @@ class WeaviateStore:
             try:
                 self.client.data_object.delete(
                     class_name=Webpage.weaviate_class_name(namespace=self.namespace),
-                    uuid=webpage_uuid
+                    uuid=webpage_uuid,
+                    tenant=tenant
                 )
 
                 logger.info(f"Webpage with url {url} has been deleted from Weaviate")
@@ -416,6 +895,18 @@ class WeaviateStore:
         print(f"Total TextContent objects deleted: {total_deleted_text_contents}")
         print(f"Total webpages containing 'berkeley' deleted: {total_deleted_webpages}")
 
+    @property
+    def embedding_projection(self) -> embedding_projection.EmbeddingProjection | None:
+        return self._embeddings_client.projection
+
     def create_embedding(self, text: str) -> list[list[float]]:
         """Get the embedding for a text using OpenAI Embedding API"""
         return self._embeddings_client.create_embedding(text=text)
+
+    def create_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """Get the embeddings for a list of texts using OpenAI Embedding API"""
+        return self._embeddings_client.create_embeddings(texts=texts)
+
+    def project_embedding(self, embedding: list[float]) -> list[float]:
+        """Project an embedding created before the embedding projection was enabled, like a stored profile vector"""
+        return self._embeddings_client.project_embedding(embedding=embedding)
@@ -0,0 +1,340 @@
+"""Lightweight in-process tracing of requests.
+
+A trace is started for each request with start_trace(). The stages of the request record nested spans with span() or
+the traced() decorator, each with its duration and attributes (e.g. the token counts of LLM calls). Once the request
+is done, the spans of its trace are exported to the configured exporters, in a background thread.
+
+Spans are only recorded within a trace, and traces only when an exporter is configured, so instrumented code costs
+next to nothing otherwise.
+"""
+import concurrent.futures
+import contextlib
+import contextvars
+import dataclasses
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import typing
+
+import requests
+
+import src.libs.logging as logging
+
+logger = logging.getLogger(__name__)
+
+
+# Name of the service the spans are attributed to in OTLP exports
+DEFAULT_SERVICE_NAME = "chatbot"
+# Seconds an OTLP export waits for the collector
+OTLP_EXPORT_TIMEOUT_SECONDS = 5.0
+
+T = typing.TypeVar("T")
+
+
+@dataclasses.dataclass
+class Span:
+    """Timed stage of a request"""
+    name: str
+    # None when the span isn't recorded, i.e. outside of a trace
+    trace_id: str | None
+    span_id: str
+    parent_id: str | None
+    # time.time() values
+    start_time: float
+    end_time: float | None = None
+    attributes: dict = dataclasses.field(default_factory=dict)
+    # repr() of the exception the span ended with, None if it succeeded
+    error: str | None = None
+    parent: "Span | None" = dataclasses.field(default=None, repr=False)
+    trace: "_Trace | None" = dataclasses.field(default=None, repr=False)
+
+    @property
+    def duration(self) -> float | None:
+        return self.end_time - self.start_time if self.end_time is not None else None
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_tokens(self, prompt_tokens: int, completion_tokens: int):
+        """Count the tokens of an LLM call in the span and in every span it is nested in"""
+        span = self
+        while span is not None:
+            span.attributes["prompt_tokens"] = span.attributes.get("prompt_tokens", 0) + prompt_tokens
+            span.attributes["completion_tokens"] = span.attributes.get("completion_tokens", 0) + completion_tokens
+            span = span.parent
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration": round(self.duration, 4) if self.duration is not None else None,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _Trace:
+    """Spans of a request, ended spans are added from the event loop and from executor threads"""
+    def __init__(self):
+        self.trace_id = _new_id(16)
+        self._lock = threading.Lock()
+        self._spans: list[Span] = []
+
+    def add(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+
+    @property
+    def spans(self) -> list[Span]:
+        with self._lock:
+            return list(self._spans)
+
+
+class JsonlExporter:
+    """Appends the spans of each trace to a JSON lines file, one span per line
+
+    Args:
+        path: Path of the file, created if it doesn't exist
+    """
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[Span]):
+        lines = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans)
+        with self._lock, open(self._path, "a") as file:
+            file.write(lines)
+
+
+class OTLPExporter:
+    """Posts the spans of each trace to an OpenTelemetry collector, with the OTLP/HTTP JSON encoding
+
+    Args:
+        endpoint: URL of the collector's traces endpoint, e.g. http://localhost:4318/v1/traces
+        service_name: Name of the service the spans are attributed to
+    """
+    def __init__(self, endpoint: str, service_name: str = DEFAULT_SERVICE_NAME):
+        self._endpoint = endpoint
+        self._service_name = service_name
+
+    def export(self, spans: list[Span]):
+        response = requests.post(self._endpoint, json=self.to_otlp(spans), timeout=OTLP_EXPORT_TIMEOUT_SECONDS)
+        response.raise_for_status()
+
+    def to_otlp(self, spans: list[Span]) -> dict:
+        """ExportTraceServiceRequest of the spans, in the OTLP JSON encoding"""
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _to_otlp_attributes({"service.name": self._service_name})},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [
+                        {
+                            "traceId": span.trace_id,
+                            "spanId": span.span_id,
+                            **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                            "name": span.name,
+                            # SPAN_KIND_INTERNAL
+                            "kind": 1,
+                            "startTimeUnixNano": str(int(span.start_time * 1e9)),
+                            "endTimeUnixNano": str(int(span.end_time * 1e9)),
+                            "attributes": _to_otlp_attributes(span.attributes),
+                            # STATUS_CODE_ERROR or STATUS_CODE_OK
+                            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+                        }
+                        for span in spans
+                    ],
+                }],
+            }]
+        }
+
+
+Exporter = JsonlExporter | OTLPExporter
+
+
+class Tracer:
+    """Exports the spans of finished traces to exporters, in a background thread so requests don't wait for it
+
+    Args:
+        exporters: Where the spans are exported to, traces aren't recorded without any
+    """
+    def __init__(self, exporters: list[Exporter]):
+        self._exporters = exporters
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._exporters)
+
+    def export(self, spans: list[Span]):
+        for exporter in self._exporters:
+            self._executor.submit(self._export, exporter, spans)
+
+    @staticmethod
+    def _export(exporter: Exporter, spans: list[Span]):
+        try:
+            exporter.export(spans)
+        except Exception as e:
+            logger.warning(f"Failed to export {len(spans)} spans with {type(exporter).__name__}: {e}")
+
+
+_tracer = Tracer(exporters=[])
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar("current_span", default=None)
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def configure(jsonl_path: str | None = None, otlp_endpoint: str | None = None, service_name: str = DEFAULT_SERVICE_NAME):
+    """Export traces to a JSON lines file and/or an OTLP collector, tracing is disabled when neither is given"""
+    global _tracer
+    exporters = []
+    if jsonl_path:
+        exporters.append(JsonlExporter(path=jsonl_path))
+    if otlp_endpoint:
+        exporters.append(OTLPExporter(endpoint=otlp_endpoint, service_name=service_name))
+    _tracer = Tracer(exporters=exporters)
+
+
+def get_current_span() -> Span | None:
+    return _current_span.get()
+
+
+def set_attributes(**attributes):
+    """Set attributes of the current span, e.g. of a function recorded with traced(). Does nothing outside of a trace."""
+    current_span = _current_span.get()
+    if current_span is not None:
+        current_span.set_attributes(**attributes)
+
+
+@contextlib.contextmanager
+def start_trace(name: str, **attributes) -> typing.Iterator[Span]:
+    """Record the spans of a request made in the block, including by the tasks it creates, and export them when the
+    block exits. Within another trace, only opens a span of that trace.
+
+    Args:
+        name: Name of the root span
+        attributes: Attributes of the root span
+
+    Yields:
+        The root span
+    """
+    if _current_span.get() is not None and _current_span.get().trace is not None:
+        with span(name, **attributes) as root_span:
+            yield root_span
+        return
+
+    if not _tracer.enabled:
+        yield _new_span(name=name, attributes=attributes, parent=None, trace=None)
+        return
+
+    trace = _Trace()
+    try:
+        with _activate(_new_span(name=name, attributes=attributes, parent=None, trace=trace)) as root_span:
+            yield root_span
+    finally:
+        # Failed requests are exported too, the span that failed has the error
+        _tracer.export(trace.spans)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes) -> typing.Iterator[Span]:
+    """Record the block as a span nested in the current span, if it is in a trace
+
+    Args:
+        name: Name of the span
+        attributes: Attributes of the span, more can be set on the yielded span
+
+    Yields:
+        The span
+    """
+    parent = _current_span.get()
+    if parent is None or parent.trace is None:
+        yield _new_span(name=name, attributes=attributes, parent=None, trace=None)
+        return
+
+    with _activate(_new_span(name=name, attributes=attributes, parent=parent, trace=parent.trace)) as child_span:
+        yield child_span
+
+
+def traced(name: str) -> typing.Callable[[typing.Callable[..., T]], typing.Callable[..., T]]:
+    """Decorator recording each call of a function or coroutine function as a span"""
+    def decorator(func: typing.Callable[..., T]) -> typing.Callable[..., T]:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def in_current_context(func: typing.Callable[[], T]) -> typing.Callable[[], T]:
+    """Bind a function to the current context, so the spans it records when run in an executor thread are nested in
+    the current span. loop.run_in_executor() doesn't carry the context over by itself."""
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+@contextlib.contextmanager
+def _activate(active_span: Span) -> typing.Iterator[Span]:
+    token = _current_span.set(active_span)
+    try:
+        yield active_span
+    except BaseException as e:
+        active_span.error = repr(e)
+        raise
+    finally:
+        active_span.end_time = time.time()
+        active_span.trace.add(active_span)
+        _current_span.reset(token)
+
+
+def _new_span(name: str, attributes: dict, parent: Span | None, trace: _Trace | None) -> Span:
+    return Span(
+        name=name,
+        trace_id=trace.trace_id if trace else None,
+        span_id=_new_id(8),
+        parent_id=parent.span_id if parent else None,
+        start_time=time.time(),
+        attributes=dict(attributes),
+        parent=parent,
+        trace=trace
+    )
+
+
+def _new_id(num_bytes: int) -> str:
+    """Random hex id, 16 bytes for trace ids and 8 for span ids as in OTLP"""
+    return os.urandom(num_bytes).hex()
+
+
+def _to_otlp_attributes(attributes: dict) -> list[dict]:
+    otlp_attributes = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            otlp_value = {"boolValue": value}
+        elif isinstance(value, int):
+            otlp_value = {"intValue": str(value)}
+        elif isinstance(value, float):
+            otlp_value = {"doubleValue": value}
+        elif isinstance(value, str):
+            otlp_value = {"stringValue": value}
+        else:
+            otlp_value = {"stringValue": json.dumps(value, default=str)}
+        otlp_attributes.append({"key": key, "value": otlp_value})
+
+    return otlp_attributes
@@ -1,16 +1,46 @@
+import asyncio
 import datetime
+import hashlib
+import json
+import re
 import time
+import typing
 import markdown
 from dataclasses import asdict
 
 import src.libs.logging as logging
+import src.libs.search.search_agent.llm_governor as llm_governor
 import src.libs.storage.user_data_classes as data_classes
-from src.libs.search.search_agent.search_agent import SearchAgent
+import src.services.chatbot.backend_control.single_flight as single_flight
+from src.libs.search.search_agent.search_agent import AgentEvent, AgentEventType, SearchAgent
 from src.libs.storage.user_management import UserDatabaseManager
 from src.libs.storage.weaviate_store import WeaviateStore
 
 logger = logging.getLogger(__name__)
 
+ANSWER_ERROR_RESPONSE = ("<p>Sorry, there was an error finding your answer please wait a few moments "
+                         "before trying again.</p>")
+
+# Concurrent identical questions (e.g. right after an announcement) share a single search agent run
+search_agent_jobs = single_flight.SingleFlight()
+search_agent_streams = single_flight.SingleFlightStream()
+
+
+def get_university(gmail: str) -> str:
+    """
+    Gets the university a user asks questions about.
+
+    Parameters:
+        gmail (str): The gmail of the user.
+
+    Returns:
+        str: The university of the user.
+    """
+    if "@berkeley.edu" in gmail:
+        return "CAL"
+
+    return "BU"
+
 
 async def search_agent_job(
         agent: SearchAgent,
@@ -47,6 +77,86 @@ async def search_agent_job(
     return result_dict
 
 
+def normalize_question(question: str) -> str:
+    """
+    Normalizes a question so that trivially different phrasings of it are answered by the same search agent run.
+
+    Parameters:
+        question (str): The question asked.
+
+    Returns:
+        str: The question, case folded, with its whitespace collapsed and its trailing punctuation removed.
+    """
+    return re.sub(r"[\s?!.]+$", "", " ".join(question.split()).casefold())
+
+
+def search_agent_job_key(query: str, university: str, current_profile_info: dict) -> tuple[str, str, str]:
+    """
+    Gets the key identifying the search agent runs that give the same answer.
+
+    Parameters:
+        query (str): The search query.
+        university (str): The university to get an answer for.
+        current_profile_info (dict): The current profile information for the user, which the profile
+            information vector is computed from.
+
+    Returns:
+        tuple[str, str, str]: The normalized query, the university and the personalization bucket. Users with the
+            same profile information share a bucket, users without any share the "none" bucket.
+    """
+    personalization_bucket = (
+        hashlib.sha256(json.dumps(current_profile_info, sort_keys=True).encode()).hexdigest()[:16]
+        if current_profile_info else "none"
+    )
+    return normalize_question(query), university, personalization_bucket
+
+
+def shared_job_user_id(job_key: tuple[str, str, str]) -> str:
+    """
+    Gets the user the LLM governor attributes the LLM requests of a shared search agent run to.
+
+    Parameters:
+        job_key (tuple[str, str, str]): The key of the run, as returned by search_agent_job_key.
+
+    Returns:
+        str: An identifier of the run, which can't be the gmail of a user.
+    """
+    return "search-job:" + hashlib.sha256(json.dumps(job_key).encode()).hexdigest()[:16]
+
+
+def render_answer(agent_result: dict) -> str:
+    """
+    Renders the answer of a search agent as the HTML shown in the chat.
+
+    Parameters:
+        agent_result (dict): The search agent result, as returned by search_agent_job.
+
+    Returns:
+        str: The answer and its sources in HTML.
+    """
+    answer = markdown.markdown(agent_result['answer'])
+
+    if "related to your query." in answer or "couldn't find any relevant" in answer or "does not have any specific meaning or relevance" in answer or "I apologize" in answer:
+        response = f"<p>{answer[34:]}</p>"  # This is a really quick and not good way of checking to see
+        # if the searchengine could not find a result
+
+    else:
+        sorted_lst = sorted(agent_result['sources'], key=lambda x: x['score'] or 0, reverse=True)
+
+        # Extract the 10 best scored distinct URLs, a page is listed once however many of its chunks were used
+        top_10_urls = list(dict.fromkeys(item['url'] for item in sorted_lst))[:10]
+
+        url_str = ""
+
+        for url in top_10_urls:
+            url_str += f'<li><a class="link" href="{url}" target="_blank">{url}</a></li>'
+
+        response = f"<p>{answer}</p> <p><br>Below are the related sources:</p> <ol>{url_str}</ol>"
+        # Used HTML break line tag here
+
+    return response
+
+
 async def get_answer(
         search_agent: SearchAgent,
         university: str,
@@ -55,7 +165,12 @@ async def get_answer(
         profile_info_vector: list[float]
 ) -> str:
     """
-    Gets an answer from a search agent.
+    Gets an answer from a search agent. Concurrent calls for the same question, university and profile
+    information share a single search agent run.
+
+    As the run may answer several users, its LLM requests aren't charged to the user whose call started it. They are
+    queued by the LLM governor as those of a user of their own, identified by the job key, with the priority of the
+    call that started the run.
 
     Parameters:
         search_agent (SearchAgent): The search agent to use.
@@ -67,39 +182,26 @@ async def get_answer(
     Returns:
         str: The generated answer text.
     """
-    try:
-        agent_result = await search_agent_job(search_agent, university, input_text, current_profile_info, profile_info_vector)
-
-        answer = markdown.markdown(agent_result['answer'])
-
-        if "related to your query." in answer or "couldn't find any relevant" in answer or "does not have any specific meaning or relevance" in answer or "I apologize" in answer:
-            response = f"<p>{answer[34:]}</p>"  # This is a really quick and not good way of checking to see
-            # if the searchengine could not find a result
-
-        else:
-            sorted_lst = sorted(agent_result['sources'], key=lambda x: x['score'], reverse=True)
-
-            # Extract the first 5 URLs
-            top_10_urls = [item['url'] for item in sorted_lst[:10]]
-
-            url_str = ""
-
-            for url in top_10_urls:
-                if url in url_str:
-                    continue
-
-                url_str += f'<li><a class="link" href="{url}" target="_blank">{url}</a></li>'
+    job_key = search_agent_job_key(input_text, university, current_profile_info)
+
+    async def shared_search_agent_job() -> dict:
+        with llm_governor.request_context(
+                user_id=shared_job_user_id(job_key),
+                priority=llm_governor.get_request_context().priority
+        ):
+            return await search_agent_job(
+                search_agent, university, input_text, current_profile_info, profile_info_vector
+            )
 
-            response = f"<p>{answer}</p> <p><br>Below are the related sources:</p> <ol>{url_str}</ol>"
-            # Used HTML break line tag here
+    try:
+        agent_result = await search_agent_jobs.do(key=job_key, execute=shared_search_agent_job)
 
-        return response
+        return render_answer(agent_result)
 
     except Exception as e:
         logger.error(f"Error getting answer from agent: {e}", exc_info=e)
 
-        return ("<p>Sorry, there was an error finding your answer please wait a few moments "
-                "before trying again.</p>")
+        return ANSWER_ERROR_RESPONSE
 
 
 async def insert_message(
@@ -136,34 +238,12 @@ async def insert_message(
 
             profile_info_vector = user_management.get_profile_info_vector_for_user(gmail=gmail)
 
-            if "@berkeley.edu" in gmail:
-                university = "CAL"
-            else:
-                university = "BU"
-
-            response = await get_answer(search_agent, university, input_text, current_profile_info, profile_info_vector)
-            # Create messages
-            logger.info("Creating user message")
-            user_message = data_classes.UserMessage(
-                query_str=input_text,
-                is_good_query=None,
-                created_time=datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
-            )
-            logger.info("Creating bot message")
-            bot_message = data_classes.BotMessage(
-                response_str=response,
-                is_liked=None,
-                created_time=datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
-            )
+            university = get_university(gmail)
 
-            # Insert message into user
-            logger.info("Inserting message into user")
-            bot_message_uuid = user_management.insert_message(
-                user_message=user_message,
-                bot_message=bot_message,
-                gmail=gmail
-            )
-            logger.info("Finished inserting message")
+            # The LLM requests of the answer are queued fairly with the requests of other users, see get_answer()
+            with llm_governor.request_context(user_id=gmail, priority=llm_governor.Priority.INTERACTIVE):
+                response = await get_answer(search_agent, university, input_text, current_profile_info, profile_info_vector)
+            bot_message_uuid = save_message(user_management, gmail, input_text, response)
 
             return [response, bot_message_uuid]
 
@@ -177,6 +257,140 @@ async def insert_message(
         return ["Sorry, you are not a registered user. Please register at https://busearch.com", "None"]
 
 
+def save_message(user_management: UserDatabaseManager, gmail: str, input_text: str, response: str) -> str:
+    """
+    Saves a question and its answer in the user's conversation.
+
+    Parameters:
+        user_management (UserDatabaseManager): The user management object to use.
+        gmail (str): The gmail of the user who asked the question.
+        input_text (str): The question.
+        response (str): The answer shown to the user.
+
+    Returns:
+        str: The bot message uuid.
+    """
+    # Create messages
+    logger.info("Creating user message")
+    user_message = data_classes.UserMessage(
+        query_str=input_text,
+        is_good_query=None,
+        created_time=datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+    )
+    logger.info("Creating bot message")
+    bot_message = data_classes.BotMessage(
+        response_str=response,
+        is_liked=None,
+        created_time=datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+    )
+
+    # Insert message into user
+    logger.info("Inserting message into user")
+    bot_message_uuid = user_management.insert_message(
+        user_message=user_message,
+        bot_message=bot_message,
+        gmail=gmail
+    )
+    logger.info("Finished inserting message")
+
+    return bot_message_uuid
+
+
+async def stream_message(
+        search_agent: SearchAgent,
+        user_management: UserDatabaseManager,
+        gmail: str,
+        input_text: str,
+        cap: int
+) -> typing.AsyncIterator[tuple[str, dict]]:
+    """
+    Answers a message like insert_message, streaming the answer as it is generated. Concurrent streams of the same
+    question, university and profile information share a single search agent run like get_answer, a stream joining
+    the run late gets the events it emitted so far first.
+
+    Parameters:
+        search_agent (SearchAgent): The search agent to use.
+        user_management (UserDatabaseManager): The user management object to use.
+        gmail (str): The gmail of the user to insert the message for.
+        input_text (str): The input text to insert.
+        cap (int): The maximum number of messages a user can send within 24 hours.
+
+    Yields:
+        tuple[str, dict]: (event name, event data) pairs. In order:
+            plan: {"queries": [str]}, the queries searched to answer the question.
+            sources: {"urls": [str]}, the pages found for one of the queries.
+            token: {"text": str}, the next piece of the answer, as markdown.
+            answer: {"text": str}, the formatted answer, as markdown, replacing the tokens received so far.
+            done: {"response": str, "responseID": str}, the final HTML response and the bot message uuid.
+            Only done is sent when the question can't be answered.
+    """
+    # The user database client is synchronous, its requests are run in the default loop's executor so they don't
+    # block the other streams
+    loop = asyncio.get_running_loop()
+
+    if not await loop.run_in_executor(None, user_management.user_exists, gmail):
+        yield "done", {
+            "response": "Sorry, you are not a registered user. Please register at https://busearch.com",
+            "responseID": "None"
+        }
+        return
+
+    if await loop.run_in_executor(None, lambda: user_management.num_user_messages_24hrs(gmail=gmail)) >= cap:
+        yield "done", {
+            "response": "Sorry, you have reached the maximum number of queries in 24 hours. Please try again tomorrow.",
+            "responseID": "None"
+        }
+        return
+
+    current_profile_info = await loop.run_in_executor(
+        None, lambda: user_management.get_profile_info_for_user(gmail=gmail)
+    )
+    profile_info_vector = await loop.run_in_executor(
+        None, lambda: user_management.get_profile_info_vector_for_user(gmail=gmail)
+    )
+    university = get_university(gmail)
+
+    job_key = search_agent_job_key(input_text, university, current_profile_info)
+
+    async def shared_search_agent_stream() -> typing.AsyncIterator[AgentEvent]:
+        # The LLM requests of the answer are queued fairly with the requests of other users, see get_answer()
+        with llm_governor.request_context(
+                user_id=shared_job_user_id(job_key),
+                priority=llm_governor.Priority.INTERACTIVE
+        ):
+            async for agent_event in search_agent.stream(
+                    input_text, university, current_profile_info, profile_info_vector
+            ):
+                yield agent_event
+
+    logger.info(f"Streaming job: {input_text}")
+    search_job_start_time = time.time()
+    try:
+        async for event in search_agent_streams.subscribe(key=job_key, execute=shared_search_agent_stream):
+            if event.type == AgentEventType.PLAN:
+                yield "plan", {"queries": [query.question for query in event.data.query_graph]}
+            elif event.type == AgentEventType.SOURCES:
+                _, sources = event.data
+                yield "sources", {"urls": list(dict.fromkeys(source.url for source in sources))}
+            elif event.type == AgentEventType.TOKEN:
+                yield "token", {"text": event.data}
+            elif event.type == AgentEventType.ANSWER:
+                yield "answer", {"text": event.data}
+            elif event.type == AgentEventType.RESULT:
+                agent_result = asdict(event.data)
+                agent_result['search_job_duration'] = round((time.time() - search_job_start_time), 2)
+                response = render_answer(agent_result)
+
+    except Exception as e:
+        logger.error(f"Error getting answer from agent: {e}", exc_info=e)
+        response = ANSWER_ERROR_RESPONSE
+
+    logger.info(f"Streaming job: {input_text} finished")
+
+    bot_message_uuid = await loop.run_in_executor(None, save_message, user_management, gmail, input_text, response)
+    yield "done", {"response": response, "responseID": bot_message_uuid}
+
+
 def user_exists(user_management: UserDatabaseManager, gmail: str) -> bool:
     """
     Checks if a user exists in the database.
@@ -0,0 +1,145 @@
+import asyncio
+import typing
+
+import src.libs.logging as logging
+
+logger = logging.getLogger(__name__)
+
+
+T = typing.TypeVar("T")
+
+
+class SingleFlight(typing.Generic[T]):
+    """Coalesces concurrent calls with the same key into a single execution.
+
+    The first call for a key starts the execution, the calls made with the same key while it is in flight wait for
+    its result (or exception) instead of starting their own. Once the execution finishes, the next call starts a new
+    one, results are not cached.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[typing.Hashable, asyncio.Task[T]] = {}
+        self.num_executions = 0
+        self.num_coalesced = 0
+
+    async def do(self, key: typing.Hashable, execute: typing.Callable[[], typing.Awaitable[T]]) -> T:
+        """Get the result of the in-flight execution for the key, starting it if there is none.
+
+        Args:
+            key: Identity of the execution
+            execute: Starts the execution, only called if none is in flight for the key
+
+        Returns:
+            The result of the execution
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(execute())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            self.num_executions += 1
+        else:
+            self.num_coalesced += 1
+            logger.info(f"Joined the in-flight execution of {key}")
+
+        # A caller that is cancelled (e.g. its client disconnected) doesn't cancel the execution others wait for
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+
+class SingleFlightStream(typing.Generic[T]):
+    """Coalesces concurrent streams with the same key into a single execution.
+
+    The first subscriber for a key starts the stream, the subscribers joining while it is in flight get the items
+    it emitted so far, then each item as it is emitted, instead of starting their own. Unlike SingleFlight, the
+    execution is stopped once it has no subscribers left, as nobody would see the rest of the stream.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[typing.Hashable, _SharedStream[T]] = {}
+        self.num_executions = 0
+        self.num_coalesced = 0
+
+    async def subscribe(
+            self,
+            key: typing.Hashable,
+            execute: typing.Callable[[], typing.AsyncIterator[T]]
+    ) -> typing.AsyncIterator[T]:
+        """Iterate over the in-flight stream for the key, starting it if there is none.
+
+        Args:
+            key: Identity of the stream
+            execute: Starts the stream, only called if none is in flight for the key
+
+        Yields:
+            Every item of the stream, from its first one
+
+        Raises:
+            The exception the stream raised, if any, once its items are exhausted
+        """
+        shared_stream = self._in_flight.get(key)
+        if shared_stream is None:
+            shared_stream = _SharedStream(execute())
+            self._in_flight[key] = shared_stream
+            shared_stream.task.add_done_callback(lambda _: self._remove(key, shared_stream))
+            self.num_executions += 1
+        else:
+            self.num_coalesced += 1
+            logger.info(f"Joined the in-flight stream of {key}")
+
+        shared_stream.num_subscribers += 1
+        try:
+            num_items_seen = 0
+            while True:
+                while num_items_seen < len(shared_stream.items):
+                    yield shared_stream.items[num_items_seen]
+                    num_items_seen += 1
+                if shared_stream.finished:
+                    break
+                await shared_stream.item_added.wait()
+
+            if shared_stream.error is not None:
+                raise shared_stream.error
+        finally:
+            shared_stream.num_subscribers -= 1
+            if not shared_stream.num_subscribers and not shared_stream.finished:
+                # New subscribers must not join a stream that is being stopped
+                self._remove(key, shared_stream)
+                shared_stream.task.cancel()
+
+    def _remove(self, key: typing.Hashable, shared_stream: "_SharedStream[T]"):
+        if self._in_flight.get(key) is shared_stream:
+            del self._in_flight[key]
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+
+class _SharedStream(typing.Generic[T]):
+    """Execution of a stream, buffering its items for all of its subscribers"""
+
+    def __init__(self, stream: typing.AsyncIterator[T]):
+        self.items: list[T] = []
+        self.finished = False
+        self.error: Exception | None = None
+        self.item_added = asyncio.Event()
+        self.num_subscribers = 0
+        self.task = asyncio.ensure_future(self._consume(stream))
+
+    async def _consume(self, stream: typing.AsyncIterator[T]):
+        try:
+            async for item in stream:
+                self.items.append(item)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._notify()
+
+    def _notify(self):
+        # Wake up the waiting subscribers, the next ones wait for a new event
+        self.item_added.set()
+        self.item_added = asyncio.Event()
@@ -1,3 +1,4 @@
+import json
 import os
 import uuid
 import pathlib
@@ -10,17 +11,24 @@ import langchain.chat_models
 from fastapi import Cookie
 from fastapi import HTTPException, Query, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.responses import RedirectResponse
 
 import src.libs.config as config
 import src.libs.logging as logging
+import src.libs.search.local_replica as local_replica
+import src.libs.search.search_agent.llm_cache as llm_cache
+import src.libs.search.search_agent.llm_governor as llm_governor
+import src.libs.search.search_agent.llm_hedging as llm_hedging
 import src.libs.search.weaviate_search_engine as search_engine
 import src.libs.storage.user_management as user_management
+import src.libs.storage.embedding_projection as embedding_projection
 import src.libs.storage.weaviate_store as store
+import src.libs.tracing as tracing
 import src.services.chatbot.backend_control.backend as backend
-from src.libs.search.search_agent.search_agent import SearchAgent, SearchAgentFeatures
+from src.libs.search.search_agent.search_agent import SearchAgent, SearchAgentFeatures, DEFAULT_FAQ_MIN_CERTAINTY
+from src.libs.search.search_agent.query_router import QueryRouter, LogisticModel, DEFAULT_PLANNING_THRESHOLD
 from src.services.chatbot.backend_control.auth import generate_google_auth_url
 from src.services.chatbot.backend_control.models import ChatRequest, FeedbackRequest, ProfileInformationRequest
 from src.services.chatbot.backend_control.models import ChatResponse, IsAuthorizedResponse, CurrentDictResponse
@@ -41,6 +49,8 @@ def init_config(local_env_file: Union[str, None]):
     config.init(
         metadata=[
             config.ConfigVarMetadata(var_name="INFO_DATA_NAMESPACE"),
+            config.ConfigVarMetadata(var_name="INFO_DATA_MULTI_TENANT", is_json=True),
+            config.ConfigVarMetadata(var_name="EMBEDDING_PROJECTION_PATH"),
             config.ConfigVarMetadata(var_name="USER_DATA_NAMESPACE"),
             config.ConfigVarMetadata(var_name="WEAVIATE_URL"),
             config.ConfigVarMetadata(var_name="WEAVIATE_API_KEY"),
@@ -52,6 +62,23 @@ def init_config(local_env_file: Union[str, None]):
             config.ConfigVarMetadata(var_name="ENCRYPTION_ALGORITHM"),
             config.ConfigVarMetadata(var_name="SECRET_KEY"),
             config.ConfigVarMetadata(var_name="IS_LOCAL_ENV"),
+            config.ConfigVarMetadata(var_name="LOCAL_REPLICA_DIR"),
+            config.ConfigVarMetadata(var_name="SEARCH_RESCORE_LIMIT", is_json=True),
+            config.ConfigVarMetadata(var_name="FAQ_LOOKUP", is_json=True),
+            config.ConfigVarMetadata(var_name="FAQ_MIN_CERTAINTY", is_json=True),
+            config.ConfigVarMetadata(var_name="SINGLE_ROUND_TRIP_GENERATION", is_json=True),
+            config.ConfigVarMetadata(var_name="QUERY_ROUTING", is_json=True),
+            config.ConfigVarMetadata(var_name="LLM_ANSWER_FORMATTING_FALLBACK", is_json=True),
+            config.ConfigVarMetadata(var_name="SPECULATIVE_RETRIEVAL", is_json=True),
+            config.ConfigVarMetadata(var_name="QUERY_ROUTER_MODEL_PATH"),
+            config.ConfigVarMetadata(var_name="QUERY_ROUTER_THRESHOLD", is_json=True),
+            config.ConfigVarMetadata(var_name="LLM_MAX_IN_FLIGHT_REQUESTS", is_json=True),
+            config.ConfigVarMetadata(var_name="LLM_CACHE_PATH"),
+            config.ConfigVarMetadata(var_name="LLM_CACHE_TTL_SECONDS", is_json=True),
+            config.ConfigVarMetadata(var_name="CHAT_DEADLINE_SECONDS", is_json=True),
+            config.ConfigVarMetadata(var_name="LLM_HEDGE_MAX_RATE", is_json=True),
+            config.ConfigVarMetadata(var_name="TRACE_FILE"),
+            config.ConfigVarMetadata(var_name="TRACE_OTLP_ENDPOINT"),
         ],
         local_env_file=local_env_file
     )
@@ -106,7 +133,12 @@ weaviate_store = store.WeaviateStore(
     api_key=config.get("WEAVIATE_API_KEY"),
     openai_api_key=config.get("OPENAI_API_KEY"),
     namespace=config.get("INFO_DATA_NAMESPACE"),
-    cohere_api_key=config.get("COHERE_API_KEY")
+    cohere_api_key=config.get("COHERE_API_KEY"),
+    multi_tenant=config.get("INFO_DATA_MULTI_TENANT", False),
+    embedding_projection=(
+        embedding_projection.EmbeddingProjection.load(config.get("EMBEDDING_PROJECTION_PATH"))
+        if config.get("EMBEDDING_PROJECTION_PATH") else None
+    )
 )
 
 weaviate_user_management = user_management.UserDatabaseManager(
@@ -117,7 +149,34 @@ weaviate_user_management = user_management.UserDatabaseManager(
     cohere_api_key=config.get("COHERE_API_KEY")
 )
 
-weaviate_engine = search_engine.WeaviateSearchEngine(weaviate_store=weaviate_store)
+# Answer semantic searches from the local read replica of the search index when one has been synced
+search_index_replica = local_replica.LocalReplica(
+    directory=config.get("LOCAL_REPLICA_DIR"),
+    namespace=config.get("INFO_DATA_NAMESPACE")
+) if config.get("LOCAL_REPLICA_DIR") else None
+
+weaviate_engine = search_engine.WeaviateSearchEngine(
+    weaviate_store=weaviate_store,
+    local_replica=search_index_replica,
+    rescore_limit=config.get("SEARCH_RESCORE_LIMIT")
+)
+
+# Cap the LLM requests in flight across every chat, queued requests are served round-robin across users
+llm_governor.configure(
+    max_in_flight=config.get("LLM_MAX_IN_FLIGHT_REQUESTS", llm_governor.DEFAULT_MAX_IN_FLIGHT_REQUESTS)
+)
+
+# Serve repeated deterministic LLM calls (planning, answers to the same sources, formatting) from a local SQLite cache
+llm_cache.configure(
+    path=config.get("LLM_CACHE_PATH"),
+    ttl_seconds=config.get("LLM_CACHE_TTL_SECONDS", llm_cache.DEFAULT_TTL_SECONDS)
+)
+
+# Fire a duplicate of the LLM calls slower than the p90 of similar calls, for at most this fraction of the calls
+llm_hedging.configure(max_hedge_rate=config.get("LLM_HEDGE_MAX_RATE"))
+
+# Export the spans of each chat (planning, searches, LLM calls, user database calls) to a JSONL file or OTLP collector
+tracing.configure(jsonl_path=config.get("TRACE_FILE"), otlp_endpoint=config.get("TRACE_OTLP_ENDPOINT"))
 
 # Initialize a reasoning LLM
 reasoning_llm = langchain.chat_models.ChatOpenAI(
@@ -127,12 +186,35 @@ reasoning_llm = langchain.chat_models.ChatOpenAI(
 )
 
 features = [SearchAgentFeatures.CROSS_ENCODER_RE_RANKING, SearchAgentFeatures.QUERY_PLANNING]
+# Serve pre-generated answers to common questions, the FAQ index is built by scripts/build_faq_index.py
+if config.get("FAQ_LOOKUP", False):
+    features.append(SearchAgentFeatures.FAQ_LOOKUP)
+# Search for and answer single query plans with one Weaviate request instead of a search, a QA and a formatting call
+if config.get("SINGLE_ROUND_TRIP_GENERATION", False):
+    features.append(SearchAgentFeatures.SINGLE_ROUND_TRIP_GENERATION)
+# Only plan the questions the query router decides need to be decomposed, the model is fitted by scripts/query_router.py
+if config.get("QUERY_ROUTING", False):
+    features.append(SearchAgentFeatures.QUERY_ROUTING)
+# Re-format answers with an extra LLM call when they break the formatting rules
+if config.get("LLM_ANSWER_FORMATTING_FALLBACK", False):
+    features.append(SearchAgentFeatures.LLM_ANSWER_FORMATTING_FALLBACK)
+# Search for the original question while the query plan is being built
+if config.get("SPECULATIVE_RETRIEVAL", False):
+    features.append(SearchAgentFeatures.SPECULATIVE_RETRIEVAL)
+query_router = QueryRouter(
+    model=LogisticModel.load(config.get("QUERY_ROUTER_MODEL_PATH")) if config.get("QUERY_ROUTER_MODEL_PATH") else None,
+    threshold=config.get("QUERY_ROUTER_THRESHOLD", DEFAULT_PLANNING_THRESHOLD)
+)
 
 
 search_agent = SearchAgent(
     weaviate_search_engine=weaviate_engine,
     reasoning_llm=reasoning_llm,
-    features=features
+    features=features,
+    faq_min_certainty=config.get("FAQ_MIN_CERTAINTY", DEFAULT_FAQ_MIN_CERTAINTY),
+    router=query_router,
+    # Answer within this many seconds, skipping planning or formatting, or listing the retrieved sources when short
+    default_deadline_seconds=config.get("CHAT_DEADLINE_SECONDS")
 )
 
 
@@ -324,59 +406,163 @@ async def is_authorized(request: Request):
         raise  # Any other unexpected errors can be raised normally
 
 
+def get_chat_user(auth_token: str | None) -> tuple[str | None, str | None]:
+    """
+    Checks that the user sending a chat message is allowed to chat.
+
+    Parameters:
+        auth_token (str | None): The auth_token cookie.
+
+    Returns:
+        tuple[str | None, str | None]: The email of the user, and the message answered instead when they can't chat.
+    """
+    if not auth_token:
+        logger.warning(f"User not authenticated")
+        return None, ("I'm sorry, it seems like there was an error when you signed in. "
+                      "Please clear your cookies and log in again using your BU email")  # User is not authenticated
+
+    # Decode and verify the JWT token
+    email = get_current_email(jwt_token=auth_token)
+
+    # Ensure the email is present in the decoded token
+    if not email:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    if not (email.endswith("@bu.edu") or email.endswith("@berkeley.edu") or email in WHITE_LISTED_EMAILS):  # Check if the user is a BU or CAL student
+        return email, ("I'm sorry, it seems like there was an error when you signed in. "
+                       "Please clear your cookies and log in again using your BU email.")  # User is not a BU student
+
+    if not backend.user_exists(user_management=weaviate_user_management, gmail=email):
+        return email, ("I'm sorry, it seems like you have not been logged in. "
+                       "BUsearch is exclusive to BU students.")  # User does not exist in the database
+
+    return email, None
+
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(data: ChatRequest, auth_token: str = Cookie(None)):
     """
     Chat with the bot.
     """
-    if auth_token:
-        # Decode and verify the JWT token
-        email = get_current_email(jwt_token=auth_token)
-
-        # Ensure the email is present in the decoded token
-        if not email:
-            raise HTTPException(status_code=401, detail="Invalid token")
-
-        if email.endswith("@bu.edu") or email.endswith("@berkeley.edu") or email in WHITE_LISTED_EMAILS:  # Check if the user is a BU or CAL student
-            if backend.user_exists(user_management=weaviate_user_management, gmail=email):
-                try:
-                    response_and_id = await backend.insert_message(
-                        search_agent=search_agent,
-                        user_management=weaviate_user_management,
-                        gmail=email,
-                        input_text=data.question,
-                        cap=50
-                    )  # Insert the question and answer into the database
-                except Exception as e:
-                    logger.error(f"error: {e}")
-                    response_and_id = [
-                        "Oh no! There was an issue finding your answer, "
-                        "please try refreshing or waiting a few seconds.",
-                        str(uuid.uuid4())
-                    ]
-
-            else:
-                response_and_id = [
-                    "I'm sorry, it seems like you have not been logged in. BUsearch is exclusive to BU students.",
-                    str(uuid.uuid4())
-                ]  # User does not exist in the database
-        else:
+    # Record where answering the question spends its time, from the user database calls to the LLM calls
+    with tracing.start_trace("chat", endpoint="/chat"):
+        email, rejection_message = get_chat_user(auth_token=auth_token)
+        if rejection_message:
+            return ChatResponse(response=rejection_message, responseID=str(uuid.uuid4()))
+
+        try:
+            response_and_id = await backend.insert_message(
+                search_agent=search_agent,
+                user_management=weaviate_user_management,
+                gmail=email,
+                input_text=data.question,
+                cap=50
+            )  # Insert the question and answer into the database
+        except Exception as e:
+            logger.error(f"error: {e}")
             response_and_id = [
-                "I'm sorry, it seems like there was an error when you signed in. "
-                "Please clear your cookies and log in again using your BU email.",
+                "Oh no! There was an issue finding your answer, "
+                "please try refreshing or waiting a few seconds.",
                 str(uuid.uuid4())
-            ]  # User is not a BU student
-    else:
-        logger.warning(f"User not authenticated")
-        response_and_id = [
-            "I'm sorry, it seems like there was an error when you signed in. "
-            "Please clear your cookies and log in again using your BU email",
-            str(uuid.uuid4())
-        ]  # User is not authenticated
+            ]
 
     return ChatResponse(response=response_and_id[0], responseID=response_and_id[1])  # Return the response
 
 
+def format_server_sent_event(event: str, data: dict) -> str:
+    """
+    Format an event of a streamed answer as a server-sent event.
+
+    Parameters:
+        event (str): The name of the event, e.g. "token" or "done".
+        data (dict): The data of the event, sent as JSON.
+
+    Returns:
+        str: The event in the text/event-stream format, terminated by a blank line.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(data: ChatRequest, auth_token: str = Cookie(None)):
+    """
+    Chat with the bot, streaming the answer as Server-Sent Events while it is generated.
+
+    The events are plan, sources, token and answer, followed by a done event with the same response and
+    responseID as /chat. See backend.stream_message for the data of each event.
+    """
+    email, rejection_message = get_chat_user(auth_token=auth_token)
+
+    async def server_sent_events():
+        if rejection_message:
+            yield format_server_sent_event("done", {"response": rejection_message, "responseID": str(uuid.uuid4())})
+            return
+
+        try:
+            # Record where answering the question spends its time, from the user database calls to the LLM calls
+            with tracing.start_trace("chat", endpoint="/chat/stream"):
+                async for event, event_data in backend.stream_message(
+                    search_agent=search_agent,
+                    user_management=weaviate_user_management,
+                    gmail=email,
+                    input_text=data.question,
+                    cap=50
+                ):  # The question and answer are inserted into the database before the done event
+                    yield format_server_sent_event(event, event_data)
+        except Exception as e:
+            logger.error(f"error: {e}")
+            yield format_server_sent_event("done", {
+                "response": "Oh no! There was an issue finding your answer, "
+                            "please try refreshing or waiting a few seconds.",
+                "responseID": str(uuid.uuid4())
+            })
+
+    return StreamingResponse(
+        server_sent_events(),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream, which would delay the first token
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def require_chat_user(auth_token: str | None) -> str:
+    """
+    Checks that a request is made by a user allowed to chat, raising an HTTP error otherwise.
+
+    Parameters:
+        auth_token (str | None): The auth_token cookie.
+
+    Returns:
+        str: The email of the user.
+    """
+    email, rejection_message = get_chat_user(auth_token=auth_token)
+    if email is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if rejection_message:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    return email
+
+
+@app.get("/llm-governor/stats")
+async def llm_governor_stats(auth_token: str = Cookie(None)):
+    """
+    Reports the LLM requests in flight and waiting, and the queue wait times of each priority in seconds.
+    """
+    require_chat_user(auth_token=auth_token)
+    return llm_governor.get_governor().stats()
+
+
+@app.get("/llm-hedging/stats")
+async def llm_hedging_stats(auth_token: str = Cookie(None)):
+    """
+    Reports the number of LLM calls, the duplicate requests fired for the slow ones and how many of them came back first.
+    """
+    require_chat_user(auth_token=auth_token)
+    hedging_policy = llm_hedging.get_policy()
+    return hedging_policy.stats() if hedging_policy is not None else None
+
+
 @app.api_route("/feedback", methods=["POST"])
 async def provide_feedback(data: FeedbackRequest, auth_token: str = Cookie(None)):
     """
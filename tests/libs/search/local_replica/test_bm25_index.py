@@ -0,0 +1,67 @@
+import math
+
+import numpy as np
+import pytest
+
+import src.libs.search.local_replica.bm25_index as bm25_index
+
+
+TEXTS = [
+    "Mugar library is open late",
+    "The library of the law school",
+    "Financial aid deadlines for the fall semester",
+]
+
+
+def test_tokenize_matches_word_tokenization():
+    assert bm25_index.tokenize("CS-132: Linear_Algebra, 4 credits!") == ["cs", "132", "linear", "algebra", "4", "credits"]
+
+
+def test_scores_match_the_bm25_formula():
+    index = bm25_index.BM25Index.build(TEXTS)
+
+    scores = index.scores("library")
+
+    avg_doc_length = (5 + 6 + 7) / 3
+    idf = math.log(1 + (3 - 2 + 0.5) / (2 + 0.5))
+    expected = [
+        idf * 2.2 / (1 + 1.2 * (0.25 + 0.75 * doc_length / avg_doc_length)) for doc_length in (5, 6)
+    ]
+    np.testing.assert_allclose(scores, [*expected, 0.0], rtol=1e-5)
+
+
+def test_stopwords_are_ignored():
+    index = bm25_index.BM25Index.build(TEXTS)
+
+    np.testing.assert_array_equal(index.scores("the"), np.zeros(3))
+    np.testing.assert_allclose(index.scores("the library"), index.scores("library"))
+
+
+def test_search_only_returns_matching_documents():
+    index = bm25_index.BM25Index.build(TEXTS)
+
+    doc_ids, scores = index.search("mugar library", top_k=3)
+
+    assert doc_ids.tolist() == [0, 1]
+    assert scores[0] > scores[1] > 0
+
+
+def test_search_without_match():
+    doc_ids, scores = bm25_index.BM25Index.build(TEXTS).search("dining hall", top_k=3)
+
+    assert len(doc_ids) == 0 and len(scores) == 0
+
+
+def test_save_and_load(tmp_path):
+    index = bm25_index.BM25Index.build(TEXTS)
+    index.save(str(tmp_path))
+
+    loaded_index = bm25_index.BM25Index.load(str(tmp_path))
+
+    assert loaded_index.num_docs == 3
+    np.testing.assert_allclose(loaded_index.scores("financial aid library"), index.scores("financial aid library"))
+
+
+@pytest.mark.parametrize("query_str", ["", "a an the"])
+def test_empty_queries_score_nothing(query_str):
+    np.testing.assert_array_equal(bm25_index.BM25Index.build(TEXTS).scores(query_str), np.zeros(3))
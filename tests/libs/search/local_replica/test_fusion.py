@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+import src.libs.search.local_replica.fusion as fusion
+
+
+def _results(ids: list[int], scores: list[float]) -> tuple[np.ndarray, np.ndarray]:
+    return np.array(ids, dtype=np.int64), np.array(scores, dtype=np.float32)
+
+
+def test_ranked_fusion():
+    ids, scores = fusion.fuse(
+        vector_results=_results([1, 2], [0.9, 0.8]),
+        keyword_results=_results([2, 3], [12.0, 3.0]),
+        alpha=0.75,
+        fusion_type=fusion.HybridFusion.RANKED
+    )
+
+    assert ids.tolist() == [2, 1, 3]
+    np.testing.assert_allclose(scores, [0.25 / 60 + 0.75 / 61, 0.75 / 60, 0.25 / 61], rtol=1e-6)
+
+
+def test_relative_score_fusion():
+    ids, scores = fusion.fuse(
+        vector_results=_results([1, 2, 3], [0.9, 0.7, 0.5]),
+        keyword_results=_results([3, 1], [8.0, 2.0]),
+        alpha=0.5,
+        fusion_type=fusion.HybridFusion.RELATIVE_SCORE
+    )
+
+    # 1 and 3 tie, 3 comes first as a keyword result
+    assert ids.tolist() == [3, 1, 2]
+    np.testing.assert_allclose(scores, [0.5, 0.5, 0.25], rtol=1e-6)
+
+
+def test_ties_keep_keyword_results_first():
+    ids, _ = fusion.fuse(
+        vector_results=_results([1], [0.9]),
+        keyword_results=_results([2], [5.0]),
+        alpha=0.5,
+        fusion_type=fusion.HybridFusion.RANKED
+    )
+
+    assert ids.tolist() == [2, 1]
+
+
+@pytest.mark.parametrize("alpha, expected_ids", [(1.0, [1, 2]), (0.0, [3, 2])])
+def test_alpha_weights_the_result_sets(alpha, expected_ids):
+    ids, _ = fusion.fuse(
+        vector_results=_results([1, 2], [0.9, 0.8]),
+        keyword_results=_results([3, 2], [4.0, 2.0]),
+        alpha=alpha
+    )
+
+    assert ids[:2].tolist() == expected_ids
+
+
+def test_fuse_empty_results():
+    ids, scores = fusion.fuse(vector_results=_results([], []), keyword_results=_results([], []), alpha=0.5)
+
+    assert len(ids) == 0 and len(scores) == 0
+
+
+@pytest.mark.parametrize("scores, cut_off, expected", [
+    ([10, 9, 8, 7, 1, 1, 1, 1, 1, 1], 1, 4),
+    ([10, 9, 8, 7, 6, 1, 0.5, 0.2, 0.1, 0], 1, 5),
+    ([10, 9, 8, 7, 6, 5, 4, 3, 2, 1], 1, 10),
+    ([1.0, 0.98, 0.5, 0.48, 0.1, 0.08, 0.0], 1, 2),
+    ([1.0, 0.98, 0.5, 0.48, 0.1, 0.08, 0.0], 2, 4),
+    ([0.7, 0.7, 0.7], 1, 3),
+    ([0.7], 1, 1),
+])
+def test_autocut(scores, cut_off, expected):
+    assert fusion.autocut(np.array(scores), cut_off=cut_off) == expected
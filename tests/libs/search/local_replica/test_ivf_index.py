@@ -0,0 +1,79 @@
+import numpy as np
+
+import src.libs.search.local_replica.ivf_index as ivf_index
+
+
+def _clustered_vectors(num_clusters: int = 4, vectors_per_cluster: int = 300, dim: int = 16, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(num_clusters, dim))
+    return np.concatenate([
+        center + 0.1 * rng.normal(size=(vectors_per_cluster, dim)) for center in centers
+    ]).astype(np.float32)
+
+
+def _exact_top_k(vectors: np.ndarray, query_vector: np.ndarray, top_k: int) -> np.ndarray:
+    scores = ivf_index.normalize(vectors) @ ivf_index.normalize(query_vector[np.newaxis, :])[0]
+    return np.argsort(-scores)[:top_k]
+
+
+def test_normalize_keeps_zero_rows():
+    normalized = ivf_index.normalize(np.array([[3.0, 4.0], [0.0, 0.0]]))
+
+    np.testing.assert_allclose(normalized, [[0.6, 0.8], [0.0, 0.0]])
+
+
+def test_small_index_has_a_single_list():
+    index, order = ivf_index.IVFIndex.build(_clustered_vectors(vectors_per_cluster=10))
+
+    assert index.num_lists == 1
+    np.testing.assert_array_equal(order, np.arange(40))
+
+
+def test_search_probing_every_list_is_exact():
+    vectors = _clustered_vectors()
+    index, order = ivf_index.IVFIndex.build(vectors, num_lists=4)
+    query_vector = vectors[7] + 0.05
+
+    row_ids, scores = index.search(query_vector, top_k=5, num_probes=index.num_lists)
+
+    np.testing.assert_array_equal(order[row_ids], _exact_top_k(vectors, query_vector, top_k=5))
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_search_probing_the_nearest_list_finds_the_cluster():
+    vectors = _clustered_vectors()
+    index, order = ivf_index.IVFIndex.build(vectors, num_lists=4)
+
+    row_ids, _ = index.search(vectors[310], top_k=10, num_probes=1)
+
+    # Rows 300 to 599 of the input are the second cluster
+    assert np.all((order[row_ids] >= 300) & (order[row_ids] < 600))
+
+
+def test_inverted_lists_partition_the_vectors():
+    vectors = _clustered_vectors()
+    index, order = ivf_index.IVFIndex.build(vectors, num_lists=4)
+
+    assert sorted(order.tolist()) == list(range(len(vectors)))
+    np.testing.assert_allclose(index.vectors, ivf_index.normalize(vectors)[order], rtol=1e-6)
+
+
+def test_save_and_load(tmp_path):
+    vectors = _clustered_vectors()
+    index, _ = ivf_index.IVFIndex.build(vectors, num_lists=4)
+    index.save(str(tmp_path))
+
+    loaded_index = ivf_index.IVFIndex.load(str(tmp_path))
+
+    assert isinstance(loaded_index.vectors, np.memmap)
+    for expected, actual in zip(index.search(vectors[0], top_k=5), loaded_index.search(vectors[0], top_k=5)):
+        np.testing.assert_array_equal(expected, actual)
+
+
+def test_search_empty_index(tmp_path):
+    index, _ = ivf_index.IVFIndex.build(np.zeros((0, 8), dtype=np.float32))
+    index.save(str(tmp_path))
+
+    row_ids, scores = ivf_index.IVFIndex.load(str(tmp_path)).search(np.ones(8), top_k=3)
+
+    assert len(row_ids) == 0 and len(scores) == 0
@@ -0,0 +1,86 @@
+import src.libs.search.search_agent.answer_formatting as answer_formatting
+
+
+def test_post_process_answer_prepends_the_prefix():
+    answer = answer_formatting.post_process_answer("Mugar Library is open **until 2am**.", num_sources=2)
+
+    assert answer == "Based on the provided sources, Mugar Library is open **until 2am**."
+
+
+def test_post_process_answer_uses_the_singular_prefix_for_one_source():
+    answer = answer_formatting.post_process_answer("Mugar Library is open **until 2am**.", num_sources=1)
+
+    assert answer.startswith("Based on the provided source, Mugar")
+
+
+def test_post_process_answer_replaces_the_llms_prefix():
+    answer = answer_formatting.post_process_answer("Based on the information, the deadline is **Jan 5**.", 2)
+
+    assert answer == "Based on the provided sources, the deadline is **Jan 5**."
+
+
+def test_post_process_answer_lowercases_common_sentence_starters():
+    answer = answer_formatting.post_process_answer("Here are the options:\n1) a\n2) b", num_sources=2)
+
+    assert answer == "Based on the provided sources, here are the options:\n\n1. a\n2. b"
+
+
+def test_post_process_answer_puts_the_prefix_before_a_leading_list_in_its_own_paragraph():
+    answer = answer_formatting.post_process_answer("- item one\n- item two", num_sources=2)
+
+    assert answer == "Based on the provided sources:\n\n- item one\n- item two"
+
+
+def test_post_process_answer_puts_the_prefix_before_a_leading_heading_in_its_own_paragraph():
+    answer = answer_formatting.post_process_answer("## Dining halls\n* Warren\n* West", num_sources=1)
+
+    assert answer == "Based on the provided source:\n\n## Dining halls\n\n- Warren\n- West"
+
+
+def test_post_process_answer_is_idempotent_for_leading_lists():
+    answer = answer_formatting.post_process_answer("Based on the sources:\n\n1. a\n2. b", num_sources=2)
+
+    assert answer == "Based on the provided sources:\n\n1. a\n2. b"
+    assert answer_formatting.post_process_answer(answer, num_sources=2) == answer
+
+
+def test_post_process_answer_separates_lists_from_the_previous_paragraph():
+    answer = answer_formatting.post_process_answer("You can apply:\n• online\n• by mail", num_sources=2)
+
+    assert answer == "Based on the provided sources, you can apply:\n\n- online\n- by mail"
+
+
+def test_validate_answer_accepts_a_formatted_answer():
+    answer = "Based on the provided sources, Warren Towers is open **until midnight**."
+
+    assert answer_formatting.validate_answer(answer, "Which dining hall is open late?") == []
+
+
+def test_validate_answer_accepts_the_paragraph_prefix():
+    answer = "Based on the provided sources:\n\n- **Warren**\n- **West**"
+
+    assert answer_formatting.validate_answer(answer, "List the dining halls") == []
+
+
+def test_validate_answer_flags_a_missing_prefix_and_bold():
+    problems = answer_formatting.validate_answer("Warren Towers is open until midnight.", "When is Warren open?")
+
+    assert problems == ["answer doesn't start with the answer prefix", "no part of the answer is in bold"]
+
+
+def test_validate_answer_flags_a_missing_list_for_list_questions():
+    answer = "Based on the provided sources, you can **apply online**."
+
+    for question in ["List the ways to apply", "What are some examples of clubs?", "What are the steps to apply?",
+                     "What are some ways to get involved?"]:
+        assert answer_formatting.validate_answer(answer, question) == [
+            "question asks for a list but the answer has none"
+        ]
+
+
+def test_validate_answer_doesnt_flag_questions_that_dont_ask_for_a_list():
+    answer = "Based on the provided sources, Warren Towers is open **until midnight**."
+
+    for question in ["Which dining hall is open late?", "What are the requirements for the CS major?",
+                     "What are my housing options?", "What is the application deadline?"]:
+        assert answer_formatting.validate_answer(answer, question) == []
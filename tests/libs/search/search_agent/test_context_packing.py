@@ -0,0 +1,84 @@
+import numpy as np
+
+import src.libs.search.search_agent.context_packing as context_packing
+from src.libs.search.search_data_classes import SearchResult
+
+
+def _source(name: str, num_words: int, score: float | None) -> SearchResult:
+    return SearchResult(text=" ".join([name] * num_words), url=f"https://www.bu.edu/{name}", score=score)
+
+
+def _pack(sources: list[SearchResult], token_budget: int) -> context_packing.PackedContext:
+    # One token per word
+    return context_packing.pack_sources(
+        sources=sources,
+        token_budget=token_budget,
+        count_source_tokens=lambda source: len(source.text.split()),
+        truncate_text=lambda text, num_tokens: " ".join(text.split()[:num_tokens])
+    )
+
+
+def test_sources_that_fit_are_all_included():
+    sources = [_source("a", 50, 0.9), _source("b", 30, 0.5), _source("c", 20, 0.1)]
+
+    packed = _pack(sources, token_budget=1000)
+
+    assert packed.sources == sources
+    assert packed.texts == [source.text for source in sources]
+    assert packed.num_tokens == 100 + 3 * context_packing.SOURCE_OVERHEAD_TOKENS
+    assert (packed.num_dropped_sources, packed.num_truncated_sources, packed.num_dropped_tokens) == (0, 0, 0)
+
+
+def test_top_source_is_truncated_to_the_budget():
+    sources = [_source("a", 500, 0.9), _source("b", 30, 0.5)]
+
+    packed = _pack(sources, token_budget=200)
+
+    kept_tokens = 200 - context_packing.SOURCE_OVERHEAD_TOKENS - context_packing.TRUNCATION_MARKER_TOKENS
+    assert packed.sources == sources[:1]
+    assert packed.texts == [" ".join(["a"] * kept_tokens) + context_packing.TRUNCATION_MARKER]
+    assert packed.num_tokens == 200
+    assert packed.num_truncated_sources == 1
+    assert packed.num_dropped_tokens == (500 - kept_tokens) + 30
+
+
+def test_sources_are_chosen_by_relevance_per_token():
+    sources = [_source("a", 50, 1.0), _source("b", 300, 0.5), _source("c", 40, 0.4), _source("d", 40, 0.0)]
+
+    packed = _pack(sources, token_budget=50 + 40 + 40 + 3 * context_packing.SOURCE_OVERHEAD_TOKENS)
+
+    # b is worth less per token than c, and too little of the budget is left to truncate it into, d fills the gap
+    assert [source.text.split()[0] for source in packed.sources] == ["a", "c", "d"]
+    assert packed.num_tokens == packed.token_budget
+    assert (packed.num_dropped_sources, packed.num_dropped_tokens) == (1, 300)
+
+
+def test_lower_ranked_source_is_truncated_when_enough_budget_is_left():
+    sources = [_source("a", 50, 1.0), _source("b", 500, 0.9)]
+
+    packed = _pack(sources, token_budget=300)
+
+    remaining_tokens = 300 - (50 + context_packing.SOURCE_OVERHEAD_TOKENS) - context_packing.SOURCE_OVERHEAD_TOKENS
+    kept_tokens = remaining_tokens - context_packing.TRUNCATION_MARKER_TOKENS
+    assert packed.sources == sources
+    assert packed.texts[1] == " ".join(["b"] * kept_tokens) + context_packing.TRUNCATION_MARKER
+    assert packed.num_tokens == 300
+    assert (packed.num_truncated_sources, packed.num_dropped_tokens) == (1, 500 - kept_tokens)
+
+
+def test_sources_without_scores_are_valued_by_rank():
+    sources = [_source("a", 10, None), _source("b", 10, None), _source("c", 10, None), _source("d", 10, None)]
+
+    np.testing.assert_allclose(context_packing._source_utilities(sources), [1.0, 0.75, 0.5, 0.25])
+
+
+def test_equal_scores_are_equally_useful():
+    sources = [_source("a", 10, 0.3), _source("b", 10, 0.3)]
+
+    np.testing.assert_allclose(context_packing._source_utilities(sources), [1.0, 1.0])
+
+
+def test_pack_without_sources():
+    packed = _pack([], token_budget=100)
+
+    assert packed.sources == [] and packed.num_tokens == 0
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+import src.libs.search.search_agent.deadline as deadlines
+
+
+@pytest.fixture
+def clock(monkeypatch) -> list[float]:
+    now = [100.0]
+    monkeypatch.setattr(deadlines.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_remaining(clock):
+    deadline = deadlines.Deadline.after(10)
+    clock[0] += 4
+
+    assert deadline.remaining() == 6
+    assert deadline.remaining(reserve=5) == 1
+    assert deadline.remaining(reserve=8) == 0
+
+
+def test_has_time_for(clock):
+    deadline = deadlines.Deadline.after(10)
+
+    assert deadline.has_time_for(2, reserve=8)
+    assert not deadline.has_time_for(2.5, reserve=8)
+    clock[0] += 11
+    assert not deadline.has_time_for(0.1)
+
+
+def test_run_returns_the_result_of_the_stage():
+    async def stage() -> str:
+        await asyncio.sleep(0)
+        return "answer"
+
+    assert asyncio.run(deadlines.Deadline.after(10).run(stage())) == "answer"
+
+
+def test_run_cancels_a_stage_that_runs_out_of_time():
+    cancelled = []
+
+    async def slow_stage():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await deadlines.Deadline.after(10.05).run(slow_stage(), reserve=10)
+
+    asyncio.run(run())
+    assert cancelled == [True]
+
+
+def test_run_within_without_deadline_has_no_time_limit():
+    async def stage() -> int:
+        await asyncio.sleep(0.01)
+        return 1
+
+    assert asyncio.run(deadlines.run_within(None, stage(), reserve=100)) == 1
+
+
+def test_run_within_a_passed_deadline_times_out():
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await deadlines.run_within(deadlines.Deadline.after(-1), asyncio.sleep(1))
+
+    asyncio.run(run())
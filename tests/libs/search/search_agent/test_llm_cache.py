@@ -0,0 +1,105 @@
+import langchain.chat_models
+import langchain.schema
+import pytest
+
+import src.libs.search.search_agent.llm_cache as llm_cache
+
+
+MESSAGES = [
+    langchain.schema.SystemMessage(content="Answer questions about BU."),
+    langchain.schema.HumanMessage(content="Where is Mugar library?"),
+]
+
+
+def _llm(**kwargs) -> langchain.chat_models.ChatOpenAI:
+    return langchain.chat_models.ChatOpenAI(**{
+        "openai_api_key": "test", "model_name": "gpt-3.5-turbo", "temperature": 0, **kwargs
+    })
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    fake_clock = FakeClock()
+    monkeypatch.setattr(llm_cache.time, "time", fake_clock)
+    return fake_clock
+
+
+def test_key_is_stable():
+    assert llm_cache.LLMResponseCache.build_key(_llm(), MESSAGES) == llm_cache.LLMResponseCache.build_key(_llm(), MESSAGES)
+
+
+@pytest.mark.parametrize("llm, messages, kwargs", [
+    (_llm(model_name="gpt-4"), MESSAGES, {}),
+    (_llm(max_tokens=10), MESSAGES, {}),
+    (_llm(), MESSAGES[1:], {}),
+    (_llm(), MESSAGES, {"functions": [{"name": "search", "parameters": {}}]}),
+])
+def test_key_depends_on_what_determines_the_response(llm, messages, kwargs):
+    assert llm_cache.LLMResponseCache.build_key(llm, messages, **kwargs) != \
+           llm_cache.LLMResponseCache.build_key(_llm(), MESSAGES)
+
+
+def test_key_ignores_callbacks_and_timeout():
+    assert llm_cache.LLMResponseCache.build_key(_llm(), MESSAGES, callbacks=[object()], request_timeout=5) == \
+           llm_cache.LLMResponseCache.build_key(_llm(), MESSAGES)
+
+
+def test_only_deterministic_llms_are_cacheable():
+    assert llm_cache.LLMResponseCache.is_cacheable(_llm())
+    assert not llm_cache.LLMResponseCache.is_cacheable(_llm().copy(update={"temperature": 0.7}))
+
+
+def test_get_returns_the_cached_response(tmp_path, clock):
+    cache = llm_cache.LLMResponseCache(path=str(tmp_path / "cache.db"))
+    response = langchain.schema.AIMessage(
+        content="", additional_kwargs={"function_call": {"name": "search", "arguments": "{}"}}
+    )
+
+    assert cache.get("key") is None
+    cache.set("key", response)
+
+    assert cache.get("key") == response
+    assert cache.stats() == {"num_entries": 1, "num_hits": 1, "num_misses": 1}
+
+
+def test_responses_expire_after_the_ttl(tmp_path, clock):
+    cache = llm_cache.LLMResponseCache(path=str(tmp_path / "cache.db"), ttl_seconds=60)
+    cache.set("key", langchain.schema.AIMessage(content="Mugar is on Commonwealth Avenue"))
+
+    clock.now += 59
+    assert cache.get("key") is not None
+    clock.now += 2
+    assert cache.get("key") is None
+
+    # Expired responses are deleted when the next response is cached
+    cache.set("other key", langchain.schema.AIMessage(content="other"))
+    assert len(cache) == 1
+
+
+def test_least_recently_used_responses_are_evicted(tmp_path, clock):
+    cache = llm_cache.LLMResponseCache(path=str(tmp_path / "cache.db"), max_entries=2)
+    for key in ("a", "b"):
+        cache.set(key, langchain.schema.AIMessage(content=key))
+        clock.now += 1
+    cache.get("a")
+    clock.now += 1
+
+    cache.set("c", langchain.schema.AIMessage(content="c"))
+
+    assert cache.get("b") is None
+    assert [cache.get(key).content for key in ("a", "c")] == ["a", "c"]
+
+
+def test_responses_are_persisted(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    llm_cache.LLMResponseCache(path=path).set("key", langchain.schema.AIMessage(content="cached"))
+
+    assert llm_cache.LLMResponseCache(path=path).get("key").content == "cached"
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+import src.libs.search.search_agent.llm_governor as llm_governor
+
+
+class Requests:
+    """LLM requests holding their slot until released, recording the order they got it in"""
+    def __init__(self, governor: llm_governor.LLMGovernor):
+        self.governor = governor
+        self.served: list[str] = []
+        self.release = asyncio.Event()
+
+    async def request(self, name: str, user_id: str, priority: llm_governor.Priority):
+        with llm_governor.request_context(user_id=user_id, priority=priority):
+            async with self.governor.slot():
+                self.served.append(name)
+                await self.release.wait()
+
+    def start(self, name: str, user_id: str = "user", priority=llm_governor.Priority.INTERACTIVE) -> asyncio.Task:
+        return asyncio.create_task(self.request(name, user_id, priority))
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_requests_over_the_cap_wait_for_a_slot():
+    async def run():
+        governor = llm_governor.LLMGovernor(max_in_flight=2)
+        requests = Requests(governor)
+        tasks = [requests.start(f"request {i}") for i in range(3)]
+        await _settle()
+
+        assert (governor.num_in_flight, governor.num_waiting, len(requests.served)) == (2, 1, 2)
+
+        requests.release.set()
+        await asyncio.gather(*tasks)
+
+        assert len(requests.served) == 3
+        assert (governor.num_in_flight, governor.num_waiting) == (0, 0)
+        assert governor.stats()["waits"]["interactive"]["num_queued"] == 1
+
+    asyncio.run(run())
+
+
+def test_interactive_requests_are_served_before_batch_requests():
+    async def run():
+        governor = llm_governor.LLMGovernor(max_in_flight=1)
+        requests = Requests(governor)
+        tasks = [requests.start("running", priority=llm_governor.Priority.BATCH)]
+        await _settle()
+        tasks.append(requests.start("batch", user_id="script", priority=llm_governor.Priority.BATCH))
+        await _settle()
+        tasks.append(requests.start("interactive", user_id="student", priority=llm_governor.Priority.INTERACTIVE))
+        await _settle()
+
+        requests.release.set()
+        await asyncio.gather(*tasks)
+
+        assert requests.served == ["running", "interactive", "batch"]
+
+    asyncio.run(run())
+
+
+def test_waiting_users_are_served_round_robin():
+    async def run():
+        governor = llm_governor.LLMGovernor(max_in_flight=1)
+        requests = Requests(governor)
+        tasks = [requests.start("running")]
+        await _settle()
+        # The first user's question fans out into three requests before the second user asks anything
+        tasks += [requests.start(f"a{i}", user_id="a") for i in range(3)]
+        tasks += [requests.start(f"b{i}", user_id="b") for i in range(2)]
+        await _settle()
+
+        requests.release.set()
+        await asyncio.gather(*tasks)
+
+        assert requests.served == ["running", "a0", "b0", "a1", "b1", "a2"]
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def run():
+        governor = llm_governor.LLMGovernor(max_in_flight=1)
+        requests = Requests(governor)
+        running = requests.start("running")
+        await _settle()
+        cancelled = requests.start("cancelled")
+        await _settle()
+        assert governor.num_waiting == 1
+
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert (governor.num_in_flight, governor.num_waiting) == (1, 0)
+
+        requests.release.set()
+        await running
+        assert governor.num_in_flight == 0
+
+        # The slot is free again, the next request doesn't queue
+        await requests.request("next", user_id="user", priority=llm_governor.Priority.INTERACTIVE)
+        assert requests.served == ["running", "next"]
+        assert governor.num_in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_waiter_cancelled_as_the_slot_is_handed_over_passes_it_on():
+    async def run():
+        governor = llm_governor.LLMGovernor(max_in_flight=1)
+        requests = Requests(governor)
+        requests.release.set()
+        async with governor.slot():
+            cancelled = requests.start("cancelled")
+            waiting = requests.start("waiting")
+            await _settle()
+        # Leaving the block handed the slot over to the first waiter, which is cancelled before it gets to run
+        cancelled.cancel()
+        await asyncio.gather(cancelled, waiting, return_exceptions=True)
+
+        assert requests.served == ["waiting"]
+        assert (governor.num_in_flight, governor.num_waiting) == (0, 0)
+
+    asyncio.run(run())
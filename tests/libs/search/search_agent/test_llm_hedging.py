@@ -0,0 +1,125 @@
+import asyncio
+
+import langchain.chat_models
+import langchain.schema
+import pytest
+
+import src.libs.search.search_agent.llm_hedging as llm_hedging
+
+
+KEY = ("gpt-3.5-turbo", 10)
+
+
+class Call:
+    """LLM call whose n-th attempt takes durations[n] seconds, recording which attempts were cancelled"""
+    def __init__(self, *durations: float, error: Exception | None = None):
+        self._durations = durations
+        self._error = error
+        self.num_attempts = 0
+        self.cancelled_attempts = []
+
+    async def __call__(self) -> int:
+        attempt = self.num_attempts
+        self.num_attempts += 1
+        try:
+            await asyncio.sleep(self._durations[attempt])
+        except asyncio.CancelledError:
+            self.cancelled_attempts.append(attempt)
+            raise
+        if self._error:
+            raise self._error
+        return attempt
+
+
+def _policy_with_latencies(latency: float = 0.01, max_hedge_rate: float = 1.0) -> llm_hedging.HedgingPolicy:
+    policy = llm_hedging.HedgingPolicy(max_hedge_rate=max_hedge_rate)
+    for _ in range(llm_hedging.MIN_LATENCY_SAMPLES):
+        policy._record_latency(KEY, latency)
+    return policy
+
+
+def test_key_buckets_prompts_by_size():
+    llm = langchain.chat_models.ChatOpenAI(openai_api_key="test", model_name="gpt-3.5-turbo")
+
+    def key(prompt_size: int) -> tuple:
+        return llm_hedging.HedgingPolicy.build_key(llm, [langchain.schema.HumanMessage(content="x" * prompt_size)])
+
+    assert key(1100) == key(1500) == ("gpt-3.5-turbo", 10)
+    assert key(2100) != key(1500)
+
+
+def test_no_hedge_delay_before_enough_samples():
+    policy = llm_hedging.HedgingPolicy()
+    for _ in range(llm_hedging.MIN_LATENCY_SAMPLES - 1):
+        policy._record_latency(KEY, 1.0)
+
+    assert policy.hedge_delay(KEY) is None
+    policy._record_latency(KEY, 1.0)
+    assert policy.hedge_delay(KEY) == 1.0
+
+
+def test_hedge_delay_is_the_p90_latency():
+    policy = llm_hedging.HedgingPolicy()
+    for latency in range(1, 101):
+        policy._record_latency(KEY, float(latency))
+
+    assert policy.hedge_delay(KEY) == pytest.approx(90.1)
+
+
+def test_fast_call_is_not_hedged():
+    policy = _policy_with_latencies(latency=1.0)
+    call = Call(0.0)
+
+    assert asyncio.run(policy.run(KEY, call)) == 0
+    assert call.num_attempts == 1 and policy.num_hedges_fired == 0
+
+
+def test_slow_call_is_hedged_and_the_first_response_wins():
+    policy = _policy_with_latencies()
+    call = Call(10.0, 0.0)
+
+    assert asyncio.run(policy.run(KEY, call)) == 1
+    assert call.cancelled_attempts == [0]
+    assert (policy.num_hedges_fired, policy.num_hedges_won) == (1, 1)
+
+
+def test_hedges_are_capped_by_the_hedge_rate():
+    policy = _policy_with_latencies(max_hedge_rate=0.5)
+
+    async def run():
+        return [await policy.run(KEY, Call(0.05, 0.0)) for _ in range(4)]
+
+    # A call is only hedged while less than half of the recent calls were: the 2nd and 3rd calls are made at a
+    # hedge rate of 1/1 and 1/2
+    assert asyncio.run(run()) == [1, 0, 0, 1]
+    assert (policy.num_hedges_fired, policy.num_hedges_rate_limited) == (2, 2)
+    assert policy.stats()["recent_hedge_rate"] == 0.5
+
+
+def test_may_hedge_can_prevent_the_hedge():
+    policy = _policy_with_latencies()
+    call = Call(0.05, 0.0)
+
+    assert asyncio.run(policy.run(KEY, call, may_hedge=lambda: False)) == 0
+    assert call.num_attempts == 1
+
+
+def test_failed_hedge_falls_back_to_the_call():
+    policy = _policy_with_latencies()
+
+    class FailingHedgeCall(Call):
+        async def __call__(self) -> int:
+            if self.num_attempts == 1:
+                self.num_attempts += 1
+                raise RuntimeError("rate limited")
+            return await super().__call__()
+
+    assert asyncio.run(policy.run(KEY, FailingHedgeCall(0.05))) == 0
+    assert policy.num_hedges_won == 0
+
+
+def test_call_and_hedge_failing_raises():
+    policy = _policy_with_latencies()
+
+    with pytest.raises(RuntimeError, match="server error"):
+        asyncio.run(policy.run(KEY, Call(0.05, 0.05, error=RuntimeError("server error"))))
@@ -0,0 +1,72 @@
+import src.libs.search.search_agent.source_aggregation as source_aggregation
+from src.libs.search.search_data_classes import SearchResult
+
+
+URL = "https://www.bu.edu/admissions"
+
+
+def _chunk(index: int | None, text: str, score: float | None = None, url: str = URL, num_tokens: int | None = 10):
+    return SearchResult(text=text, url=url, score=score, index=index, num_tokens=num_tokens)
+
+
+def test_join_overlapping_removes_the_overlap():
+    overlap = "applications are due on January 5th."
+
+    joined = source_aggregation._join_overlapping(f"First year {overlap}", f"{overlap} Transfer applications")
+
+    assert joined == f"First year {overlap} Transfer applications"
+
+
+def test_join_overlapping_prefers_the_longest_overlap():
+    text = "deadline deadline deadline deadline deadline"
+
+    assert source_aggregation._join_overlapping(text, text + " extended") == text + " extended"
+
+
+def test_join_overlapping_ignores_short_overlaps():
+    text, next_text = "Apply by the deadline.", ". Then wait for a decision"
+
+    assert source_aggregation._join_overlapping(text, next_text) == text + source_aggregation.CHUNK_SEPARATOR + next_text
+
+
+def test_aggregator_keeps_first_position_and_best_score():
+    aggregator = source_aggregation.SourceAggregator()
+    aggregator.add([_chunk(1, "one", score=0.2), _chunk(2, "two", score=0.5)])
+    aggregator.add([_chunk(2, "two", score=0.4), _chunk(1, "one", score=0.9), _chunk(None, "faq", url="")])
+
+    assert [(source.index, source.score) for source in aggregator.sources] == [(1, 0.9), (2, 0.5), (None, None)]
+    assert len(aggregator) == 3
+
+
+def test_sources_without_index_are_identified_by_text():
+    aggregator = source_aggregation.SourceAggregator()
+    aggregator.add([_chunk(None, "a"), _chunk(None, "b"), _chunk(None, "a")])
+
+    assert [source.text for source in aggregator.sources] == ["a", "b"]
+
+
+def test_merge_adjacent_chunks():
+    overlap = "x" * source_aggregation.MIN_CHUNK_OVERLAP
+    sources = [
+        _chunk(5, "other page", score=0.9, url="https://www.bu.edu/other"),
+        _chunk(3, f"three {overlap}", score=0.6),
+        _chunk(2, "two", score=0.8),
+        _chunk(7, "seven", score=0.3),
+        _chunk(4, f"{overlap} four", score=0.1),
+    ]
+
+    merged = source_aggregation.merge_adjacent_chunks(sources)
+
+    # Chunks 2 to 4 are merged at the rank of chunk 2, chunk 7 isn't adjacent to them
+    assert [(source.url, source.index) for source in merged] == [
+        ("https://www.bu.edu/other", 5), (URL, 2), (URL, 7)
+    ]
+    assert merged[1].text == f"two{source_aggregation.CHUNK_SEPARATOR}three {overlap} four"
+    assert merged[1].score == 0.8
+    assert merged[1].num_tokens == 3 * 10 + 2
+
+
+def test_merged_token_count_is_unknown_when_a_chunk_count_is():
+    merged = source_aggregation.merge_adjacent_chunks([_chunk(1, "one"), _chunk(2, "two", num_tokens=None)])
+
+    assert len(merged) == 1 and merged[0].num_tokens is None
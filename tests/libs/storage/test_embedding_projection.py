@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import src.libs.storage.embedding_projection as embedding_projection
+
+
+def _low_rank_vectors(num_vectors: int = 500, input_dim: int = 32, rank: int = 4, seed: int = 0) -> np.ndarray:
+    """Vectors that only vary along rank directions, around a non-zero mean"""
+    rng = np.random.default_rng(seed)
+    basis = np.linalg.qr(rng.normal(size=(input_dim, rank)))[0].T
+    return 3.0 + rng.normal(size=(num_vectors, rank)) @ basis
+
+
+@pytest.mark.parametrize("method", ["pca", "random"])
+def test_projected_vectors_are_unit_vectors(method):
+    vectors = _low_rank_vectors()
+    projection = embedding_projection.EmbeddingProjection.fit(vectors, output_dim=8, method=method)
+
+    projected = projection.project(vectors)
+
+    assert projected.shape == (500, 8)
+    assert (projection.input_dim, projection.output_dim) == (32, 8)
+    np.testing.assert_allclose(np.linalg.norm(projected, axis=1), 1.0, rtol=1e-5)
+
+
+@pytest.mark.parametrize("method", ["pca", "random"])
+def test_components_are_orthonormal(method):
+    projection = embedding_projection.EmbeddingProjection.fit(_low_rank_vectors(), output_dim=8, method=method)
+
+    components = projection._components
+    np.testing.assert_allclose(components @ components.T, np.eye(8), atol=1e-5)
+
+
+def test_pca_preserves_similarities_of_low_rank_vectors():
+    vectors = _low_rank_vectors()
+    projection = embedding_projection.EmbeddingProjection.fit(vectors, output_dim=4)
+
+    centered = vectors - vectors.mean(axis=0)
+    centered /= np.linalg.norm(centered, axis=1, keepdims=True)
+    projected = projection.project(vectors)
+
+    np.testing.assert_allclose(projected @ projected.T, centered @ centered.T, atol=1e-4)
+
+
+def test_fit_is_deterministic():
+    vectors = _low_rank_vectors()
+
+    first = embedding_projection.EmbeddingProjection.fit(vectors, output_dim=8, method="random", seed=1)
+    second = embedding_projection.EmbeddingProjection.fit(vectors, output_dim=8, method="random", seed=1)
+
+    np.testing.assert_array_equal(first.project(vectors), second.project(vectors))
+
+
+def test_project_handles_vectors_at_the_mean():
+    vectors = _low_rank_vectors()
+    projection = embedding_projection.EmbeddingProjection.fit(vectors, output_dim=4)
+
+    projected = projection.project(vectors.mean(axis=0, keepdims=True))
+
+    assert np.all(np.isfinite(projected))
+
+
+def test_save_and_load(tmp_path):
+    vectors = _low_rank_vectors()
+    projection = embedding_projection.EmbeddingProjection.fit(vectors, output_dim=8)
+    path = str(tmp_path / "projection.npz")
+    projection.save(path)
+
+    loaded_projection = embedding_projection.EmbeddingProjection.load(path)
+
+    np.testing.assert_array_equal(loaded_projection.project(vectors), projection.project(vectors))
@@ -0,0 +1,193 @@
+import asyncio
+
+import pytest
+
+import src.services.chatbot.backend_control.single_flight as single_flight
+
+
+class Job:
+    """Execution that returns its number of calls once released"""
+    def __init__(self, error: Exception | None = None):
+        self.num_calls = 0
+        self.release = asyncio.Event()
+        self._error = error
+
+    async def __call__(self) -> int:
+        self.num_calls += 1
+        await self.release.wait()
+        if self._error:
+            raise self._error
+        return self.num_calls
+
+
+async def _wait_until_started(job: Job):
+    while job.num_calls == 0:
+        await asyncio.sleep(0)
+
+
+def test_concurrent_calls_share_one_execution():
+    async def run():
+        jobs = single_flight.SingleFlight()
+        job = Job()
+        callers = [asyncio.create_task(jobs.do(key="question", execute=job)) for _ in range(3)]
+        await _wait_until_started(job)
+        assert len(jobs) == 1
+        job.release.set()
+
+        assert await asyncio.gather(*callers) == [1, 1, 1]
+        assert (job.num_calls, jobs.num_executions, jobs.num_coalesced, len(jobs)) == (1, 1, 2, 0)
+
+    asyncio.run(run())
+
+
+def test_different_keys_run_separately():
+    async def run():
+        jobs = single_flight.SingleFlight()
+        first_job, second_job = Job(), Job()
+        first_job.release.set()
+        second_job.release.set()
+
+        await asyncio.gather(jobs.do(key="a", execute=first_job), jobs.do(key="b", execute=second_job))
+
+        assert (first_job.num_calls, second_job.num_calls, jobs.num_coalesced) == (1, 1, 0)
+
+    asyncio.run(run())
+
+
+def test_results_are_not_cached():
+    async def run():
+        jobs = single_flight.SingleFlight()
+        job = Job()
+        job.release.set()
+
+        assert [await jobs.do(key="question", execute=job) for _ in range(2)] == [1, 2]
+
+    asyncio.run(run())
+
+
+def test_exception_is_raised_to_every_caller():
+    async def run():
+        jobs = single_flight.SingleFlight()
+        job = Job(error=ValueError("search failed"))
+        callers = [asyncio.create_task(jobs.do(key="question", execute=job)) for _ in range(2)]
+        await _wait_until_started(job)
+        job.release.set()
+
+        results = await asyncio.gather(*callers, return_exceptions=True)
+
+        assert [type(result) for result in results] == [ValueError, ValueError]
+        assert len(jobs) == 0
+
+    asyncio.run(run())
+
+
+def test_cancelled_caller_does_not_cancel_the_execution():
+    async def run():
+        jobs = single_flight.SingleFlight()
+        job = Job()
+        first_caller = asyncio.create_task(jobs.do(key="question", execute=job))
+        second_caller = asyncio.create_task(jobs.do(key="question", execute=job))
+        await _wait_until_started(job)
+
+        first_caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first_caller
+        job.release.set()
+
+        assert await second_caller == 1
+
+    asyncio.run(run())
+
+
+class Stream:
+    """Stream emitting the items put on it until it is closed, or failing with its error"""
+    def __init__(self):
+        self.num_calls = 0
+        self.cancelled = False
+        self.items: asyncio.Queue = asyncio.Queue()
+
+    async def __call__(self):
+        self.num_calls += 1
+        try:
+            while (item := await self.items.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+async def _collect(streams: single_flight.SingleFlightStream, stream: Stream, received: list | None = None) -> list:
+    received = [] if received is None else received
+    async for item in streams.subscribe(key="question", execute=stream):
+        received.append(item)
+    return received
+
+
+def test_concurrent_subscribers_share_one_stream():
+    async def run():
+        streams = single_flight.SingleFlightStream()
+        stream = Stream()
+        first_received = []
+        first_subscriber = asyncio.create_task(_collect(streams, stream, first_received))
+        stream.items.put_nowait("plan")
+        stream.items.put_nowait("token")
+        while len(first_received) < 2:
+            await asyncio.sleep(0)
+
+        # Joins late, gets the items emitted so far first
+        second_subscriber = asyncio.create_task(_collect(streams, stream))
+        await asyncio.sleep(0)
+        stream.items.put_nowait("answer")
+        stream.items.put_nowait(None)
+
+        assert await asyncio.gather(first_subscriber, second_subscriber) == [["plan", "token", "answer"]] * 2
+        assert (stream.num_calls, streams.num_executions, streams.num_coalesced, len(streams)) == (1, 1, 1, 0)
+
+    asyncio.run(run())
+
+
+def test_stream_exception_is_raised_to_every_subscriber_after_its_items():
+    async def run():
+        streams = single_flight.SingleFlightStream()
+        stream = Stream()
+        received = [[], []]
+        subscribers = [asyncio.create_task(_collect(streams, stream, items)) for items in received]
+        stream.items.put_nowait("plan")
+        stream.items.put_nowait(ValueError("search failed"))
+
+        results = await asyncio.gather(*subscribers, return_exceptions=True)
+
+        assert [type(result) for result in results] == [ValueError, ValueError]
+        assert received == [["plan"], ["plan"]]
+        assert len(streams) == 0
+
+    asyncio.run(run())
+
+
+def test_stream_is_stopped_once_its_last_subscriber_leaves():
+    async def run():
+        streams = single_flight.SingleFlightStream()
+        stream = Stream()
+        subscribers = [asyncio.create_task(_collect(streams, stream)) for _ in range(2)]
+        while stream.num_calls == 0:
+            await asyncio.sleep(0)
+
+        subscribers[0].cancel()
+        await asyncio.sleep(0)
+        assert not stream.cancelled
+
+        subscribers[1].cancel()
+        await asyncio.gather(*subscribers, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert stream.cancelled
+        assert len(streams) == 0
+
+        # The next subscriber starts a new stream
+        next_stream = Stream()
+        next_stream.items.put_nowait(None)
+        assert await _collect(streams, next_stream) == []
+        assert next_stream.num_calls == 1
+
+    asyncio.run(run())